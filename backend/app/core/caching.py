@@ -0,0 +1,48 @@
+"""
+HTTP caching for read endpoints: strong ETags derived from the shared data
+version (app.services.data_version, the same in every worker) plus the
+request params, 304 answers to a matching If-None-Match, and Cache-Control
+that follows the refresh cadence (data moves twice a day, every 30 minutes
+near a deadline).
+"""
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import Request, Response
+
+from app.services import serving_cache
+
+API_MAX_AGE_S = int(os.getenv("API_MAX_AGE_S", "60"))
+API_SWR_S = int(os.getenv("API_SWR_S", "1800"))  # serve stale while revalidating, up to one burst interval
+
+
+def etag_for(endpoint: str, *params) -> str:
+    raw = "|".join([serving_cache.version(), endpoint, *map(repr, params)])
+    return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
+
+
+def cache_control(max_age: int = API_MAX_AGE_S, swr: int = API_SWR_S) -> str:
+    return f"public, max-age={max_age}, stale-while-revalidate={swr}"
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # If-None-Match uses weak comparison
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+
+def conditional(request: Request, response: Response, endpoint: str, *params) -> Optional[Response]:
+    """
+    Put the ETag and Cache-Control headers on `response`. Returns a 304 to send
+    instead when the client's copy is current. Call it before computing the
+    payload, so the ETag never names newer data than the body holds.
+    """
+    etag = etag_for(endpoint, *params)
+    headers = {"ETag": etag, "Cache-Control": cache_control()}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
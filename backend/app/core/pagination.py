@@ -0,0 +1,83 @@
+"""
+Keyset (cursor) pagination and column projection for list endpoints.
+
+A page is ordered by a unique key, and the cursor is the key of the last row
+sent, encoded as opaque URL-safe base64. The next page starts strictly after
+it, so pages never skip or repeat rows, and each page costs an index seek
+whatever its depth (unlike OFFSET). The endpoint sends the list as the body
+and the next cursor in the X-Next-Cursor header, so the response shape stays
+a plain list. `fields=` limits the columns the database reads and the
+payload carries; `projected_model` documents such rows in OpenAPI.
+"""
+import base64
+import binascii
+import json
+from typing import List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel, create_model
+from sqlalchemy import Table
+
+from app.core.responses import dumps
+
+MAX_PAGE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence[str], nullable: Sequence[str] = ()) -> list:
+    """
+    The values of `keys` in `cursor`; 400 if it is not one of ours. Only the
+    keys in `nullable` may be null (a null compared with > matches nothing).
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (not isinstance(values, list) or len(values) != len(keys)
+            or not all(type(v) is int or (v is None and k in nullable) for k, v in zip(keys, values))):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def projection(table: Table, fields: Optional[str], keys: Sequence[str]) -> Tuple[List[str], list]:
+    """
+    Parse `fields` ("web_name,now_cost") against `table`'s columns. Returns
+    the names to send (every column when `fields` is empty) and the columns
+    to select: those plus the key columns the cursor needs.
+    """
+    if not fields:
+        names = [c.name for c in table.c]
+    else:
+        names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+        unknown = [f for f in names if f not in table.c]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    cols = [table.c[name] for name in dict.fromkeys([*names, *keys])]
+    return names, cols
+
+
+def projected_model(model: type, name: str) -> type:
+    """
+    Response model for rows of `model` under `fields=`: the same fields, all
+    optional, since a projected row carries only the ones asked for.
+    """
+    fields = {f: (Optional[info.annotation], None) for f, info in model.model_fields.items()}
+    return create_model(name, __base__=BaseModel, **fields)
+
+
+def keyset_page(rows, names: Sequence[str], keys: Sequence[str], limit: int) -> Tuple[bytes, Optional[str]]:
+    """
+    Encode a page from rows fetched with LIMIT limit + 1 (the extra row only
+    tells whether there is a next page). Returns (JSON body, next cursor or None).
+    """
+    rows = [row._mapping for row in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*(rows[-1][k] for k in keys))
+    return dumps([{name: row[name] for name in names} for row in rows]), next_cursor
@@ -0,0 +1,49 @@
+"""
+JSON encoding for API responses.
+
+`dumps` encodes with orjson (several times faster than the stdlib encoder,
+compact output, native datetime support) and falls back to `json` when orjson
+is not installed. FastJSONResponse is the app's default response class. Hot
+endpoints go further: they keep the encoded bytes in the serving cache and
+return them with `json_response`, so a repeat request is a memory copy.
+"""
+import json
+from decimal import Decimal
+from typing import Any, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # stdlib encoder, same JSON
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(body: bytes, headers_from: Optional[Response] = None) -> Response:
+    """Send already encoded JSON, keeping headers (ETag, Cache-Control) set on the injected Response."""
+    headers = None
+    if headers_from is not None:
+        headers = {k: v for k, v in headers_from.headers.items() if k not in ("content-length", "content-type")}
+    return Response(content=body, media_type="application/json", headers=headers)
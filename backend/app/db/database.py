@@ -69,7 +69,7 @@ def get_table_counts() -> dict:
     """
     tables = [
         'teams', 'players', 'fixtures', 'player_gameweek_stats',
-        'match_statistics', 'player_match_stats', 'match_odds',
+        'match_statistics', 'player_match_stats', 'match_odds', 'match_odds_latest',
         'team_feature_ratings', 'player_feature_ratings'
     ]
     
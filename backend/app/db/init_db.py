@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel
 from app.db.session import engine
 
@@ -6,6 +7,18 @@ from app.models.team import Team  # noqa
 from app.models.player import Player  # noqa
 from app.models.fixture import Fixture  # noqa
 from app.models.ep import EPRecord  # noqa
+from app.services.ep_prefix import EPPrefix  # noqa
+from app.services.data_version import DataVersion  # noqa
+from app.services.ep_calculator import ensure_ep_indexes
+
+# keyset pagination order of /players (per team) and /fixtures
+LIST_INDEXES = (
+    Index("ix_player_team_element", Player.__table__.c.team_id, Player.__table__.c.fpl_element_id),
+    Index("ix_fixture_event_id", Fixture.__table__.c.event, Fixture.__table__.c.id),
+)
 
 def init_db():
     SQLModel.metadata.create_all(bind=engine)
+    ensure_ep_indexes(engine)
+    for ix in LIST_INDEXES:
+        ix.create(engine, checkfirst=True)
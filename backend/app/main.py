@@ -1,10 +1,11 @@
 from fastapi import FastAPI
 from app.core.logging import logger
+from app.core.responses import FastJSONResponse
 from app.db.init_db import init_db
 from app.routers import health, telegram, admin, players, fixtures, ep, optimize
 from app.services.scheduler import start_scheduler
 
-app = FastAPI(title="FPL AI Backend", version="0.2.0")
+app = FastAPI(title="FPL AI Backend", version="0.2.0", default_response_class=FastJSONResponse)
 
 @app.on_event("startup")
 def on_startup():
@@ -1,7 +1,7 @@
 """
 SQLAlchemy models for FPL Assistant database
 """
-from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, Date, Text, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, Date, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -312,7 +312,8 @@ class MatchOdds(Base):
     home_lambda = Column(Numeric(5, 3))
     away_lambda = Column(Numeric(5, 3))
     
-    # Timing
+    # Timing: rows are only written when prices move (see app/services/odds_store.py),
+    # so snapshot_time is when this line became valid
     snapshot_time = Column(DateTime, default=func.now())
     is_closing_odds = Column(Boolean, default=False)
     
@@ -320,6 +321,43 @@ class MatchOdds(Base):
     
     # Relationships
     fixture = relationship("Fixture", back_populates="match_odds")
+    
+    __table_args__ = (
+        Index("ix_match_odds_event_bookmaker_time", "event_id", "bookmaker", "snapshot_time"),
+    )
+
+class MatchOddsLatest(Base):
+    """Current line per (event, bookmaker), maintained alongside the match_odds history"""
+    __tablename__ = "match_odds_latest"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    fixture_id = Column(Integer, ForeignKey("fixtures.id"), index=True)
+    event_id = Column(String, nullable=False)
+    bookmaker = Column(String, nullable=False)
+    commence_time = Column(DateTime)
+    
+    home_win = Column(Numeric(6, 2))
+    draw = Column(Numeric(6, 2))
+    away_win = Column(Numeric(6, 2))
+    over_2_5 = Column(Numeric(6, 2))
+    under_2_5 = Column(Numeric(6, 2))
+    over_1_5 = Column(Numeric(6, 2))
+    under_1_5 = Column(Numeric(6, 2))
+    btts_yes = Column(Numeric(6, 2))
+    btts_no = Column(Numeric(6, 2))
+    
+    prob_home = Column(Numeric(5, 4))
+    prob_away = Column(Numeric(5, 4))
+    prob_draw = Column(Numeric(5, 4))
+    home_lambda = Column(Numeric(5, 3))
+    away_lambda = Column(Numeric(5, 3))
+    
+    valid_from = Column(DateTime, nullable=False)  # first refresh that saw these prices
+    checked_at = Column(DateTime, nullable=False)  # last refresh that confirmed them
+    
+    __table_args__ = (
+        UniqueConstraint("event_id", "bookmaker", name="unique_latest_event_bookmaker"),
+    )
 
 class PlayerInjury(Base):
     __tablename__ = "player_injuries"
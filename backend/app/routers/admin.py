@@ -1,28 +1,56 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlmodel import Session
 from app.db.session import get_session
+from app.services import jobs, serving_cache
 from app.services.data.fpl_client import ingest_bootstrap, ingest_fixtures
 from app.services.ep_calculator import recompute_ep_range
+from app.services.scheduler import run_refresh_all
+from app.services.warmup import warm_serving_cache
 
 router = APIRouter()
 
+def _bootstrap_summary(stats: dict) -> dict:
+    # "players"/"teams" stay the number of rows processed; the per-table breakdown goes under "stats"
+    return {"players": sum(stats["players"].values()), "teams": sum(stats["teams"].values()), "stats": stats}
+
 @router.post("/ingest/fpl")
 def ingest_fpl(session: Session = Depends(get_session)):
     stats = ingest_bootstrap(session)
-    return {"msg": "ok", "players": stats.get("players", 0), "teams": stats.get("teams", 0)}
+    return {"msg": "ok", **_bootstrap_summary(stats)}
 
 @router.post("/ingest/fixtures")
 def ingest_fix(session: Session = Depends(get_session)):
-    n = ingest_fixtures(session)
-    return {"msg": "ok", "fixtures": n}
+    stats = ingest_fixtures(session)
+    return {"msg": "ok", "fixtures": stats}
 
 @router.post("/ingest/all")
 def ingest_all(session: Session = Depends(get_session)):
     s1 = ingest_bootstrap(session)
-    n = ingest_fixtures(session)
-    return {"msg": "ok", "players": s1.get("players",0), "teams": s1.get("teams",0), "fixtures": n}
+    fx = ingest_fixtures(session)
+    return {"msg": "ok", **_bootstrap_summary(s1), "fixtures": fx}
 
 @router.post("/ep/recompute")
-def ep_recompute(start_gw: int = 1, end_gw: int = 6, session: Session = Depends(get_session)):
+def ep_recompute(background_tasks: BackgroundTasks, start_gw: int = 1, end_gw: int = 6, session: Session = Depends(get_session)):
     total = recompute_ep_range(session, start_gw, end_gw)
+    background_tasks.add_task(warm_serving_cache, start_gw, end_gw)
     return {"msg": "ok", "records": total}
+
+@router.post("/refresh")
+def refresh():
+    job, _ = jobs.submit("refresh_all", run_refresh_all)
+    return {"msg": "queued", "job_id": job.id}
+
+@router.get("/jobs")
+def list_jobs():
+    return jobs.list_jobs()
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/cache")
+def cache_stats():
+    return serving_cache.stats()
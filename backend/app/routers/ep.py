@@ -1,28 +1,32 @@
-from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Request, Response
+from sqlmodel import Session
+from app.core.caching import conditional
+from app.core.responses import dumps, json_response
 from app.db.session import get_session
-from app.models.ep import EPRecord
-from app.models.player import Player
+from app.services import serving_cache
+from app.services.ep_calculator import top_ep
 
 router = APIRouter()
 
 @router.get("/ep/top")
-def ep_top(gw: int, pos: int | None = None, limit: int = 20, session: Session = Depends(get_session)):
-    stmt = select(EPRecord, Player).where(EPRecord.gw == gw).join(Player, Player.fpl_element_id == EPRecord.fpl_element_id)
-    if pos:
-        stmt = stmt.where(Player.element_type == pos)
-    rows = session.exec(stmt).all()
-    rows.sort(key=lambda r: r[0].ep, reverse=True)
-    rows = rows[:limit]
-    return [
-        {
-            "player_id": p.fpl_element_id,
-            "name": f"{p.first_name} {p.second_name}",
-            "web_name": p.web_name,
-            "team_id": p.team_id,
-            "pos": p.element_type,
-            "cost": p.now_cost / 10.0,
-            "ep": round(ep.ep, 2)
-        }
-        for ep, p in rows
-    ]
+def ep_top(request: Request, response: Response, gw: int, pos: int | None = None, limit: int = 20,
+           session: Session = Depends(get_session)):
+    not_modified = conditional(request, response, "ep_top", gw, pos or 0, limit)
+    if not_modified is not None:
+        return not_modified
+    # Encoded once per (gw, pos, limit) and data generation; warm-up pre-encodes the common ones
+    body = serving_cache.get_or_compute(("ep_top.json", gw, pos or 0, limit),
+                                        lambda: dumps(_top_rows(session, gw, pos, limit)))
+    return json_response(body, response)
+
+def _top_rows(session: Session, gw: int, pos: int | None, limit: int) -> list[dict]:
+    # Warmed entries hold the top-N list; a shorter list means every player is in it
+    cached = serving_cache.get(("ep_top", gw, pos or 0))
+    if cached is not None:
+        top_n, rows = cached
+        if limit <= top_n or len(rows) < top_n:
+            return rows[:limit]
+    gen = serving_cache.generation()
+    rows = top_ep(session, gw, pos, limit)
+    serving_cache.put(("ep_top", gw, pos or 0), (limit, rows), gen)
+    return rows
@@ -1,16 +1,51 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
 from typing import Optional
+from sqlalchemy import and_, or_
 from sqlmodel import Session, select
+from app.core.caching import conditional
+from app.core.pagination import MAX_PAGE, NEXT_CURSOR_HEADER, decode_cursor, keyset_page, projection
+from app.core.responses import json_response
 from app.db.session import get_session
 from app.models.fixture import Fixture
+from app.services import serving_cache
 
 router = APIRouter()
 
+KEYS = ("event", "id")  # event is null for unscheduled fixtures
+
 @router.get("/fixtures")
-def list_fixtures(gw_from: Optional[int] = None, gw_to: Optional[int] = None, session: Session = Depends(get_session)):
-    stmt = select(Fixture)
-    if gw_from is not None:
-        stmt = stmt.where(Fixture.event >= gw_from)
-    if gw_to is not None:
-        stmt = stmt.where(Fixture.event <= gw_to)
-    return session.exec(stmt).all()
+def list_fixtures(request: Request, response: Response, gw_from: Optional[int] = None, gw_to: Optional[int] = None,
+                  limit: int = Query(400, ge=1, le=MAX_PAGE), cursor: Optional[str] = None,
+                  fields: Optional[str] = None, session: Session = Depends(get_session)):
+    """
+    Fixtures by GW then id, unscheduled ones (no GW) last; pass the
+    X-Next-Cursor header back as `cursor` for the next page.
+    """
+    names, cols = projection(Fixture.__table__, fields, KEYS)
+    after = decode_cursor(cursor, KEYS, nullable=("event",)) if cursor else None
+    not_modified = conditional(request, response, "fixtures", gw_from, gw_to, limit, cursor, tuple(names))
+    if not_modified is not None:
+        return not_modified
+    def load():
+        stmt = select(*cols)
+        if gw_from is not None:
+            stmt = stmt.where(Fixture.event >= gw_from)
+        if gw_to is not None:
+            stmt = stmt.where(Fixture.event <= gw_to)
+        if after is not None:
+            event, fixture_id = after
+            if event is None:
+                stmt = stmt.where(Fixture.event.is_(None), Fixture.id > fixture_id)
+            else:
+                stmt = stmt.where(or_(
+                    Fixture.event > event,
+                    and_(Fixture.event == event, Fixture.id > fixture_id),
+                    Fixture.event.is_(None),
+                ))
+        stmt = stmt.order_by(Fixture.event.asc().nulls_last(), Fixture.id).limit(limit + 1)
+        return keyset_page(session.execute(stmt), names, KEYS, limit)
+    body, next_cursor = serving_cache.get_or_compute(
+        ("fixtures", gw_from, gw_to, limit, cursor, tuple(names)), load)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return json_response(body, response)
@@ -1,7 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from app.core.caching import cache_control
 
 router = APIRouter()
 
 @router.get("/health")
-def health():
+def health(response: Response):
+    response.headers["Cache-Control"] = cache_control(max_age=15, swr=60)
     return {"status": "ok"}
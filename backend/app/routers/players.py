@@ -1,17 +1,45 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
 from typing import List, Optional
 from sqlmodel import Session, select
+from app.core.caching import conditional
+from app.core.pagination import (
+    MAX_PAGE, NEXT_CURSOR_HEADER, decode_cursor, keyset_page, projected_model, projection,
+)
+from app.core.responses import json_response
 from app.db.session import get_session
 from app.models.player import Player
+from app.services import serving_cache
 
 router = APIRouter()
 
-@router.get("/players", response_model=List[Player])
-def list_players(pos: Optional[int] = None, team: Optional[int] = None, limit: int = 100, session: Session = Depends(get_session)):
-    stmt = select(Player)
-    if pos:
-        stmt = stmt.where(Player.element_type == pos)
-    if team:
-        stmt = stmt.where(Player.team_id == team)
-    stmt = stmt.limit(limit)
-    return session.exec(stmt).all()
+KEYS = ("fpl_element_id",)
+
+# documents the payload only: the body is sent pre-encoded, so it is not re-validated
+PlayerOut = projected_model(Player, "PlayerOut")
+
+@router.get("/players", response_model=List[PlayerOut])
+def list_players(request: Request, response: Response, pos: Optional[int] = None, team: Optional[int] = None,
+                 limit: int = Query(100, ge=1, le=MAX_PAGE), cursor: Optional[str] = None,
+                 fields: Optional[str] = None, session: Session = Depends(get_session)):
+    """Players in FPL id order; pass the X-Next-Cursor header back as `cursor` for the next page."""
+    names, cols = projection(Player.__table__, fields, KEYS)
+    after = decode_cursor(cursor, KEYS) if cursor else None
+    not_modified = conditional(request, response, "players", pos or 0, team or 0, limit, cursor, tuple(names))
+    if not_modified is not None:
+        return not_modified
+    def load():
+        # (element_type | team_id, fpl_element_id) indexes serve the filter, order and seek
+        stmt = select(*cols)
+        if pos:
+            stmt = stmt.where(Player.element_type == pos)
+        if team:
+            stmt = stmt.where(Player.team_id == team)
+        if after is not None:
+            stmt = stmt.where(Player.fpl_element_id > after[0])
+        stmt = stmt.order_by(Player.fpl_element_id).limit(limit + 1)
+        return keyset_page(session.execute(stmt), names, KEYS, limit)
+    body, next_cursor = serving_cache.get_or_compute(
+        ("players", pos or 0, team or 0, limit, cursor, tuple(names)), load)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return json_response(body, response)
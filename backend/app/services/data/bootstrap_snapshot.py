@@ -0,0 +1,76 @@
+"""
+Process-wide snapshot of FPL bootstrap-static (~2MB).
+
+The deadline lookup, the bootstrap upserts and the ingest endpoints all read
+the same parsed object. It is refetched at most once per BOOTSTRAP_TTL_S, and
+concurrent callers share one in-flight download (single-flight). The parsed
+dict is shared: treat it as read-only.
+
+Each consumer decides whether it has work to do with `snap.is_new_for(name)`
+and records success with `snap.ack(name)` (see app.services.http_cache).
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from app.services.http_cache import CachedResponse, http_cache
+
+BOOTSTRAP_URL = "https://fantasy.premierleague.com/api/bootstrap-static/"
+BOOTSTRAP_TTL_S = float(os.getenv("BOOTSTRAP_TTL_S", "300"))
+
+
+@dataclass(frozen=True)
+class BootstrapSnapshot:
+    data: dict
+    response: CachedResponse
+    fetched_at: float  # time.monotonic()
+
+    @property
+    def age_s(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def is_new_for(self, consumer: str) -> bool:
+        return http_cache.unseen(self.response, consumer)
+
+    def ack(self, consumer: str) -> None:
+        http_cache.ack(self.response, consumer)
+
+
+_lock = threading.Lock()
+_snapshot: Optional[BootstrapSnapshot] = None
+
+
+def get_bootstrap(max_age: Optional[float] = None, force: bool = False) -> BootstrapSnapshot:
+    """
+    Return the current snapshot, refetching it when older than `max_age`
+    (default BOOTSTRAP_TTL_S) or when `force` is set. Threads that arrive while
+    a fetch is running wait for it and reuse its result.
+    """
+    global _snapshot
+    ttl = BOOTSTRAP_TTL_S if max_age is None else max_age
+    snap = _snapshot
+    if snap is not None and not force and snap.age_s < ttl:
+        return snap
+
+    requested_at = time.monotonic()
+    with _lock:
+        snap = _snapshot
+        # Someone else refreshed while we waited on the lock: share their result
+        if snap is not None and (snap.fetched_at >= requested_at or (not force and snap.age_s < ttl)):
+            return snap
+        r = http_cache.get(BOOTSTRAP_URL, timeout=30)
+        r.raise_for_status()
+        if snap is not None and r.sha256 == snap.response.sha256:
+            data = snap.data  # same body: keep the parsed object, skip json.loads
+        else:
+            data = r.json()
+        _snapshot = BootstrapSnapshot(data=data, response=r, fetched_at=time.monotonic())
+        return _snapshot
+
+
+def invalidate() -> None:
+    global _snapshot
+    with _lock:
+        _snapshot = None
@@ -1,45 +1,72 @@
+from sqlalchemy import insert, update
 from sqlmodel import Session, select
-import httpx
+from app.services.data.bootstrap_snapshot import get_bootstrap
+from app.services.http_cache import http_cache
+from app.services import serving_cache
 from app.models.team import Team
 from app.models.player import Player
 from app.models.fixture import Fixture
 
-BOOTSTRAP = "https://fantasy.premierleague.com/api/bootstrap-static/"
 FIXTURES = "https://fantasy.premierleague.com/api/fixtures/"
 
-def ingest_bootstrap(session: Session):
-    r = httpx.get(BOOTSTRAP, timeout=30.0)
-    r.raise_for_status()
-    data = r.json()
+TEAM_FIELDS = (
+    "name", "short_name", "strength",
+    "strength_attack_home", "strength_attack_away",
+    "strength_defence_home", "strength_defence_away",
+)
+PLAYER_FIELDS = (
+    "first_name", "second_name", "web_name", "team_id", "element_type", "now_cost",
+    "status", "minutes_prev", "goals_prev", "assists_prev",
+)
 
-    teams = data.get("teams", [])
-    for t in teams:
-        obj = session.exec(select(Team).where(Team.fpl_team_id == t["id"])).first()
-        if not obj:
-            obj = Team(
-                fpl_team_id=t["id"],
-                name=t["name"],
-                short_name=t["short_name"],
-                strength=t.get("strength"),
-                strength_attack_home=t.get("strength_attack_home"),
-                strength_attack_away=t.get("strength_attack_away"),
-                strength_defence_home=t.get("strength_defence_home"),
-                strength_defence_away=t.get("strength_defence_away"),
-            )
-            session.add(obj)
+def _sync_rows(session: Session, model, key: str, fields, incoming: list) -> dict:
+    """
+    Preload (id, key, fields) for the whole table in one query, compare each
+    incoming row's field signature with the stored one and write only the
+    difference: one bulk INSERT for new keys, one bulk UPDATE for changed rows.
+    """
+    cols = [getattr(model, f) for f in fields]
+    existing = {
+        row[1]: (row[0], tuple(row[2:]))
+        for row in session.exec(select(model.id, getattr(model, key), *cols))
+    }
+    inserts, updates, unchanged = [], [], 0
+    for row in incoming:
+        cur = existing.get(row[key])
+        if cur is None:
+            inserts.append(row)
+        elif cur[1] != tuple(row[f] for f in fields):
+            updates.append({"id": cur[0], **row})
         else:
-            obj.name = t["name"]
-            obj.short_name = t["short_name"]
-            obj.strength = t.get("strength")
-            obj.strength_attack_home = t.get("strength_attack_home")
-            obj.strength_attack_away = t.get("strength_attack_away")
-            obj.strength_defence_home = t.get("strength_defence_home")
-            obj.strength_defence_away = t.get("strength_defence_away")
+            unchanged += 1
+    if inserts:
+        session.execute(insert(model), inserts)
+    if updates:
+        session.execute(update(model), updates)  # bulk UPDATE by primary key
+    return {"inserted": len(inserts), "updated": len(updates), "unchanged": unchanged}
+
+def ingest_bootstrap(session: Session, force: bool = False):
+    snap = get_bootstrap()
+    if not force and not snap.is_new_for("fpl_client.bootstrap"):
+        zero = {"inserted": 0, "updated": 0, "unchanged": 0}
+        return {"teams": zero, "players": dict(zero), "payload_unchanged": True}
+    data = snap.data
 
-    players = data.get("elements", [])
-    for p in players:
-        obj = session.exec(select(Player).where(Player.fpl_element_id == p["id"])).first()
-        fields = dict(
+    teams = [
+        dict(
+            fpl_team_id=t["id"],
+            name=t["name"],
+            short_name=t["short_name"],
+            strength=t.get("strength"),
+            strength_attack_home=t.get("strength_attack_home"),
+            strength_attack_away=t.get("strength_attack_away"),
+            strength_defence_home=t.get("strength_defence_home"),
+            strength_defence_away=t.get("strength_defence_away"),
+        )
+        for t in data.get("teams", [])
+    ]
+    players = [
+        dict(
             fpl_element_id=p["id"],
             first_name=p.get("first_name",""),
             second_name=p.get("second_name",""),
@@ -52,36 +79,70 @@ def ingest_bootstrap(session: Session):
             goals_prev=p.get("goals_scored",0),
             assists_prev=p.get("assists",0),
         )
-        if not obj:
-            session.add(Player(**fields))
-        else:
-            for k,v in fields.items():
-                setattr(obj, k, v)
+        for p in data.get("elements", [])
+    ]
 
+    stats = {
+        "teams": _sync_rows(session, Team, "fpl_team_id", TEAM_FIELDS, teams),
+        "players": _sync_rows(session, Player, "fpl_element_id", PLAYER_FIELDS, players),
+    }
     session.commit()
-    return {"teams": len(teams), "players": len(players)}
+    snap.ack("fpl_client.bootstrap")
+    if any(s["inserted"] or s["updated"] for s in stats.values()):
+        serving_cache.bump("bootstrap ingest")
+    return stats
 
-def ingest_fixtures(session: Session):
-    r = httpx.get(FIXTURES, timeout=30.0)
+def _team_gws(*fixtures) -> set:
+    return {(t, gw) for f in fixtures if f and f[0] is not None for gw, t in ((f[0], f[1]), (f[0], f[2]))}
+
+def ingest_fixtures(session: Session, force: bool = False):
+    """
+    Diff the FPL fixture list against the table in one read and apply it with
+    one bulk INSERT and one bulk UPDATE in a single transaction, so readers
+    never see a half-applied reschedule. Returns counts and the sorted
+    (team, gw) pairs whose fixtures changed (both the old and the new GW of a
+    moved fixture).
+    """
+    r = http_cache.get(FIXTURES, timeout=30.0, consumer="fpl_client.fixtures")
     r.raise_for_status()
-    fixtures = r.json()
-    count = 0
-    for f in fixtures:
-        obj = session.exec(select(Fixture).where(Fixture.fpl_fixture_id == f["id"])).first()
-        if not obj:
-            obj = Fixture(
-                fpl_fixture_id=f["id"],
-                event=f.get("event"),
-                team_h=f["team_h"],
-                team_a=f["team_a"],
-                finished=f.get("finished", False),
-            )
-            session.add(obj)
-            count += 1
+    if not r.changed and not force:
+        return {"inserted": 0, "updated": 0, "unchanged": 0, "changed": [], "payload_unchanged": True}
+    incoming = [
+        dict(
+            fpl_fixture_id=f["id"],
+            event=f.get("event"),
+            team_h=f["team_h"],
+            team_a=f["team_a"],
+            finished=f.get("finished", False),
+        )
+        for f in r.json()
+    ]
+
+    existing = {
+        row[1]: (row[0], tuple(row[2:]))
+        for row in session.exec(select(Fixture.id, Fixture.fpl_fixture_id, Fixture.event,
+                                       Fixture.team_h, Fixture.team_a, Fixture.finished))
+    }
+    inserts, updates, unchanged, changed = [], [], 0, set()
+    for row in incoming:
+        sig = (row["event"], row["team_h"], row["team_a"], row["finished"])
+        cur = existing.get(row["fpl_fixture_id"])
+        if cur is None:
+            inserts.append(row)
+            changed |= _team_gws(sig)
+        elif cur[1] != sig:
+            updates.append({"id": cur[0], **row})
+            if cur[1][:3] != sig[:3]:  # a result coming in is not a schedule change
+                changed |= _team_gws(cur[1], sig)
         else:
-            obj.event = f.get("event")
-            obj.team_h = f["team_h"]
-            obj.team_a = f["team_a"]
-            obj.finished = f.get("finished", False)
+            unchanged += 1
+    if inserts:
+        session.execute(insert(Fixture), inserts)
+    if updates:
+        session.execute(update(Fixture), updates)  # bulk UPDATE by primary key
     session.commit()
-    return count
+    http_cache.ack(r, "fpl_client.fixtures")
+    if inserts or updates:
+        serving_cache.bump("fixtures ingest")
+    return {"inserted": len(inserts), "updated": len(updates), "unchanged": unchanged,
+            "changed": sorted(changed)}
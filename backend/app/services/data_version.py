@@ -0,0 +1,83 @@
+"""
+Data generation shared by every API process.
+
+One row in `data_version` holds a counter that loaders bump after writing
+data the API serves (players, fixtures, EP). Each process reads it at most
+every DATA_VERSION_POLL_S seconds and drops its in-memory derived state (the
+serving cache, the EP prefix table) when it moves, so a refresh run by one
+worker or by the scheduler is picked up by all of them. It is also the
+version behind the API's ETags, identical across workers for identical data.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel, select
+
+from app.core.logging import logger
+from app.db.session import engine
+
+DATA_VERSION_POLL_S = float(os.getenv("DATA_VERSION_POLL_S", "5"))
+
+
+class DataVersion(SQLModel, table=True):
+    __tablename__ = "data_version"
+
+    id: int = Field(default=1, primary_key=True)
+    generation: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+_lock = threading.Lock()
+_cached: Optional[int] = None
+_read_at = float("-inf")
+
+
+def _remember(gen: Optional[int], at: float) -> None:
+    global _cached, _read_at
+    with _lock:
+        _cached, _read_at = gen, at
+
+
+def current() -> Optional[int]:
+    """The shared generation, re-read at most every DATA_VERSION_POLL_S; None if it cannot be read."""
+    now = time.monotonic()
+    with _lock:
+        if now - _read_at < DATA_VERSION_POLL_S:
+            return _cached
+    try:
+        with Session(engine) as session:
+            gen = session.exec(select(DataVersion.generation).where(DataVersion.id == 1)).first() or 0
+    except Exception as e:
+        logger.warning(f"[data_version] could not read the shared generation: {e}")
+        gen = None
+    _remember(gen, now)
+    return gen
+
+
+def bump() -> int:
+    """Increment the shared generation and return the new value."""
+    with Session(engine) as session:
+        for _ in range(2):
+            res = session.execute(
+                update(DataVersion).where(DataVersion.id == 1)
+                .values(generation=DataVersion.generation + 1, updated_at=datetime.utcnow())
+            )
+            if res.rowcount == 0:
+                session.add(DataVersion(id=1, generation=1))
+                try:
+                    session.flush()
+                except IntegrityError:  # another process created the row first
+                    session.rollback()
+                    continue
+            gen = session.exec(select(DataVersion.generation).where(DataVersion.id == 1)).one()
+            session.commit()
+            break
+        else:
+            raise RuntimeError("could not bump data_version")
+    _remember(gen, time.monotonic())
+    return gen
@@ -1,9 +1,27 @@
+from sqlalchemy import Index
 from sqlmodel import Session, select
 from math import exp
 from app.models.player import Player
 from app.models.fixture import Fixture
 from app.models.team import Team
 from app.models.ep import EPRecord
+from app.services.ep_prefix import rebuild_ep_prefix
+from app.services import serving_cache
+
+# top_ep walks this index for one gw in EP order and stops after `limit` rows
+EP_TOP_INDEX = Index(
+    "ix_ep_gw_ep_desc",
+    EPRecord.__table__.c.gw, EPRecord.__table__.c.ep.desc(), EPRecord.__table__.c.fpl_element_id,
+)
+# position filter: element_type per player straight from the index
+PLAYER_POS_INDEX = Index(
+    "ix_player_element_type", Player.__table__.c.element_type, Player.__table__.c.fpl_element_id,
+)
+
+def ensure_ep_indexes(bind) -> None:
+    """create_all only adds indexes with new tables; add them to existing ones too"""
+    for ix in (EP_TOP_INDEX, PLAYER_POS_INDEX):
+        ix.create(bind, checkfirst=True)
 
 def sigmoid(x: float) -> float:
     return 1.0 / (1.0 + exp(-x))
@@ -67,4 +85,32 @@ def recompute_ep_range(session: Session, start_gw: int, end_gw: int) -> int:
             session.add(EPRecord(gw=gw, fpl_element_id=p.fpl_element_id, ep=ep))
             total += 1
         session.commit()
+
+    rebuild_ep_prefix(session)
+    serving_cache.bump(f"ep recompute gw {start_gw}-{end_gw}")
     return total
+
+def top_ep(session: Session, gw: int, pos: int | None = None, limit: int = 20) -> list[dict]:
+    # Sort and limit in the database (ix_ep_gw_ep_desc) and fetch only the response columns
+    stmt = (
+        select(Player.fpl_element_id, Player.first_name, Player.second_name, Player.web_name,
+               Player.team_id, Player.element_type, Player.now_cost, EPRecord.ep)
+        .join(Player, Player.fpl_element_id == EPRecord.fpl_element_id)
+        .where(EPRecord.gw == gw)
+        .order_by(EPRecord.ep.desc(), EPRecord.fpl_element_id)
+        .limit(limit)
+    )
+    if pos:
+        stmt = stmt.where(Player.element_type == pos)
+    return [
+        {
+            "player_id": pid,
+            "name": f"{first} {second}",
+            "web_name": web,
+            "team_id": team_id,
+            "pos": element_type,
+            "cost": now_cost / 10.0,
+            "ep": round(ep, 2)
+        }
+        for pid, first, second, web, team_id, element_type, now_cost, ep in session.execute(stmt)
+    ]
@@ -0,0 +1,153 @@
+"""
+Per-player cumulative EP ("prefix sums") over the season.
+
+Each player gets a float32 vector of 38 slots where slot g-1 holds the EP summed
+over GW1..g. The sum over any window GW a..b is then cums[b] - cums[a-1], so the
+optimizer and ranking endpoints can pull horizon totals for every player in one
+vectorized read instead of one EPRecord query per gameweek.
+
+The in-memory table is tagged with the shared data generation it was loaded
+under (app.services.data_version); when a recompute in any process bumps the
+generation, every process reloads the persisted table on its next use.
+"""
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import Column, LargeBinary, delete, insert
+from sqlmodel import Field, Session, SQLModel, select
+
+from app.models.ep import EPRecord
+from app.services import data_version
+
+N_GW = 38
+
+
+class EPPrefix(SQLModel, table=True):
+    __tablename__ = "ep_prefix"
+
+    fpl_element_id: int = Field(primary_key=True)
+    # N_GW little-endian float32 values, cumulative EP after GW1..GW38
+    cumsum: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class EPPrefixTable:
+    """
+    In-memory prefix sums: `cums[i, g]` is the EP of player `ids[i]` summed over
+    GW1..g. Column 0 is all zeros so window sums need no special casing.
+    """
+
+    def __init__(self, ids: np.ndarray, cums: np.ndarray):
+        self.ids = ids
+        self.cums = cums
+        self.index = {int(pid): i for i, pid in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def window(self, gw_from: int, gw_to: int) -> np.ndarray:
+        """EP summed over GW gw_from..gw_to (inclusive) for every player, aligned with `ids`."""
+        a = min(max(gw_from, 1), N_GW + 1)
+        b = min(max(gw_to, 0), N_GW)
+        if b < a:
+            return np.zeros(len(self.ids), dtype=np.float32)
+        return self.cums[:, b] - self.cums[:, a - 1]
+
+    def window_map(self, gw_from: int, gw_to: int) -> Dict[int, float]:
+        sums = self.window(gw_from, gw_to)
+        return dict(zip(self.ids.tolist(), sums.tolist()))
+
+    def player_window(self, fpl_element_id: int, gw_from: int, gw_to: int) -> float:
+        i = self.index.get(fpl_element_id)
+        if i is None:
+            return 0.0
+        a = min(max(gw_from, 1), N_GW + 1)
+        b = min(max(gw_to, 0), N_GW)
+        if b < a:
+            return 0.0
+        return float(self.cums[i, b] - self.cums[i, a - 1])
+
+
+_lock = threading.Lock()
+_table: Optional[EPPrefixTable] = None
+_table_gen: Optional[int] = None  # shared generation _table was loaded under
+
+
+def _from_records(ids: np.ndarray, gws: np.ndarray, eps: np.ndarray) -> EPPrefixTable:
+    keep = (gws >= 1) & (gws <= N_GW)
+    ids, gws, eps = ids[keep], gws[keep], eps[keep]
+    uniq, row = np.unique(ids, return_inverse=True)
+    per_gw = np.zeros((len(uniq), N_GW + 1), dtype=np.float64)
+    np.add.at(per_gw, (row, gws), eps)
+    # accumulate in float64, store as float32
+    cums = np.cumsum(per_gw, axis=1).astype(np.float32)
+    return EPPrefixTable(uniq, cums)
+
+
+def rebuild_ep_prefix(session: Session) -> EPPrefixTable:
+    """
+    Recompute prefix sums from all EPRecord rows (one read), persist them to
+    `ep_prefix` and swap the in-memory table.
+    """
+    global _table, _table_gen
+    gen = data_version.current()
+    rows = session.exec(select(EPRecord.fpl_element_id, EPRecord.gw, EPRecord.ep)).all()
+    if rows:
+        ids, gws, eps = (np.asarray(col) for col in zip(*rows))
+        table = _from_records(ids.astype(np.int64), gws.astype(np.int64), eps.astype(np.float64))
+    else:
+        table = EPPrefixTable(np.zeros(0, dtype=np.int64), np.zeros((0, N_GW + 1), dtype=np.float32))
+
+    now = datetime.utcnow()
+    session.execute(delete(EPPrefix))
+    if len(table):
+        session.execute(
+            insert(EPPrefix),
+            [
+                {"fpl_element_id": int(pid), "cumsum": table.cums[i, 1:].astype("<f4").tobytes(), "updated_at": now}
+                for i, pid in enumerate(table.ids)
+            ],
+        )
+    session.commit()
+
+    with _lock:
+        _table, _table_gen = table, gen
+    return table
+
+
+def load_ep_prefix(session: Session) -> Optional[EPPrefixTable]:
+    """Read the persisted prefix sums in one query; None if nothing is stored yet."""
+    rows = session.exec(select(EPPrefix.fpl_element_id, EPPrefix.cumsum)).all()
+    if not rows:
+        return None
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    cums = np.zeros((len(rows), N_GW + 1), dtype=np.float32)
+    for i, (_, blob) in enumerate(rows):
+        cums[i, 1:] = np.frombuffer(blob, dtype="<f4", count=N_GW)
+    return EPPrefixTable(ids, cums)
+
+
+def get_ep_prefix(session: Session) -> EPPrefixTable:
+    """
+    Process-wide prefix table, loaded from the database (or rebuilt) on first
+    use and reloaded once the shared data generation has moved.
+    """
+    global _table, _table_gen
+    gen = data_version.current()
+    with _lock:
+        if _table is not None and (gen is None or gen == _table_gen):
+            return _table
+    table = load_ep_prefix(session)
+    if table is None:
+        return rebuild_ep_prefix(session)
+    with _lock:
+        _table, _table_gen = table, gen
+        return _table
+
+
+def invalidate_ep_prefix() -> None:
+    global _table, _table_gen
+    with _lock:
+        _table, _table_gen = None, None
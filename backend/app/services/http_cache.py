@@ -0,0 +1,396 @@
+"""
+Shared HTTP cache for external fetchers (FPL, Understat, FBref, Odds API, Sportmonks).
+
+Responses are revalidated with conditional requests (If-None-Match /
+If-Modified-Since) and bodies are stored in a content-addressed disk cache:
+
+    <HTTP_CACHE_DIR>/meta/<sha256(url+params)>.json   etag, last-modified, body hash
+    <HTTP_CACHE_DIR>/bodies/<ab>/<sha256(body)>       raw body
+
+Every response carries `changed`: False when the server answered 304 or sent a
+body identical to the stored one, so callers can skip parsing and DB work.
+Callers that share a URL but write to different places pass a `consumer` name:
+`changed` is then relative to the last body that consumer acknowledged with
+`http_cache.ack(resp, consumer)` after its own writes succeeded.
+
+HTTP_CACHE_MODE=offline replays stored bodies without touching the network
+(for tests and local debugging) and raises OfflineCacheMiss otherwise.
+
+`get(..., stream=True)` spools the body straight into the body store and
+returns a response with `path` set instead of `content`; read it back in chunks
+with `iter_content()` to keep large payloads out of memory.
+
+`prune()` deletes bodies no index entry points to any more (superseded
+payloads), then, if the store is still over HTTP_CACHE_MAX_BYTES, drops the
+least recently checked entries. Files younger than HTTP_CACHE_PRUNE_GRACE_S are
+never touched, so a body a caller is still reading survives. It runs
+automatically at most every HTTP_CACHE_PRUNE_S after a new body is stored.
+
+`fresh()` answers from disk only (a hit within `max_age`, or any stored body
+offline) and returns None otherwise, so rate-limited callers can skip taking
+a token for requests that never reach the network.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+import requests
+
+CACHE_DIR = os.getenv(
+    "HTTP_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "cache", "http"),
+)
+MODE = os.getenv("HTTP_CACHE_MODE", "online")  # online | offline
+
+# Query params that must never end up in cache keys or on disk
+SECRET_PARAMS = {"apikey", "api_key", "api_token", "token", "key"}
+STREAM_CHUNK = 64 * 1024
+
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+HTTP_CACHE_PRUNE_S = float(os.getenv("HTTP_CACHE_PRUNE_S", "3600"))  # 0 = only when prune() is called
+HTTP_CACHE_PRUNE_GRACE_S = float(os.getenv("HTTP_CACHE_PRUNE_GRACE_S", "3600"))
+
+
+class OfflineCacheMiss(LookupError):
+    pass
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    status_code: int
+    content: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+    changed: bool = True
+    from_cache: bool = False
+    key: Optional[str] = None
+    sha256: Optional[str] = None
+    path: Optional[str] = None  # body file of a streamed response (content is then empty)
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.body().decode("utf-8", errors="replace")
+
+    def body(self) -> bytes:
+        if self.path is not None and not self.content:
+            with open(self.path, "rb") as f:
+                return f.read()
+        return self.content
+
+    def iter_content(self, chunk_size: int = STREAM_CHUNK) -> Iterator[bytes]:
+        if self.path is None:
+            yield self.content
+            return
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def json(self):
+        return json.loads(self.body())
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}")
+
+
+class HTTPCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, mode: str = MODE):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.mode = mode
+        self._session: Optional[requests.Session] = None
+        self._pruned_at = time.time()
+        self._prune_lock = threading.Lock()
+
+    # --- storage ------------------------------------------------------------
+    @staticmethod
+    def cache_key(url: str, params: Optional[dict] = None) -> str:
+        public = sorted((k, str(v)) for k, v in (params or {}).items() if k.lower() not in SECRET_PARAMS)
+        return hashlib.sha256(f"{url}?{urlencode(public)}".encode("utf-8")).hexdigest()
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "meta", f"{key}.json")
+
+    def _body_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "bodies", digest[:2], digest)
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _load(self, key: str):
+        """(meta, body path) of a cached entry, or (None, None)."""
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            path = self._body_path(meta["sha256"])
+        except (OSError, ValueError, KeyError):
+            return None, None
+        if not os.path.exists(path):
+            return None, None
+        return meta, path
+
+    def _store_body(self, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        body_path = self._body_path(digest)
+        if not os.path.exists(body_path):
+            self._atomic_write(body_path, content)
+        return digest
+
+    def _store_stream(self, chunks: Iterable[bytes]) -> str:
+        """Write chunks to the body store while hashing them; returns the digest."""
+        tmp_dir = os.path.join(self.cache_dir, "bodies")
+        os.makedirs(tmp_dir, exist_ok=True)
+        h = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    h.update(chunk)
+                    f.write(chunk)
+            digest = h.hexdigest()
+            body_path = self._body_path(digest)
+            if os.path.exists(body_path):
+                os.unlink(tmp)
+            else:
+                os.makedirs(os.path.dirname(body_path), exist_ok=True)
+                os.replace(tmp, body_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest
+
+    def _save(self, key: str, url: str, headers, digest: str, meta: Optional[dict] = None) -> dict:
+        new_meta = {
+            "url": url,
+            "sha256": digest,
+            "etag": headers.get("etag") or (meta or {}).get("etag"),
+            "last_modified": headers.get("last-modified") or (meta or {}).get("last_modified"),
+            "content_type": headers.get("content-type"),
+            "checked_at": time.time(),
+            "seen": (meta or {}).get("seen", {}),
+        }
+        self._atomic_write(self._meta_path(key), json.dumps(new_meta).encode("utf-8"))
+        return new_meta
+
+    def _touch(self, key: str, meta: dict):
+        meta = dict(meta, checked_at=time.time())
+        self._atomic_write(self._meta_path(key), json.dumps(meta).encode("utf-8"))
+
+    # --- eviction -----------------------------------------------------------
+    def _scan(self, kind: str) -> List[Tuple[str, os.stat_result]]:
+        out = []
+        for root, _, files in os.walk(os.path.join(self.cache_dir, kind)):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    out.append((path, os.stat(path)))
+                except OSError:
+                    pass  # removed concurrently
+        return out
+
+    @staticmethod
+    def _unlink(path: str) -> bool:
+        try:
+            os.unlink(path)
+            return True
+        except OSError:
+            return False
+
+    def prune(self, max_bytes: int = HTTP_CACHE_MAX_BYTES, grace_s: float = HTTP_CACHE_PRUNE_GRACE_S) -> dict:
+        """Delete unreferenced bodies, then evict least recently checked entries down to `max_bytes`."""
+        cutoff = time.time() - grace_s
+        entries = []  # (checked_at, meta path, digest)
+        for path, st in self._scan("meta"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                entries.append((meta.get("checked_at", st.st_mtime), path, meta["sha256"]))
+            except (OSError, ValueError, KeyError):
+                if st.st_mtime < cutoff:
+                    self._unlink(path)
+        refs: Dict[str, int] = {}
+        for _, _, digest in entries:
+            refs[digest] = refs.get(digest, 0) + 1
+
+        # bodies no entry points to, plus temp files of interrupted streams
+        bodies, orphans, freed = {}, 0, 0
+        for path, st in self._scan("bodies"):
+            name = os.path.basename(path)
+            if name in refs:
+                bodies[name] = st.st_size
+            elif st.st_mtime < cutoff and self._unlink(path):
+                orphans += 1
+                freed += st.st_size
+
+        total, evicted = sum(bodies.values()), 0
+        for checked_at, meta_path, digest in sorted(entries):
+            if total <= max_bytes or checked_at >= cutoff:
+                break
+            if not self._unlink(meta_path):
+                continue
+            evicted += 1
+            refs[digest] -= 1
+            if refs[digest] == 0 and digest in bodies and self._unlink(self._body_path(digest)):
+                total -= bodies[digest]
+                freed += bodies[digest]
+
+        self._pruned_at = time.time()
+        return {"orphans": orphans, "evicted": evicted, "freed_bytes": freed, "bytes": total}
+
+    def _maybe_prune(self):
+        if HTTP_CACHE_PRUNE_S <= 0 or time.time() - self._pruned_at < HTTP_CACHE_PRUNE_S:
+            return
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            self.prune()
+        except OSError:
+            pass  # best effort; retried on the next interval
+        finally:
+            self._pruned_at = time.time()
+            self._prune_lock.release()
+
+    # --- request plumbing ---------------------------------------------------
+    def _hit(self, url: str, key: str, digest: str, path: str, headers, changed: bool,
+             from_cache: bool, stream: bool) -> CachedResponse:
+        if stream:
+            return CachedResponse(url, 200, b"", headers, changed=changed, from_cache=from_cache,
+                                  key=key, sha256=digest, path=path)
+        with open(path, "rb") as f:
+            content = f.read()
+        return CachedResponse(url, 200, content, headers, changed=changed, from_cache=from_cache,
+                              key=key, sha256=digest)
+
+    @staticmethod
+    def _changed(meta: Optional[dict], digest: str, consumer: Optional[str], default: bool) -> bool:
+        if consumer is None:
+            return default
+        return ((meta or {}).get("seen") or {}).get(consumer) != digest
+
+    def _before(self, url: str, params: Optional[dict], headers: Optional[dict],
+                max_age: Optional[float], consumer: Optional[str], stream: bool = False):
+        key = self.cache_key(url, params)
+        meta, body = self._load(key)
+        if self.mode == "offline":
+            if body is None:
+                raise OfflineCacheMiss(url)
+            return key, meta, body, self._hit(url, key, meta["sha256"], body, {}, True, True, stream)
+        if body is not None and max_age is not None and time.time() - meta.get("checked_at", 0) < max_age:
+            changed = self._changed(meta, meta["sha256"], consumer, False)
+            return key, meta, body, self._hit(url, key, meta["sha256"], body, {}, changed, True, stream)
+
+        cond = dict(headers or {})
+        if body is not None:
+            if meta.get("etag"):
+                cond["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                cond["If-Modified-Since"] = meta["last_modified"]
+        return key, meta, body, cond
+
+    def _after(self, key: str, url: str, meta, body, status: int, headers, content: Optional[bytes],
+               consumer: Optional[str], digest: Optional[str] = None, stream: bool = False) -> CachedResponse:
+        headers = {k.lower(): v for k, v in headers.items()}
+        if status == 304 and body is not None:
+            self._touch(key, meta)
+            changed = self._changed(meta, meta["sha256"], consumer, False)
+            return self._hit(url, key, meta["sha256"], body, headers, changed, True, stream)
+        if status != 200:
+            return CachedResponse(url, status, content or b"", headers, changed=True)
+        if digest is None:
+            digest = self._store_body(content)
+        self._save(key, url, headers, digest, meta)
+        if meta is None or digest != meta.get("sha256"):
+            self._maybe_prune()
+        changed = self._changed(meta, digest, consumer, body is None or digest != meta.get("sha256"))
+        if stream:
+            return CachedResponse(url, status, b"", headers, changed=changed, key=key, sha256=digest,
+                                  path=self._body_path(digest))
+        return CachedResponse(url, status, content, headers, changed=changed, key=key, sha256=digest)
+
+    def fresh(self, url: str, params: Optional[dict] = None, max_age: Optional[float] = None,
+              consumer: Optional[str] = None) -> Optional[CachedResponse]:
+        """The response get() would serve without a request, or None if it would have to fetch."""
+        if max_age is None and self.mode != "offline":
+            return None
+        _, _, _, hit = self._before(url, params, None, max_age, consumer)
+        return hit if isinstance(hit, CachedResponse) else None
+
+    def unseen(self, resp: CachedResponse, consumer: str) -> bool:
+        """True when `consumer` has not acknowledged this exact body yet."""
+        if resp.key is None or resp.sha256 is None:
+            return True
+        meta, _ = self._load(resp.key)
+        return self._changed(meta, resp.sha256, consumer, True)
+
+    def ack(self, resp: CachedResponse, consumer: str):
+        """Record that `consumer` has fully processed this body."""
+        self.ack_key(resp.key, resp.sha256, consumer)
+
+    def ack_key(self, key: Optional[str], sha256: Optional[str], consumer: str):
+        """ack() by (resp.key, resp.sha256), for callers that do not keep the response around."""
+        if key is None or sha256 is None:
+            return
+        meta, _ = self._load(key)
+        if meta is None:
+            return
+        seen = dict(meta.get("seen") or {}, **{consumer: sha256})
+        self._atomic_write(self._meta_path(key), json.dumps(dict(meta, seen=seen)).encode("utf-8"))
+
+    def get(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+            session: Optional[requests.Session] = None, timeout: float = 30,
+            max_age: Optional[float] = None, consumer: Optional[str] = None,
+            stream: bool = False) -> CachedResponse:
+        key, meta, body, cond = self._before(url, params, headers, max_age, consumer, stream)
+        if isinstance(cond, CachedResponse):
+            return cond
+        if session is None:
+            if self._session is None:
+                self._session = requests.Session()
+            session = self._session
+        if stream:
+            with session.get(url, params=params, headers=cond, timeout=timeout, stream=True) as r:
+                if r.status_code != 200:
+                    return self._after(key, url, meta, body, r.status_code, r.headers, r.content, consumer,
+                                       stream=True)
+                digest = self._store_stream(r.iter_content(STREAM_CHUNK))
+            return self._after(key, url, meta, body, 200, r.headers, None, consumer, digest=digest, stream=True)
+        r = session.get(url, params=params, headers=cond, timeout=timeout)
+        return self._after(key, url, meta, body, r.status_code, r.headers, r.content, consumer)
+
+    async def aget(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+                   client: Optional[httpx.AsyncClient] = None, timeout: float = 30,
+                   max_age: Optional[float] = None, consumer: Optional[str] = None) -> CachedResponse:
+        # index and body store are plain file I/O: keep it off the event loop
+        key, meta, body, cond = await asyncio.to_thread(self._before, url, params, headers, max_age, consumer)
+        if isinstance(cond, CachedResponse):
+            return cond
+        if client is None:
+            async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as c:
+                r = await c.get(url, params=params, headers=cond)
+        else:
+            r = await client.get(url, params=params, headers=cond)
+        return await asyncio.to_thread(self._after, key, url, meta, body, r.status_code, r.headers, r.content,
+                                       consumer)
+
+
+http_cache = HTTPCache()
@@ -0,0 +1,40 @@
+"""
+Cross-process mutual exclusion for scheduled jobs.
+
+Every uvicorn worker / replica runs its own scheduler, so each job occurrence
+fires once per process. `advisory_lock(name)` takes a Postgres session-level
+advisory lock on a dedicated autocommit connection: exactly one process gets
+it, and it is released when the job ends or, if the process dies, when its
+connection drops. On other databases (SQLite in local dev) there is only one
+process to worry about, so the lock is always granted.
+"""
+import hashlib
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import text
+
+from app.db.session import engine
+
+
+def lock_key(name: str) -> int:
+    """Stable signed 64-bit key for pg_advisory_lock."""
+    return int.from_bytes(hashlib.sha256(f"job:{name}".encode()).digest()[:8], "big", signed=True)
+
+
+@contextmanager
+def advisory_lock(name: str) -> Iterator[bool]:
+    """Yield True if this process holds the lock for `name`, False if another one does."""
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+
+    key = lock_key(name)
+    # autocommit: the lock lives on the session, no transaction is held open for the job
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        got = bool(conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": key}).scalar())
+        try:
+            yield got
+        finally:
+            if got:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": key})
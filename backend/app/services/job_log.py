@@ -0,0 +1,82 @@
+"""
+Records pipeline stage runs in the `data_jobs` table (one row per stage run,
+named "<pipeline>.<stage>", plus one row per whole job, named after the job).
+
+Row counts come from whatever the stage returned: loaders return either an int
+(rows written) or a stats dict with keys such as inserted / updated /
+unchanged / upserted / failed.
+"""
+import datetime as dt
+import json
+from typing import Any, Dict, Optional
+
+from sqlmodel import Session, select
+
+from app.db.session import engine
+from app.models import DataJob
+from app.services.pipeline import StageRun
+
+_PROCESSED_KEYS = ("upserted", "rows", "processed", "fetched")
+
+
+def row_counts(result: Any) -> Dict[str, int]:
+    if isinstance(result, bool) or result is None:
+        return {}
+    if isinstance(result, int):
+        return {"records_processed": result}
+    if not isinstance(result, dict):
+        return {}
+
+    def num(*keys) -> int:
+        return sum(int(result[k]) for k in keys if isinstance(result.get(k), (int, float)))
+
+    inserted, updated = num("inserted"), num("updated")
+    processed = num(*_PROCESSED_KEYS) or inserted + updated + num("unchanged")
+    return {
+        "records_processed": processed,
+        "records_inserted": inserted,
+        "records_updated": updated,
+        "records_failed": num("failed"),
+    }
+
+
+def record_stage(run: StageRun) -> None:
+    """pipeline on_stage callback: persist one finished stage."""
+    details = {"duration_s": round(run.duration_s, 3), "attempts": run.attempts}
+    if isinstance(run.result, dict):
+        details["result"] = run.result
+    started = run.started_at.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    with Session(engine) as session:
+        session.add(DataJob(
+            job_name=f"{run.label}.{run.name}",
+            status="skipped" if run.skipped else "completed" if run.ok else "failed",
+            started_at=started,
+            completed_at=started + dt.timedelta(seconds=run.duration_s),
+            error_message=run.error,
+            error_details=json.dumps(details, default=str),
+            **row_counts(run.result),
+        ))
+        session.commit()
+
+
+def record_job(name: str, ok: bool, started_at: dt.datetime, finished_at: dt.datetime,
+               error: Optional[str] = None) -> None:
+    with Session(engine) as session:
+        session.add(DataJob(
+            job_name=name,
+            status="completed" if ok else "failed",
+            started_at=started_at.astimezone(dt.timezone.utc).replace(tzinfo=None),
+            completed_at=finished_at.astimezone(dt.timezone.utc).replace(tzinfo=None),
+            error_message=error,
+        ))
+        session.commit()
+
+
+def completed_since(name: str, since: dt.datetime) -> bool:
+    """True if a `name` job completed successfully at or after `since`."""
+    since = since.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    with Session(engine) as session:
+        q = (select(DataJob.id)
+             .where(DataJob.job_name == name, DataJob.status == "completed", DataJob.completed_at >= since)
+             .limit(1))
+        return session.execute(q).first() is not None
@@ -0,0 +1,246 @@
+"""
+Background runner for scheduled refreshes.
+
+Refresh stages block (requests, urllib, sync SQLAlchemy), so scheduled jobs
+never run on the API event loop: `submit()` hands them to a dedicated worker
+pool and `run()` lets an async caller (APScheduler's AsyncIOScheduler) await
+the result without holding the loop. Every job's progress (status and the
+outcome of each pipeline stage) is kept in a small in-memory registry served
+by GET /api/admin/jobs.
+
+Jobs are single-flight. Inside a process, submitting a job while the same
+job is queued or running joins it (same progress record, same Future).
+Across processes, a job runs only while holding its Postgres advisory lock
+(app.services.job_lock). A process that finds the lock taken waits for it
+(status "waiting", up to JOB_LOCK_WAIT_S) without holding a pool worker: it
+retries every JOB_LOCK_POLL_S from a timer, and once it gets the lock applies
+the dedup check:
+if the other process completed the job within JOB_DEDUP_S, this occurrence
+is skipped with that run as its outcome, so a second trigger joins the
+in-flight run instead of repeating it. The result itself stays in the other
+process. `force=True` skips the dedup check but still honours the lock.
+"""
+import asyncio
+import datetime as dt
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.logging import logger
+from app.services import job_log
+from app.services.job_lock import advisory_lock
+from app.services.pipeline import OnStage, StageRun
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "50"))  # finished jobs kept in the registry
+# A completed run this recent (in any process) makes a new occurrence a no-op
+JOB_DEDUP_S = float(os.getenv("JOB_DEDUP_S", "300"))
+# How long an occurrence waits for the same job running in another process
+JOB_LOCK_WAIT_S = float(os.getenv("JOB_LOCK_WAIT_S", "3600"))
+JOB_LOCK_POLL_S = float(os.getenv("JOB_LOCK_POLL_S", "15"))
+
+
+@dataclass
+class JobProgress:
+    id: str
+    name: str
+    status: str = "queued"  # queued | waiting | running | done | failed | skipped
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    stages: Dict[str, dict] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        with _lock:
+            d = asdict(self)
+        end = self.finished_at or time.time()
+        d["elapsed_s"] = round(end - self.started_at, 1) if self.started_at else None
+        return d
+
+
+_lock = threading.Lock()
+_jobs: "OrderedDict[str, JobProgress]" = OrderedDict()
+_inflight: Dict[str, Tuple[JobProgress, Future]] = {}  # job name -> queued/running job
+_ids = itertools.count(1)
+_local = threading.local()
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+def _prune() -> None:
+    finished = [j.id for j in _jobs.values() if j.finished_at is not None]
+    for job_id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+        del _jobs[job_id]
+
+
+def _skip(job: JobProgress, reason: str) -> None:
+    with _lock:
+        job.status, job.error, job.finished_at = "skipped", reason, time.time()
+    logger.info(f"[jobs] {job.name} ({job.id}) skipped: {reason}")
+
+
+def _record(job: JobProgress, ok: bool, started: dt.datetime, error: Optional[str] = None) -> None:
+    try:
+        job_log.record_job(job.name, ok, started, dt.datetime.now(dt.timezone.utc), error)
+    except Exception as e:  # bookkeeping must never fail the job
+        logger.warning(f"[jobs] could not record {job.id} in data_jobs: {e}")
+
+
+def _recently_completed(job: JobProgress) -> bool:
+    since = dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=JOB_DEDUP_S)
+    try:
+        return job_log.completed_since(job.name, since)
+    except Exception as e:
+        logger.warning(f"[jobs] dedup check for {job.id} failed, running anyway: {e}")
+        return False
+
+
+def _execute(job: JobProgress, fn: Callable, args: tuple, kwargs: dict) -> Any:
+    started = dt.datetime.now(dt.timezone.utc)
+    with _lock:
+        job.status, job.started_at = "running", time.time()
+    _local.job = job
+    logger.info(f"[jobs] {job.name} ({job.id}) started")
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        with _lock:
+            job.status, job.error, job.finished_at = "failed", str(e), time.time()
+        logger.error(f"[jobs] {job.name} ({job.id}) failed: {e}")
+        _record(job, False, started, str(e))
+        raise
+    finally:
+        _local.job = None
+    with _lock:
+        job.status, job.finished_at = "done", time.time()
+    logger.info(f"[jobs] {job.name} ({job.id}) done in {job.finished_at - job.started_at:.0f}s")
+    _record(job, True, started)
+    return result
+
+
+def _finish(job: JobProgress, fut: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+    with _lock:
+        if _inflight.get(job.name, (None,))[0] is job:
+            del _inflight[job.name]
+    if fut.done():  # already settled before the lock was released
+        return
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(result)
+
+
+def _run(job: JobProgress, fn: Callable, args: tuple, kwargs: dict, force: bool,
+         fut: Future, give_up: float) -> None:
+    """
+    One attempt on the pool: run the job if this process gets the lock,
+    otherwise re-queue the attempt after JOB_LOCK_POLL_S from a timer, so
+    the wait never holds a pool worker.
+    """
+    try:
+        with advisory_lock(job.name) as leader:
+            if leader:
+                if not force and JOB_DEDUP_S > 0 and _recently_completed(job):
+                    _skip(job, f"completed by another process within the last {JOB_DEDUP_S:.0f}s")
+                    result = None
+                else:
+                    result = _execute(job, fn, args, kwargs)
+                _finish(job, fut, result)
+                return
+        if time.monotonic() >= give_up:
+            _skip(job, f"still running in another process after {JOB_LOCK_WAIT_S:.0f}s")
+            _finish(job, fut)
+            return
+        with _lock:
+            job.status = "waiting"
+        timer = threading.Timer(JOB_LOCK_POLL_S, _executor.submit,
+                                (_run, job, fn, args, kwargs, force, fut, give_up))
+        timer.daemon = True
+        timer.start()
+    except Exception as e:
+        if job.finished_at is None:  # could not take the lock, rather than the job itself failing
+            with _lock:
+                job.status, job.error, job.finished_at = "failed", str(e), time.time()
+            logger.error(f"[jobs] {job.name} ({job.id}) could not run: {e}")
+        _finish(job, fut, error=e)
+
+
+def submit(name: str, fn: Callable, *args, force: bool = False, **kwargs) -> Tuple[JobProgress, Future]:
+    """
+    Queue `fn(*args, **kwargs)` on the job pool; returns its progress record
+    and Future. If a job with this name is already queued or running in this
+    process, that job is returned instead (its Future resolves to its result).
+    """
+    with _lock:
+        inflight = _inflight.get(name)
+        if inflight is not None:
+            logger.info(f"[jobs] {name}: joining in-flight {inflight[0].id}")
+            return inflight
+        job = JobProgress(id=f"{name}-{next(_ids)}", name=name)
+        _jobs[job.id] = job
+        _prune()
+        fut: Future = Future()
+        _inflight[name] = (job, fut)
+    _executor.submit(_run, job, fn, args, kwargs, force, fut, time.monotonic() + JOB_LOCK_WAIT_S)
+    return job, fut
+
+
+async def run(name: str, fn: Callable, *args, force: bool = False, **kwargs) -> Any:
+    """Run a blocking job on the pool (or join it) and await it without blocking the event loop."""
+    _, fut = submit(name, fn, *args, force=force, **kwargs)
+    return await asyncio.wrap_future(fut)
+
+
+def current() -> Optional[JobProgress]:
+    """The job running on this thread, if any."""
+    return getattr(_local, "job", None)
+
+
+def plan(stage_names: Iterable[str]) -> None:
+    """Register the stages the current job is about to run (shown as pending)."""
+    job = current()
+    if job is None:
+        return
+    with _lock:
+        for name in stage_names:
+            job.stages.setdefault(name, {"status": "pending"})
+
+
+def on_stage(persist: Optional[OnStage] = None) -> OnStage:
+    """
+    Pipeline on_stage callback bound to the current job: records the stage in
+    the job's progress, then hands it to `persist` (e.g. job_log.record_stage).
+    Create it on the job thread; pipelines call it from their own workers.
+    """
+    job = current()
+
+    def callback(run: StageRun) -> None:
+        if job is not None:
+            with _lock:
+                job.stages[run.name] = {
+                    "status": "skipped" if run.skipped else "done" if run.ok else "failed",
+                    "duration_s": round(run.duration_s, 1),
+                    "attempts": run.attempts,
+                    "error": run.error,
+                }
+        if persist is not None:
+            persist(run)
+
+    return callback
+
+
+def list_jobs() -> List[dict]:
+    with _lock:
+        jobs = list(_jobs.values())
+    return [j.as_dict() for j in reversed(jobs)]
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    with _lock:
+        job = _jobs.get(job_id)
+    return job.as_dict() if job else None
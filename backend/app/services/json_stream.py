@@ -0,0 +1,145 @@
+"""
+Incremental JSON parsing for large provider payloads.
+
+`iter_json_items` yields the elements of one JSON array (top-level, or the
+value of a top-level key such as Sportmonks' "data") as they are decoded from
+a stream of byte chunks, so only one element is held in memory at a time.
+Everything around the array (pagination, rate_limit, ...) can be collected
+into `envelope` once the array has been consumed.
+"""
+import codecs
+import json
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Optional
+
+_WS = " \t\r\n"
+
+
+class _Reader:
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.eof = False
+
+    def more(self) -> bool:
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+        if not self.eof:
+            self.eof = True
+            self.buf += self._decoder.decode(b"", final=True)
+        return False
+
+    def rest(self) -> str:
+        while self.more():
+            pass
+        return self.buf
+
+
+def _find_array(r: _Reader, key: Optional[str]) -> str:
+    """Advance to just past the target array's '['; returns the text before it."""
+    if key is None:
+        while not r.buf.lstrip(_WS) and r.more():
+            pass
+        text = r.buf.lstrip(_WS)
+        if not text.startswith("["):
+            raise ValueError("expected a JSON array")
+        r.buf = text[1:]
+        return ""
+
+    # Scan the top-level object for `"key": [`, tracking strings and nesting
+    prefix = []
+    depth, in_str, esc, start, last_str, pending = 0, False, False, 0, None, None
+    i = 0
+    while True:
+        if i >= len(r.buf):
+            if not r.more():
+                raise ValueError(f"key {key!r} with an array value not found")
+            continue
+        c = r.buf[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif c == "\\":
+                esc = True
+            elif c == '"':
+                in_str = False
+                if depth == 1:
+                    last_str = json.loads(r.buf[start:i + 1])
+        elif c == '"':
+            in_str, start = True, i
+        elif c == ":" and depth == 1:
+            pending = last_str
+        elif c == "," and depth == 1:
+            pending = None
+        elif c in "{[":
+            if c == "[" and depth == 1 and pending == key:
+                prefix.append(r.buf[:i])
+                r.buf = r.buf[i + 1:]
+                return "".join(prefix)
+            depth += 1
+        elif c in "}]":
+            depth -= 1
+        i += 1
+        if not in_str and i > 4096:
+            # keep the scanned head out of the working buffer
+            prefix.append(r.buf[:i])
+            r.buf, i = r.buf[i:], 0
+
+
+def iter_json_items(chunks: Iterable[bytes], key: Optional[str] = None,
+                    envelope: Optional[dict] = None) -> Iterator[Any]:
+    """
+    Yield the items of the JSON array at the top level (key=None) or under the
+    top-level `key`. When `envelope` is given it is filled, after the last
+    item, with the rest of the document (the array itself replaced by None).
+    """
+    decoder = json.JSONDecoder()
+    r = _Reader(chunks)
+    prefix = _find_array(r, key)
+
+    pos = 0
+    while True:
+        while pos < len(r.buf) and (r.buf[pos] in _WS or r.buf[pos] == ","):
+            pos += 1
+        if pos >= len(r.buf):
+            r.buf, pos = "", 0
+            if not r.more():
+                raise ValueError("unterminated JSON array")
+            continue
+        if r.buf[pos] == "]":
+            break
+        try:
+            item, end = decoder.raw_decode(r.buf, pos)
+        except json.JSONDecodeError:
+            end = None
+        # a number cut at the chunk boundary decodes "successfully" from its prefix
+        # ("1." of "1.5", "3e" of "3e10"): accept it only once a delimiter follows
+        if end is not None and end < len(r.buf) and r.buf[end] not in _WS + ",]":
+            end = None
+        if end is None or end >= len(r.buf):
+            r.buf, pos = r.buf[pos:], 0
+            if not r.more():
+                raise ValueError("unterminated JSON array")
+            continue
+        yield item
+        r.buf, pos = r.buf[end:], 0
+
+    if envelope is not None:
+        r.buf = r.buf[pos + 1:]
+        doc = json.loads(f"{prefix}null{r.rest()}") if key is not None else None
+        if isinstance(doc, dict):
+            envelope.update(doc)
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Group an iterable into lists of at most `size` items."""
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
@@ -3,10 +3,13 @@ The Odds API Provider - handles all interactions with The Odds API
 """
 import os
 import requests
-import time
 import logging
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 from datetime import datetime, timedelta
+
+from app.services.http_cache import http_cache
+from app.services.json_stream import iter_json_items
+from app.services.rate_limit import call_with_limit, get_limiter
 import math
 
 logger = logging.getLogger(__name__)
@@ -22,8 +25,8 @@ class OddsProvider:
             raise ValueError("ODDS_API_KEY environment variable is required")
         
         self.base_url = "https://api.the-odds-api.com/v4/sports"
-        self.rate_limit = int(os.getenv("ODDS_API_REQUESTS_PER_MINUTE", "500"))
-        self.last_request_time = 0
+        # Shared per-provider budget (see app/services/rate_limit.py)
+        self.limiter = get_limiter("odds_api")
         self.session = requests.Session()
         
         # Set headers
@@ -32,21 +35,8 @@ class OddsProvider:
             'Accept': 'application/json',
         })
     
-    def _rate_limit_wait(self):
-        """Ensure we don't exceed rate limits"""
-        time_since_last = time.time() - self.last_request_time
-        min_interval = 60 / self.rate_limit  # seconds between requests
-        
-        if time_since_last < min_interval:
-            wait_time = min_interval - time_since_last
-            time.sleep(wait_time)
-        
-        self.last_request_time = time.time()
-    
     def _make_request(self, endpoint: str, params: dict = None) -> dict:
         """Make a request to The Odds API with error handling"""
-        self._rate_limit_wait()
-        
         if params is None:
             params = {}
         
@@ -54,11 +44,14 @@ class OddsProvider:
         url = f"{self.base_url}/{endpoint}"
         
         try:
-            response = self.session.get(url, params=params, timeout=30)
+            response = call_with_limit(
+                self.limiter,
+                lambda: http_cache.get(url, params=params, session=self.session, timeout=30),
+            )
             response.raise_for_status()
             
             data = response.json()
-            logger.debug(f"Odds API request successful: {endpoint}")
+            logger.debug(f"Odds API request successful: {endpoint} (remaining quota: {self.limiter.remaining})")
             return data
             
         except requests.exceptions.RequestException as e:
@@ -68,6 +61,33 @@ class OddsProvider:
             logger.error(f"Invalid JSON response from {endpoint}: {e}")
             raise
     
+    def _iter_request(self, endpoint: str, params: dict = None) -> Iterator[dict]:
+        """
+        Like _make_request for endpoints returning a JSON array, but the body is
+        spooled to the HTTP cache on disk and its items are yielded one at a time
+        """
+        if params is None:
+            params = {}
+        
+        params['apiKey'] = self.api_key
+        url = f"{self.base_url}/{endpoint}"
+        
+        try:
+            response = call_with_limit(
+                self.limiter,
+                lambda: http_cache.get(url, params=params, session=self.session, timeout=30, stream=True),
+            )
+            response.raise_for_status()
+            logger.debug(f"Odds API request successful: {endpoint} (remaining quota: {self.limiter.remaining})")
+            yield from iter_json_items(response.iter_content())
+            
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Odds API request failed for {endpoint}: {e}")
+            raise
+        except ValueError as e:
+            logger.error(f"Invalid JSON response from {endpoint}: {e}")
+            raise
+    
     def get_sports(self) -> List[dict]:
         """Get all available sports"""
         logger.info("Fetching available sports...")
@@ -100,6 +120,10 @@ class OddsProvider:
             commence_time_from: Start time (ISO format)
             commence_time_to: End time (ISO format)
         """
+        return list(self.iter_historical_odds(commence_time_from, commence_time_to))
+    
+    def iter_historical_odds(self, commence_time_from: str, commence_time_to: str = None) -> Iterator[dict]:
+        """Stream historical odds events one at a time (see get_historical_odds)"""
         logger.info(f"Fetching historical odds from {commence_time_from}")
         
         params = {
@@ -113,7 +137,7 @@ class OddsProvider:
         if commence_time_to:
             params['commenceTimeTo'] = commence_time_to
         
-        return self._make_request("soccer_epl/odds-history", params)
+        return self._iter_request("soccer_epl/odds-history", params)
     
     def get_player_props(self, event_id: str = None) -> List[dict]:
         """
@@ -216,8 +240,14 @@ class OddsDataProcessor:
     @staticmethod
     def process_match_odds(odds_data: List[dict]) -> List[dict]:
         """Process match odds data from The Odds API"""
-        processed_odds = []
+        processed_odds = list(OddsDataProcessor.iter_match_odds(odds_data))
         
+        logger.info(f"Processed odds for {len(odds_data)} events from {len(set(o['bookmaker'] for o in processed_odds))} bookmakers")
+        return processed_odds
+    
+    @staticmethod
+    def iter_match_odds(odds_data: Iterable[dict]) -> Iterator[dict]:
+        """Yield one processed odds record per (event, bookmaker); accepts any iterable of events"""
         for event in odds_data:
             event_id = event.get("id")
             commence_time = event.get("commence_time")
@@ -235,7 +265,8 @@ class OddsDataProcessor:
                     "home_team": home_team,
                     "away_team": away_team,
                     "bookmaker": bookmaker_name,
-                    "snapshot_time": datetime.utcnow().isoformat(),
+                    # when this bookmaker's line was last updated (historical data: its real time)
+                    "snapshot_time": bookmaker.get("last_update") or datetime.utcnow().isoformat(),
                 }
                 
                 for market in bookmaker.get("markets", []):
@@ -298,10 +329,7 @@ class OddsDataProcessor:
                         poisson_params["home_lambda"]
                     )
                 
-                processed_odds.append(odds_record)
-        
-        logger.info(f"Processed odds for {len(odds_data)} events from {len(set(o['bookmaker'] for o in processed_odds))} bookmakers")
-        return processed_odds
+                yield odds_record
     
     @staticmethod
     def process_player_odds(odds_data: List[dict]) -> List[dict]:
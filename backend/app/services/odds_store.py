@@ -0,0 +1,188 @@
+"""
+Odds time series with change-only writes.
+
+`match_odds` gets a row for an (event, bookmaker) only when its prices move,
+stamped with the time the new line became valid. `match_odds_latest` keeps the
+current line per (event, bookmaker), so reading current odds costs
+O(fixtures x bookmakers) however long the history is. `record_snapshot`
+compares a refresh against the latest table in one read and writes only the
+difference. `record_history` backfills old lines into `match_odds` at their
+own snapshot times and never touches the latest table. Writers call
+`ensure_tables` first, so databases created before the latest table existed
+get it (and the history index) on their next run.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models import MatchOdds, MatchOddsLatest
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = (
+    "home_win", "draw", "away_win",
+    "over_2_5", "under_2_5", "over_1_5", "under_1_5",
+    "btts_yes", "btts_no",
+)
+DERIVED_FIELDS = ("prob_home", "prob_away", "prob_draw", "home_lambda", "away_lambda")
+MARKETS = "h2h,totals,btts"
+
+
+def ensure_tables(bind) -> None:
+    """Create match_odds_latest and the match_odds lookup index where they are missing"""
+    MatchOddsLatest.__table__.create(bind, checkfirst=True)
+    for ix in MatchOdds.__table__.indexes:
+        ix.create(bind, checkfirst=True)
+
+
+def _prices(values) -> tuple:
+    # NUMERIC(6,2) reads back as Decimal; compare at stored precision
+    out = []
+    for f in PRICE_FIELDS:
+        v = values[f] if isinstance(values, dict) else getattr(values, f)
+        out.append(None if v is None else round(float(v), 2))
+    return tuple(out)
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def record_snapshot(session: Session, records: Iterable[dict], snapshot_time: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Store one odds refresh (OddsDataProcessor.iter_match_odds output).
+    New (event, bookmaker) pairs and pairs whose prices moved get a history
+    row and a fresh latest row; unchanged pairs only have checked_at bumped.
+    """
+    now = snapshot_time or datetime.utcnow()
+    incoming: Dict[tuple, dict] = {}
+    for rec in records:
+        if rec.get("event_id") and rec.get("bookmaker"):
+            incoming[(rec["event_id"], rec["bookmaker"])] = rec  # last one wins within a refresh
+    if not incoming:
+        return {"new": 0, "changed": 0, "unchanged": 0}
+
+    event_ids = sorted({event_id for event_id, _ in incoming})
+    cols = [getattr(MatchOddsLatest, f) for f in PRICE_FIELDS]
+    latest = {
+        (row.event_id, row.bookmaker): row
+        for row in session.execute(
+            select(MatchOddsLatest.id, MatchOddsLatest.event_id, MatchOddsLatest.bookmaker, *cols)
+            .where(MatchOddsLatest.event_id.in_(event_ids))
+        )
+    }
+
+    history: List[dict] = []
+    inserts: List[dict] = []
+    updates: List[dict] = []
+    unchanged: List[int] = []
+    for (event_id, bookmaker), rec in incoming.items():
+        values = {f: rec.get(f) for f in PRICE_FIELDS + DERIVED_FIELDS}
+        cur = latest.get((event_id, bookmaker))
+        if cur is not None and _prices(cur) == _prices(values):
+            unchanged.append(cur.id)
+            continue
+
+        history.append(dict(values, event_id=event_id, bookmaker=bookmaker, market=MARKETS,
+                            fixture_id=rec.get("fixture_id"), snapshot_time=now))
+        row = dict(values, event_id=event_id, bookmaker=bookmaker,
+                   commence_time=_parse_time(rec.get("commence_time")), valid_from=now, checked_at=now)
+        if rec.get("fixture_id") is not None:
+            row["fixture_id"] = rec["fixture_id"]
+        if cur is None:
+            inserts.append(row)
+        else:
+            updates.append(dict(row, id=cur.id))
+
+    if history:
+        session.execute(insert(MatchOdds), history)
+    if inserts:
+        session.execute(insert(MatchOddsLatest), inserts)
+    if updates:
+        session.execute(update(MatchOddsLatest), updates)  # bulk UPDATE by primary key
+    if unchanged:
+        session.execute(
+            update(MatchOddsLatest).where(MatchOddsLatest.id.in_(unchanged)).values(checked_at=now)
+        )
+    session.commit()
+
+    stats = {"new": len(inserts), "changed": len(updates), "unchanged": len(unchanged)}
+    logger.info(f"Odds snapshot stored: {stats}")
+    return stats
+
+
+def record_history(session: Session, records: Iterable[dict]) -> Dict[str, int]:
+    """
+    Backfill historical lines (iter_match_odds output of the odds-history
+    endpoint) into `match_odds`, stamped with each record's snapshot_time.
+    A line is stored only if its prices differ from the line before it in
+    time, counting rows already stored, so reruns add nothing.
+    """
+    incoming: Dict[tuple, dict] = {}
+    skipped = 0
+    for rec in records:
+        when = _parse_time(rec.get("snapshot_time"))
+        if not (rec.get("event_id") and rec.get("bookmaker")) or when is None:
+            skipped += 1
+            continue
+        incoming[(rec["event_id"], rec["bookmaker"], when)] = rec
+    if not incoming:
+        return {"inserted": 0, "unchanged": 0, "skipped": skipped}
+
+    event_ids = sorted({event_id for event_id, _, _ in incoming})
+    series: Dict[tuple, dict] = {}
+    for row in session.execute(
+        select(MatchOdds.event_id, MatchOdds.bookmaker, MatchOdds.snapshot_time,
+               *[getattr(MatchOdds, f) for f in PRICE_FIELDS])
+        .where(MatchOdds.event_id.in_(event_ids))
+    ):
+        series.setdefault((row.event_id, row.bookmaker), {})[row.snapshot_time] = (_prices(row), None)
+    for (event_id, bookmaker, when), rec in incoming.items():
+        stored = series.setdefault((event_id, bookmaker), {})
+        if when not in stored:  # an identical timestamp is already stored
+            stored[when] = (_prices({f: rec.get(f) for f in PRICE_FIELDS}), rec)
+
+    history: List[dict] = []
+    for (event_id, bookmaker), points in series.items():
+        prev = None
+        for when in sorted(points):
+            prices, rec = points[when]
+            if rec is not None and prices != prev:
+                history.append(dict({f: rec.get(f) for f in PRICE_FIELDS + DERIVED_FIELDS},
+                                    event_id=event_id, bookmaker=bookmaker, market=MARKETS,
+                                    fixture_id=rec.get("fixture_id"), snapshot_time=when))
+            prev = prices
+    if history:
+        session.execute(insert(MatchOdds), history)
+    session.commit()
+
+    stats = {"inserted": len(history), "unchanged": len(incoming) - len(history), "skipped": skipped}
+    logger.info(f"Odds history backfilled: {stats}")
+    return stats
+
+
+def latest_odds(session: Session, fixture_ids: Optional[Iterable[int]] = None,
+                event_ids: Optional[Iterable[str]] = None) -> List[MatchOddsLatest]:
+    """Current line per bookmaker, optionally restricted to some fixtures / events"""
+    q = select(MatchOddsLatest)
+    if fixture_ids is not None:
+        q = q.where(MatchOddsLatest.fixture_id.in_(list(fixture_ids)))
+    if event_ids is not None:
+        q = q.where(MatchOddsLatest.event_id.in_(list(event_ids)))
+    return list(session.scalars(q))
+
+
+def odds_history(session: Session, event_id: str, bookmaker: Optional[str] = None) -> List[MatchOdds]:
+    """Price changes for an event, oldest first"""
+    q = select(MatchOdds).where(MatchOdds.event_id == event_id)
+    if bookmaker is not None:
+        q = q.where(MatchOdds.bookmaker == bookmaker)
+    return list(session.scalars(q.order_by(MatchOdds.bookmaker, MatchOdds.snapshot_time)))
@@ -0,0 +1,67 @@
+from fastapi import HTTPException
+from typing import List, Dict, Optional
+from sqlmodel import Session, select
+from app.models.player import Player
+from app.services.ep_prefix import get_ep_prefix
+from ortools.linear_solver import pywraplp
+
+def build_squad(session: Session, gw_start: int = 1, horizon: int = 6, budget: float = 100.0,
+                time_limit_s: Optional[float] = None):
+    ep_map: Dict[int, float] = get_ep_prefix(session).window_map(gw_start, gw_start + horizon - 1)
+
+    players: List[Player] = session.exec(select(Player)).all()
+    # the prefix table has an entry for every player even where no EP was computed
+    if not players or not any(ep_map.values()):
+        raise HTTPException(status_code=400, detail="No players/EP available. Ingest and compute EP first.")
+
+    solver = pywraplp.Solver.CreateSolver("SCIP")
+    if time_limit_s is not None:
+        solver.SetTimeLimit(max(1, int(time_limit_s * 1000)))
+    x = {p.fpl_element_id: solver.BoolVar(f"x_{p.fpl_element_id}") for p in players}
+
+    solver.Add(sum(x[p.fpl_element_id] for p in players) == 15)
+    solver.Add(sum(x[p.fpl_element_id] for p in players if p.element_type == 1) == 2)
+    solver.Add(sum(x[p.fpl_element_id] for p in players if p.element_type == 2) == 5)
+    solver.Add(sum(x[p.fpl_element_id] for p in players if p.element_type == 3) == 5)
+    solver.Add(sum(x[p.fpl_element_id] for p in players if p.element_type == 4) == 3)
+
+    solver.Add(sum((p.now_cost/10.0) * x[p.fpl_element_id] for p in players) <= budget)
+
+    teams: Dict[int, list[int]] = {}
+    for p in players:
+        teams.setdefault(p.team_id, []).append(p.fpl_element_id)
+    for team_id, ids in teams.items():
+        solver.Add(sum(x[i] for i in ids) <= 3)
+
+    objective = solver.Objective()
+    for p in players:
+        objective.SetCoefficient(x[p.fpl_element_id], ep_map.get(p.fpl_element_id, 0.0))
+    objective.SetMaximization()
+
+    status = solver.Solve()
+    # With a time limit the best incumbent (FEASIBLE) is an acceptable answer
+    ok = (pywraplp.Solver.OPTIMAL,) if time_limit_s is None else (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE)
+    if status not in ok:
+        raise HTTPException(status_code=500, detail="Optimization failed")
+
+    chosen = [p for p in players if x[p.fpl_element_id].solution_value() > 0.5]
+    total_ep = sum(ep_map.get(p.fpl_element_id, 0.0) for p in chosen)
+    total_cost = sum(p.now_cost/10.0 for p in chosen)
+    return {
+        "horizon": horizon,
+        "gw_start": gw_start,
+        "optimal": status == pywraplp.Solver.OPTIMAL,
+        "total_ep": round(total_ep, 2),
+        "total_cost": round(total_cost, 1),
+        "players": [
+            {
+                "id": p.fpl_element_id,
+                "name": f"{p.first_name} {p.second_name}",
+                "web_name": p.web_name,
+                "pos": p.element_type,
+                "team_id": p.team_id,
+                "cost": p.now_cost/10.0,
+                "ep_sum": round(ep_map.get(p.fpl_element_id, 0.0), 2)
+            } for p in chosen
+        ]
+    }
@@ -0,0 +1,218 @@
+"""
+Stage runners for refresh pipelines.
+
+`run_with_budget` plans against a wall-clock budget: critical stages always
+run, in order, before anything optional. Optional stages (enrichments) only
+start if the time left covers their expected duration, which is the last
+observed run time for that stage or the declared estimate.
+
+`run_dag` runs stages as soon as their `deps` have succeeded, independent ones
+concurrently in a thread pool. A stage that still fails after its retries only
+takes down the stages that depend on it.
+
+Both report every finished or skipped stage to an optional
+`on_stage(StageRun)` callback (see app.services.job_log.record_stage); a
+skipped stage has `skipped=True` and the reason in `error`.
+"""
+import datetime as dt
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.logging import logger
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+
+# last observed duration per stage name (seconds), used to plan the next run
+_observed: Dict[str, float] = {}
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[], Any]
+    critical: bool = True
+    estimate_s: float = 60.0
+    deps: Tuple[str, ...] = ()
+    retries: int = 0
+    retry_delay_s: float = 10.0
+
+    def expected_s(self) -> float:
+        return _observed.get(self.name, self.estimate_s)
+
+
+@dataclass
+class PipelineReport:
+    label: str
+    budget_s: float
+    ran: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    durations: Dict[str, float] = field(default_factory=dict)
+    results: Dict[str, Any] = field(default_factory=dict)
+    elapsed_s: float = 0.0
+
+
+@dataclass
+class StageRun:
+    label: str
+    name: str
+    ok: bool
+    started_at: dt.datetime  # UTC
+    duration_s: float
+    attempts: int
+    result: Any = None
+    error: Optional[str] = None
+    skipped: bool = False
+
+
+OnStage = Callable[[StageRun], None]
+
+# report fields are written from the DAG's worker threads
+_report_lock = threading.Lock()
+
+
+def _notify(report: PipelineReport, run: StageRun, on_stage: Optional[OnStage]) -> None:
+    if on_stage is None:
+        return
+    try:
+        on_stage(run)
+    except Exception as e:  # bookkeeping must never fail the pipeline
+        logger.warning(f"[{report.label}] could not record stage {run.name}: {e}")
+
+
+def _skip_stage(stage: Stage, report: PipelineReport, reason: str, on_stage: Optional[OnStage]) -> None:
+    with _report_lock:
+        report.skipped.append(stage.name)
+    logger.warning(f"[{report.label}] skipping stage {stage.name}: {reason}")
+    _notify(report, StageRun(report.label, stage.name, False, dt.datetime.now(dt.timezone.utc), 0.0, 0,
+                             error=f"skipped: {reason}", skipped=True), on_stage)
+
+
+def _run_stage(stage: Stage, report: PipelineReport, on_stage: Optional[OnStage] = None) -> None:
+    started_at = dt.datetime.now(dt.timezone.utc)
+    t0 = time.monotonic()
+    result, error, attempts = None, None, 0
+    while True:
+        attempts += 1
+        try:
+            result, error = stage.fn(), None
+            break
+        except Exception as e:
+            error = str(e)
+            if attempts > stage.retries:
+                logger.error(f"[{report.label}] stage {stage.name} failed: {e}")
+                break
+            delay = stage.retry_delay_s * attempts
+            logger.warning(f"[{report.label}] stage {stage.name} failed ({e}), retry {attempts}/{stage.retries} in {delay:.0f}s")
+            time.sleep(delay)
+
+    took = time.monotonic() - t0
+    with _report_lock:
+        if error is None:
+            report.results[stage.name] = result
+            report.ran.append(stage.name)
+        else:
+            report.failed[stage.name] = error
+        report.durations[stage.name] = took
+        _observed[stage.name] = took
+
+    _notify(report, StageRun(report.label, stage.name, error is None, started_at, took, attempts, result, error),
+            on_stage)
+
+
+def run_with_budget(stages: List[Stage], budget_s: float, label: str = "pipeline",
+                    deadline: Optional[float] = None, on_stage: Optional[OnStage] = None) -> PipelineReport:
+    """
+    Run critical stages first (always), then optional stages while time remains.
+    `deadline` is a time.monotonic() value; it defaults to now + budget_s.
+    """
+    start = time.monotonic()
+    deadline = deadline if deadline is not None else start + budget_s
+    report = PipelineReport(label=label, budget_s=budget_s)
+
+    ordered = [s for s in stages if s.critical] + [s for s in stages if not s.critical]
+    for stage in ordered:
+        remaining = deadline - time.monotonic()
+        if not stage.critical and remaining < stage.expected_s():
+            _skip_stage(stage, report, f"optional, needs ~{stage.expected_s():.0f}s, "
+                                       f"{max(remaining, 0):.0f}s left", on_stage)
+            continue
+        if stage.critical and remaining <= 0:
+            logger.warning(f"[{label}] over budget, still running critical stage {stage.name}")
+        _run_stage(stage, report, on_stage)
+
+    report.elapsed_s = time.monotonic() - start
+    logger.info(
+        f"[{label}] done in {report.elapsed_s:.0f}s/{budget_s:.0f}s "
+        f"ran={report.ran} failed={list(report.failed)} skipped={report.skipped}"
+    )
+    return report
+
+
+def _check_graph(stages: List[Stage]) -> None:
+    names = {s.name for s in stages}
+    if len(names) != len(stages):
+        raise ValueError("duplicate stage names")
+    unknown = sorted({d for s in stages for d in s.deps if d not in names})
+    if unknown:
+        raise ValueError(f"unknown stage dependencies: {unknown}")
+    # Kahn: every stage must become ready at some point
+    indeg = {s.name: len(set(s.deps)) for s in stages}
+    ready = [n for n, d in indeg.items() if d == 0]
+    seen = 0
+    while ready:
+        n = ready.pop()
+        seen += 1
+        for s in stages:
+            if n in s.deps:
+                indeg[s.name] -= 1
+                if indeg[s.name] == 0:
+                    ready.append(s.name)
+    if seen != len(stages):
+        raise ValueError("stage dependencies contain a cycle")
+
+
+def run_dag(stages: List[Stage], label: str = "pipeline", max_workers: int = PIPELINE_WORKERS,
+            on_stage: Optional[OnStage] = None) -> PipelineReport:
+    """
+    Run each stage once all of its deps have succeeded, up to `max_workers`
+    at a time. Stages whose deps failed (or were skipped) are skipped; the
+    rest of the graph carries on. End-to-end time is the critical path.
+    """
+    _check_graph(stages)
+    start = time.monotonic()
+    report = PipelineReport(label=label, budget_s=0.0)
+    pending = {s.name: s for s in stages}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix=label) as pool:
+        while pending or running:
+            changed = True
+            while changed:  # skips cascade down the graph before anything else is started
+                changed = False
+                for name, stage in list(pending.items()):
+                    bad = [d for d in stage.deps if d in report.failed or d in report.skipped]
+                    if bad:
+                        del pending[name]
+                        _skip_stage(stage, report, f"dependency {bad[0]} did not complete", on_stage)
+                        changed = True
+                    elif all(d in report.ran for d in stage.deps):
+                        del pending[name]
+                        running[pool.submit(_run_stage, stage, report, on_stage)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                running.pop(fut)
+                fut.result()  # _run_stage handles stage errors; surface bugs in the runner itself
+
+    report.elapsed_s = time.monotonic() - start
+    logger.info(
+        f"[{label}] done in {report.elapsed_s:.0f}s "
+        f"ran={report.ran} failed={list(report.failed)} skipped={report.skipped}"
+    )
+    return report
@@ -0,0 +1,250 @@
+"""
+Token-bucket rate limiting for external fetchers.
+
+`get_limiter(name)` returns the process-wide bucket for a provider. Its state
+(tokens, back-off deadline, last seen quota) lives in a small flock-guarded
+file under RATE_LIMIT_DIR, so every script and service on the host draws from
+one budget. Buckets have async (`acquire`) and sync (`acquire_sync`) APIs;
+`call_with_limit` / `acall_with_limit` wrap a request with Retry-After aware,
+jittered back-off and remaining-quota tracking.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: buckets fall back to per-process state
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_DIR = os.getenv(
+    "RATE_LIMIT_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "cache", "ratelimit"),
+)
+# Stop calling a provider once its remaining quota drops to this many requests
+QUOTA_RESERVE = int(os.getenv("RATE_LIMIT_QUOTA_RESERVE", "0"))
+# How long to pause when a quota is exhausted and the API gives no reset time
+QUOTA_BLOCK_S = float(os.getenv("RATE_LIMIT_QUOTA_BLOCK_S", "3600"))
+
+# name -> (requests per second, burst); override with RATE_LIMIT_<NAME>_RPS / _BURST
+PROVIDER_LIMITS = {
+    "odds_api": (float(os.getenv("ODDS_API_REQUESTS_PER_MINUTE", "500")) / 60, 1),
+    "sportmonks": (float(os.getenv("SPORTMONKS_REQUESTS_PER_MINUTE", "60")) / 60, 1),
+    "understat": (5, 5),
+    "fpl": (4, 4),
+}
+
+RETRY_STATUSES = {429, 503}
+
+QUOTA_HEADERS = ("x-requests-remaining", "x-ratelimit-remaining", "ratelimit-remaining")
+RESET_HEADERS = ("x-ratelimit-reset", "ratelimit-reset")
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, up to `capacity` banked for bursts.
+
+    Callers reserve tokens up front (the balance may go negative) and then
+    sleep for however long the debt takes to refill, so concurrent callers are
+    spaced out at `rate` rather than racing each other. `block_for` pauses the
+    bucket for everyone (Retry-After, exhausted quota).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, name: str = "bucket"):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.remaining: Optional[int] = None  # last quota the provider reported
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0  # wall clock
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._blocked_until - time.time())
+
+    def _block_until(self, until: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, until)
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        # the shared state update takes a file lock and does file I/O: not on the event loop
+        wait = await asyncio.to_thread(self._reserve, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens: float = 1.0) -> None:
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def block_for(self, seconds: float) -> None:
+        if seconds > 0:
+            self._block_until(time.time() + seconds)
+
+    def note_quota(self, remaining: Optional[int], reset_in: Optional[float] = None) -> None:
+        if remaining is None:
+            return
+        self.remaining = int(remaining)
+        if self.remaining <= QUOTA_RESERVE:
+            pause = reset_in if reset_in and reset_in > 0 else QUOTA_BLOCK_S
+            logger.warning(f"[rate_limit] {self.name}: quota at {self.remaining}, pausing {pause:.1f}s")
+            self.block_for(pause)
+
+    def observe(self, status: int, headers) -> Optional[float]:
+        """
+        Record quota headers from a response. Returns the server's Retry-After
+        (seconds) for retryable statuses, else None.
+        """
+        remaining = _header_number(headers, QUOTA_HEADERS)
+        reset = _header_number(headers, RESET_HEADERS)
+        if reset is not None and reset > 1e9:  # epoch seconds rather than a delta
+            reset -= time.time()
+        self.note_quota(None if remaining is None else int(remaining), reset)
+        if status in RETRY_STATUSES:
+            return _retry_after(headers.get("retry-after"))
+        return None
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket whose state lives in RATE_LIMIT_DIR/<name>.json, shared across processes."""
+
+    def __init__(self, name: str, rate: float, capacity: Optional[float] = None, state_dir: str = RATE_LIMIT_DIR):
+        super().__init__(rate, capacity, name=name)
+        self.path = os.path.join(os.path.abspath(state_dir), f"{name}.json")
+
+    @contextmanager
+    def _state(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock, open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)  # released when the file closes
+            f.seek(0)
+            try:
+                st = json.loads(f.read() or "{}")
+            except ValueError:
+                st = {}
+            yield st
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(st))
+
+    def _reserve(self, tokens: float) -> float:
+        with self._state() as st:
+            now = time.time()
+            updated = st.get("updated", now)
+            have = min(self.capacity, st.get("tokens", self.capacity) + max(0.0, now - updated) * self.rate)
+            have -= tokens
+            st.update(tokens=have, updated=now)
+            wait = 0.0 if have >= 0 else -have / self.rate
+            return max(wait, st.get("blocked_until", 0.0) - now)
+
+    def _block_until(self, until: float) -> None:
+        with self._state() as st:
+            st["blocked_until"] = max(st.get("blocked_until", 0.0), until)
+
+    def note_quota(self, remaining: Optional[int], reset_in: Optional[float] = None) -> None:
+        super().note_quota(remaining, reset_in)
+        if remaining is not None:
+            with self._state() as st:
+                st["remaining"] = int(remaining)
+
+
+_registry: Dict[str, TokenBucket] = {}
+_registry_lock = threading.Lock()
+
+
+def get_limiter(name: str, rate: Optional[float] = None, capacity: Optional[float] = None) -> TokenBucket:
+    """
+    Process-wide bucket for `name`. Config precedence: RATE_LIMIT_<NAME>_RPS /
+    _BURST env vars, then the arguments, then PROVIDER_LIMITS. The first call
+    in a process fixes the config for that process.
+    """
+    with _registry_lock:
+        bucket = _registry.get(name)
+        if bucket is None:
+            d_rate, d_cap = PROVIDER_LIMITS.get(name, (1.0, 1.0))
+            env = name.upper()
+            rate = float(os.getenv(f"RATE_LIMIT_{env}_RPS", rate or d_rate))
+            capacity = float(os.getenv(f"RATE_LIMIT_{env}_BURST", capacity or d_cap))
+            if fcntl is not None:
+                bucket = SharedTokenBucket(name, rate, capacity)
+            else:
+                bucket = TokenBucket(rate, capacity, name=name)
+            _registry[name] = bucket
+        return bucket
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None, base: float = 1.0, cap: float = 60.0) -> float:
+    """Retry-After plus up to 1s of jitter, else exponential back-off with equal jitter."""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1.0)
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def call_with_limit(bucket: TokenBucket, fn: Callable, max_retries: int = 3):
+    """
+    Run a sync request `fn()` under `bucket`. 429/503 responses pause the whole
+    bucket (every caller sharing it) for the back-off delay and are retried.
+    """
+    for attempt in range(max_retries + 1):
+        bucket.acquire_sync()
+        resp = fn()
+        retry_after = bucket.observe(resp.status_code, resp.headers)
+        if resp.status_code not in RETRY_STATUSES or attempt == max_retries:
+            return resp
+        bucket.block_for(backoff_delay(attempt, retry_after))
+    return resp
+
+
+async def acall_with_limit(bucket: TokenBucket, fn: Callable[[], Awaitable], max_retries: int = 3):
+    """Async counterpart of call_with_limit."""
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        resp = await fn()
+        retry_after = await asyncio.to_thread(bucket.observe, resp.status_code, resp.headers)
+        if resp.status_code not in RETRY_STATUSES or attempt == max_retries:
+            return resp
+        await asyncio.to_thread(bucket.block_for, backoff_delay(attempt, retry_after))
+    return resp
+
+
+def _header_number(headers, names) -> Optional[float]:
+    for n in names:
+        v = headers.get(n)
+        if v is not None:
+            try:
+                return float(v)
+            except ValueError:
+                continue
+    return None
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:  # HTTP-date form
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -1,64 +1,161 @@
 # app/services/scheduler.py
 import os
+import time
+import asyncio
 import datetime as dt
 from zoneinfo import ZoneInfo
 
-import httpx
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlmodel import Session
+
+from app.db.session import engine
+from app.services.data.bootstrap_snapshot import get_bootstrap
+from app.services import jobs, serving_cache
+from app.services.ep_calculator import recompute_ep_range
+from app.services.job_log import record_stage
+from app.services.pipeline import Stage, StageRun, run_dag, run_with_budget
+from app.services.warmup import optimize_for_users, warm_serving_cache
 
 # We will import our loaders as modules
 from scripts import bootstrap_upsert, load_fixtures, load_player_history_vaastav
-from scripts import map_understat_ids, ingest_understat_seasons
+from scripts import map_understat_ids, ingest_understat_seasons, ingest_fbref_seasons
 
 TZ = ZoneInfo("Europe/Madrid")
 
-async def refresh_all():
+# Wall-clock budget for the pre-deadline "final answer" run, and how many GWs of EP it computes
+DEADLINE_BUDGET_S = float(os.getenv("DEADLINE_BUDGET_S", "1800"))
+DEADLINE_EP_HORIZON = int(os.getenv("DEADLINE_EP_HORIZON", "6"))
+
+_WRITE_KEYS = ("inserted", "updated", "deleted", "upserted")
+
+def _wrote_rows(result) -> bool:
+    """Conservative: a stage result that doesn't report zero writes counts as a change."""
+    if isinstance(result, bool) or result is None:
+        return True
+    if isinstance(result, int):
+        return result > 0
+    if isinstance(result, dict):
+        if result.get("payload_unchanged"):
+            return False
+        counts = [result[k] for k in _WRITE_KEYS if isinstance(result.get(k), (int, float))]
+        return any(counts) if counts else True
+    return True
+
+def record_and_bump(run: StageRun) -> None:
+    """on_stage persist callback: log the stage and, if it wrote data, start a new serving generation."""
+    record_stage(run)
+    if run.ok and _wrote_rows(run.result):
+        serving_cache.bump(f"{run.label}.{run.name}")
+
+def refresh_stages() -> list:
+    """
+    refresh_all as a dependency graph. Everything needs teams/players from the
+    bootstrap; after that fixtures, GW history and the Understat branch are
+    independent of each other.
+    """
+    # Player GW history for current season (FPL). Adjust season here if needed.
+    # If you loaded historical seasons separately, here we only keep current season up-to-date.
+    season = os.getenv("CURRENT_SEASON", "2024/25")
+    return [
+        Stage("bootstrap", bootstrap_upsert.main, retries=2),
+        Stage("fixtures", load_fixtures.main, deps=("bootstrap",), retries=2),
+        Stage("vaastav_history", lambda: load_player_history_vaastav.main(season=season), deps=("bootstrap",), retries=1),
+        Stage("understat_map", map_understat_ids.main, deps=("bootstrap",), retries=1),
+        Stage("understat_seasons", ingest_understat_seasons.main, deps=("understat_map",), retries=1),
+    ]
+
+def run_refresh_all():
     """
     Full refresh (idempotent): FPL bootstrap, fixtures, current season history,
-    Understat mapping and last few seasons ingestion.
+    Understat mapping and last few seasons ingestion. Independent stages run
+    concurrently; each stage run is recorded in data_jobs. Blocking: run it
+    through app.services.jobs, never on the event loop.
     """
     print("[scheduler] refresh_all: start")
-    # 1) FPL bootstrap (teams/players)
-    bootstrap_upsert.main()
+    stages = refresh_stages()
+    jobs.plan(s.name for s in stages)
+    report = run_dag(stages, label="refresh_all", on_stage=jobs.on_stage(record_and_bump))
+    print(f"[scheduler] refresh_all: done in {report.elapsed_s:.0f}s ran={report.ran} "
+          f"failed={list(report.failed)} skipped={report.skipped}")
+    return report
 
-    # 2) Fixtures
-    load_fixtures.main()
+async def refresh_all():
+    """Scheduler entry point: run_refresh_all on the job pool, off the API event loop."""
+    return await jobs.run("refresh_all", run_refresh_all)
 
-    # 3) Player GW history for current season (FPL). Adjust season here if needed.
+def _recompute_and_warm_rankings(gw_from: int, gw_to: int) -> int:
+    with Session(engine) as session:
+        total = recompute_ep_range(session, gw_from, gw_to)
+    warm_serving_cache(gw_from, gw_to)
+    return total
+
+def run_deadline_pipeline(next_gw: int, budget_s: float = DEADLINE_BUDGET_S, deadline: float | None = None):
+    """
+    Pre-deadline "final answer" run planned against a wall-clock budget:
+    bootstrap, fixtures, EP and per-user squads always run (in that order);
+    history and Understat/FBref enrichments only run if time remains.
+    Blocking, like run_refresh_all.
+    """
+    print(f"[scheduler] deadline_pipeline: start (GW{next_gw}, budget={budget_s:.0f}s)")
+    deadline = deadline if deadline is not None else time.monotonic() + budget_s
+    gw_to = min(next_gw + DEADLINE_EP_HORIZON - 1, 38)
     season = os.getenv("CURRENT_SEASON", "2024/25")
-    os.environ["SEASON"] = season
-    # If you loaded historical seasons separately, here we only keep current season up-to-date.
-    load_player_history_vaastav.main()
 
-    # 4) Understat mapping + last N seasons
-    map_understat_ids.main()
-    ingest_understat_seasons.main()
+    stages = [
+        Stage("bootstrap", bootstrap_upsert.main, estimate_s=30),
+        Stage("fixtures", load_fixtures.main, estimate_s=15),
+        Stage("ep", lambda: _recompute_and_warm_rankings(next_gw, gw_to), estimate_s=120),
+        Stage("optimize_users", lambda: optimize_for_users(next_gw, deadline), estimate_s=60),
+        Stage("vaastav_history", lambda: load_player_history_vaastav.main(season=season), critical=False, estimate_s=120),
+        Stage("understat_map", map_understat_ids.main, critical=False, estimate_s=120),
+        Stage("understat_seasons", ingest_understat_seasons.main, critical=False, estimate_s=600),
+        Stage("fbref_seasons", ingest_fbref_seasons.main, critical=False, estimate_s=900),
+    ]
+    jobs.plan(s.name for s in stages)
+    report = run_with_budget(stages, budget_s, label="deadline_pipeline", deadline=deadline,
+                             on_stage=jobs.on_stage(record_and_bump))
+    print(f"[scheduler] deadline_pipeline: done ran={report.ran} skipped={report.skipped} failed={list(report.failed)}")
+    return report
+
+async def deadline_pipeline(next_gw: int, budget_s: float = DEADLINE_BUDGET_S):
+    """Scheduler entry point for run_deadline_pipeline; the budget starts counting now, even if the job queues."""
+    deadline = time.monotonic() + budget_s
+    return await jobs.run("deadline_pipeline", run_deadline_pipeline, next_gw, budget_s, deadline)
+
+async def next_deadline_event() -> dict | None:
+    """
+    Use the shared FPL bootstrap snapshot to locate the next unfinished event with a deadline.
+    """
+    snap = await asyncio.to_thread(get_bootstrap)
+    data = snap.data
+    return next((e for e in data["events"] if not e.get("finished") and e.get("deadline_time")), None)
 
-    print("[scheduler] refresh_all: done")
+def _in_window(event: dict | None, hours: int = 6) -> bool:
+    if not event:
+        return False
+    dl = dt.datetime.fromisoformat(event["deadline_time"].replace("Z", "+00:00")).astimezone(TZ)
+    now = dt.datetime.now(TZ)
+    return dt.timedelta(0) <= (dl - now) <= dt.timedelta(hours=hours)
 
 async def within_burst_window() -> bool:
     """
     Use the official FPL bootstrap to locate next deadline and see if within 6h.
     """
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            r = await client.get("https://fantasy.premierleague.com/api/bootstrap-static/")
-            r.raise_for_status()
-            data = r.json()
-        next_ev = next((e for e in data["events"] if not e.get("finished") and e.get("deadline_time")), None)
-        if not next_ev:
-            return False
-        dl = dt.datetime.fromisoformat(next_ev["deadline_time"].replace("Z", "+00:00")).astimezone(TZ)
-        now = dt.datetime.now(TZ)
-        return dt.timedelta(0) <= (dl - now) <= dt.timedelta(hours=6)
+        return _in_window(await next_deadline_event())
     except Exception as e:
         print("[scheduler] within_burst_window error:", e)
         return False
 
 async def burst_job():
-    if await within_burst_window():
-        print("[scheduler] burst window active → running refresh_all()")
-        await refresh_all()
+    try:
+        next_ev = await next_deadline_event()
+    except Exception as e:
+        print("[scheduler] burst_job error:", e)
+        return
+    if _in_window(next_ev):
+        print("[scheduler] burst window active → running deadline_pipeline()")
+        await deadline_pipeline(int(next_ev["id"]))
     else:
         # no-op
         pass
@@ -0,0 +1,195 @@
+"""
+In-process cache for precomputed API responses (EP rankings, optimal squads,
+fixture and player lists).
+
+Entries are keyed by a tuple starting with the endpoint name, e.g.
+("ep_top", gw, pos) or ("optimize_squad", gw_start, horizon, budget).
+
+Every entry is stamped with the data generation it was computed from. The
+generation is shared by all processes (app.services.data_version) and bumped
+by the loaders that change what the endpoints serve (ingest_bootstrap,
+ingest_fixtures, recompute_ep_range, refresh pipeline stages that wrote rows),
+so a bump anywhere invalidates every process's entries within
+DATA_VERSION_POLL_S. A value computed before a bump but stored after it is
+never served. version() exposes the generation to HTTP clients as the basis
+of ETags (app.core.caching). SERVING_CACHE_TTL_S is only a backstop. The cache
+holds at most SERVING_CACHE_MAX entries and evicts the least recently used one
+first.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from app.core.logging import logger
+from app.services import data_version
+
+SERVING_CACHE_MAX = int(os.getenv("SERVING_CACHE_MAX", "2048"))
+SERVING_CACHE_TTL_S = float(os.getenv("SERVING_CACHE_TTL_S", "900"))  # 0 = no expiry
+
+_lock = threading.Lock()
+_entries: "OrderedDict[Hashable, Tuple[int, float, Any]]" = OrderedDict()  # key -> (generation, stored_at, value)
+_generation = 0
+# False until the shared generation has been read, or after a bump that could not
+# reach it; version() then falls back to a per-process value
+_shared = False
+_BOOT = f"{os.getpid():x}{time.time_ns():x}"
+_hits: Dict[str, int] = {}
+_misses: Dict[str, int] = {}
+_evictions = 0
+
+
+def _endpoint(key: Hashable) -> str:
+    return str(key[0]) if isinstance(key, tuple) and key else str(key)
+
+
+def _sync() -> None:
+    """Follow the shared generation; entries from an older one are dropped."""
+    global _generation, _shared
+    shared = data_version.current()
+    if shared is None:
+        return
+    with _lock:
+        if shared != _generation:
+            _generation = shared
+            _entries.clear()
+        _shared = True
+
+
+def generation() -> int:
+    _sync()
+    with _lock:
+        return _generation
+
+
+def version() -> str:
+    """
+    Opaque version of the data being served, for HTTP validators (ETags).
+    Identical across processes while they serve the same shared generation;
+    per-process if the shared one is unavailable, so no two processes ever
+    claim the same version for different data.
+    """
+    _sync()
+    with _lock:
+        return str(_generation) if _shared else f"{_BOOT}.{_generation}"
+
+
+def bump(reason: str = "") -> int:
+    """Start a new data generation everywhere: every cached entry becomes stale. Returns the new generation."""
+    global _generation, _shared
+    try:
+        shared = data_version.bump()
+    except Exception as e:
+        logger.warning(f"[serving_cache] could not bump the shared generation, local only: {e}")
+        shared = None
+    with _lock:
+        if shared is None:
+            _generation, _shared = _generation + 1, False
+        else:
+            _generation, _shared = shared, True
+        dropped = len(_entries)
+        _entries.clear()
+        gen = _generation
+    logger.info(f"[serving_cache] generation {gen}{f' ({reason})' if reason else ''}: {dropped} entries dropped")
+    return gen
+
+
+def _fresh(entry: Tuple[int, float, Any], now: float) -> bool:
+    gen, stored_at, _ = entry
+    return gen == _generation and (SERVING_CACHE_TTL_S <= 0 or now - stored_at < SERVING_CACHE_TTL_S)
+
+
+def get(key: Hashable) -> Optional[Any]:
+    _sync()
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        name = _endpoint(key)
+        if entry is not None:
+            if _fresh(entry, now):
+                _entries.move_to_end(key)
+                _hits[name] = _hits.get(name, 0) + 1
+                return entry[2]
+            del _entries[key]
+        _misses[name] = _misses.get(name, 0) + 1
+        return None
+
+
+def peek(key: Hashable) -> Optional[Any]:
+    """Like get() but without counting a hit/miss or touching LRU order."""
+    _sync()
+    with _lock:
+        entry = _entries.get(key)
+        return entry[2] if entry is not None and _fresh(entry, time.monotonic()) else None
+
+
+def contains(key: Hashable) -> bool:
+    """Like get() but without counting a hit/miss or touching LRU order (for warm-up)."""
+    _sync()
+    with _lock:
+        entry = _entries.get(key)
+        return entry is not None and _fresh(entry, time.monotonic())
+
+
+def _store(key: Hashable, value: Any, gen: Optional[int], now: float) -> None:
+    global _evictions
+    if gen is not None and gen != _generation:
+        return  # computed from data that has since been replaced
+    _entries[key] = (_generation, now, value)
+    _entries.move_to_end(key)
+    while len(_entries) > SERVING_CACHE_MAX:
+        _entries.popitem(last=False)
+        _evictions += 1
+
+
+def put(key: Hashable, value: Any, gen: Optional[int] = None) -> None:
+    """
+    Store `value`. Pass the generation() read before computing it so a
+    result that raced with a bump is dropped instead of served.
+    """
+    now = time.monotonic()
+    with _lock:
+        _store(key, value, gen, now)
+
+
+def put_many(values: Dict[Hashable, Any], gen: Optional[int] = None) -> None:
+    now = time.monotonic()
+    with _lock:
+        for key, value in values.items():
+            _store(key, value, gen, now)
+
+
+def get_or_compute(key: Hashable, compute: Callable[[], Any]) -> Any:
+    """Read-through: return the cached value or compute, store and return it."""
+    value = get(key)
+    if value is None:
+        gen = generation()
+        value = compute()
+        put(key, value, gen)
+    return value
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+
+
+def size() -> int:
+    with _lock:
+        return len(_entries)
+
+
+def stats() -> dict:
+    with _lock:
+        endpoints = sorted(set(_hits) | set(_misses))
+        return {
+            "generation": _generation,
+            "size": len(_entries),
+            "max_size": SERVING_CACHE_MAX,
+            "evictions": _evictions,
+            "endpoints": {
+                name: {"hits": _hits.get(name, 0), "misses": _misses.get(name, 0)}
+                for name in endpoints
+            },
+        }
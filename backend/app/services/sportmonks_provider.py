@@ -4,11 +4,15 @@ Sportmonks API Provider - Enhanced data for feature calculations
 
 import os
 import requests
-import time
 import logging
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
 from datetime import datetime, timedelta
 
+from app.services.http_cache import http_cache
+from app.services.json_stream import iter_json_items
+from app.services.rate_limit import call_with_limit, get_limiter
+
 # Import dotenv FIRST, then use it
 try:
     from dotenv import load_dotenv
@@ -19,6 +23,34 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Pagination: page size, how many pages to keep in flight (the shared rate
+# limiter still paces the actual requests) and how long fetched pages are
+# served from the local HTTP cache without revalidation
+PER_PAGE = int(os.getenv("SPORTMONKS_PER_PAGE", "50"))
+PREFETCH_PAGES = int(os.getenv("SPORTMONKS_PREFETCH_PAGES", "4"))
+CACHE_TTL_S = float(os.getenv("SPORTMONKS_CACHE_TTL_S", "21600"))
+
+# Everything the feature pipeline reads from a fixture, fetched in the same request
+FIXTURE_INCLUDES = ("participants", "statistics.type", "events", "state")
+
+
+def merge_includes(*includes) -> str:
+    """
+    Merge include specs ("a,b", "a;b" or sequences) into one v3 include
+    parameter: ';'-separated, de-duplicated, order preserved
+    """
+    seen = []
+    for inc in includes:
+        if not inc:
+            continue
+        parts = inc.replace(",", ";").split(";") if isinstance(inc, str) else inc
+        for part in parts:
+            part = part.strip()
+            if part and part not in seen:
+                seen.append(part)
+    return ";".join(seen)
+
+
 class SportmonksProvider:
     """
     Handles Sportmonks API interactions for xG data, lineups, and historical stats
@@ -30,8 +62,8 @@ class SportmonksProvider:
             raise ValueError("SPORTMONKS_API_KEY environment variable is required")
         
         self.base_url = "https://api.sportmonks.com/v3/football"
-        self.rate_limit = 60  # requests per minute
-        self.last_request_time = 0
+        # Shared per-provider budget (see app/services/rate_limit.py)
+        self.limiter = get_limiter("sportmonks")
         self.session = requests.Session()
         
         # Set headers
@@ -42,34 +74,70 @@ class SportmonksProvider:
         
         logger.info("Sportmonks provider initialized")
     
-    def _rate_limit_wait(self):
-        """Ensure we don't exceed rate limits"""
-        time_since_last = time.time() - self.last_request_time
-        min_interval = 60 / self.rate_limit  # seconds between requests
+    def _make_request(self, endpoint: str, params: dict = None, max_age: float = None) -> dict:
+        """
+        Make a request to Sportmonks API with error handling. With `max_age`,
+        a cached response for the same endpoint and params younger than that
+        is returned without touching the API or taking a rate-limit token
+        """
+        if params is None:
+            params = {}
         
-        if time_since_last < min_interval:
-            wait_time = min_interval - time_since_last
-            time.sleep(wait_time)
+        if params.get('include'):
+            params['include'] = merge_includes(params['include'])
+        params['api_token'] = self.api_key
+        url = f"{self.base_url}/{endpoint}"
         
-        self.last_request_time = time.time()
+        try:
+            response = http_cache.fresh(url, params=params, max_age=max_age)
+            if response is None:
+                response = call_with_limit(
+                    self.limiter,
+                    lambda: http_cache.get(url, params=params, session=self.session, timeout=30, max_age=max_age),
+                )
+            response.raise_for_status()
+            
+            data = response.json()
+            # v3 reports its per-entity quota in the body rather than in headers
+            rl = data.get("rate_limit") if isinstance(data, dict) else None
+            if rl:
+                self.limiter.note_quota(rl.get("remaining"), rl.get("resets_in_seconds"))
+            logger.debug(f"Sportmonks API request successful: {endpoint}")
+            return data
+            
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Sportmonks API request failed for {endpoint}: {e}")
+            raise
+        except ValueError as e:
+            logger.error(f"Invalid JSON response from {endpoint}: {e}")
+            raise
     
-    def _make_request(self, endpoint: str, params: dict = None) -> dict:
-        """Make a request to Sportmonks API with error handling"""
-        self._rate_limit_wait()
-        
+    def _iter_data(self, endpoint: str, params: dict = None) -> Iterator[dict]:
+        """
+        Like _make_request, but the body is spooled to the HTTP cache on disk and
+        the items of its "data" array are yielded one at a time
+        """
         if params is None:
             params = {}
         
+        if params.get('include'):
+            params['include'] = merge_includes(params['include'])
         params['api_token'] = self.api_key
         url = f"{self.base_url}/{endpoint}"
         
         try:
-            response = self.session.get(url, params=params, timeout=30)
+            response = call_with_limit(
+                self.limiter,
+                lambda: http_cache.get(url, params=params, session=self.session, timeout=30, stream=True),
+            )
             response.raise_for_status()
             
-            data = response.json()
+            envelope = {}
+            yield from iter_json_items(response.iter_content(), key="data", envelope=envelope)
+            rl = envelope.get("rate_limit")
+            if rl:
+                self.limiter.note_quota(rl.get("remaining"), rl.get("resets_in_seconds"))
             logger.debug(f"Sportmonks API request successful: {endpoint}")
-            return data
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Sportmonks API request failed for {endpoint}: {e}")
@@ -78,6 +146,56 @@ class SportmonksProvider:
             logger.error(f"Invalid JSON response from {endpoint}: {e}")
             raise
     
+    def paginate(self, endpoint: str, params: dict = None, includes=None,
+                 max_pages: int = None, prefetch: int = PREFETCH_PAGES) -> Iterator[dict]:
+        """
+        Yield every item of a paginated endpoint, in page order.
+        
+        `includes` are merged into the request's include parameter so related
+        data arrives with each page instead of through per-item calls. Up to
+        `prefetch` pages are requested concurrently (the shared limiter spaces
+        them out); pages are cached for CACHE_TTL_S, so re-running a backfill
+        only spends quota on pages that are not cached yet.
+        """
+        params = dict(params or {})
+        params['include'] = merge_includes(params.get('include'), includes)
+        if not params['include']:
+            del params['include']
+        params.setdefault('per_page', PER_PAGE)
+        
+        def fetch(page: int) -> dict:
+            return self._make_request(endpoint, dict(params, page=page), max_age=CACHE_TTL_S)
+        
+        pool = ThreadPoolExecutor(max_workers=max(1, prefetch), thread_name_prefix="sportmonks-page")
+        try:
+            # Page 1 alone: its pagination block may tell us where to stop
+            first = fetch(1)
+            pagination = first.get("pagination") or {}
+            last_page = pagination.get("total_pages") or pagination.get("last_page")
+            if max_pages is not None:
+                last_page = min(last_page or max_pages, max_pages)
+            
+            pending = {}
+            next_page, page, response = 2, 1, first
+            while True:
+                data = response.get("data") or []
+                yield from data
+                if not data or not (response.get("pagination") or {}).get("has_more") \
+                        or (last_page is not None and page >= last_page):
+                    break
+                
+                # Keep the window full; without a known last page we read ahead
+                # speculatively and stop at the first page that has no more
+                while len(pending) < max(1, prefetch) and (last_page is None or next_page <= last_page):
+                    pending[next_page] = pool.submit(fetch, next_page)
+                    next_page += 1
+                page += 1
+                response = pending.pop(page).result()
+            
+            logger.info(f"Fetched {page} page(s) of {endpoint}")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    
     def get_leagues(self) -> List[dict]:
         """Get all available leagues"""
         logger.info("Fetching Sportmonks leagues...")
@@ -124,23 +242,45 @@ class SportmonksProvider:
         response = self._make_request(f"leagues/{league_id}/seasons/{season_id}/teams", params)
         return response.get("data", [])
     
+    def get_fixtures(self, league_id: int, season_id: int, includes=FIXTURE_INCLUDES) -> List[dict]:
+        """Get all fixtures of a season, with `includes` embedded in each fixture"""
+        logger.info(f"Fetching fixtures for league {league_id}, season {season_id}")
+        return list(self.paginate(f"leagues/{league_id}/seasons/{season_id}/fixtures", includes=includes))
+    
+    def get_fixture_statistics(self, fixture_id: int) -> dict:
+        """Get a single fixture with participants and statistics"""
+        params = {
+            'include': merge_includes(FIXTURE_INCLUDES),
+        }
+        response = self._make_request(f"fixtures/{fixture_id}", params, max_age=CACHE_TTL_S)
+        return response.get("data", {})
+    
     def get_fixtures_with_stats(self, league_id: int, season_id: int, limit: int = 50) -> List[dict]:
         """Get recent fixtures with statistics"""
-        logger.info(f"Fetching recent fixtures with stats for league {league_id}")
+        finished_fixtures = list(self.iter_fixtures_with_stats(league_id, season_id, limit))
         
-        params = {
-            'include': 'participants,statistics,events',
-            'per_page': limit,
-        }
+        logger.info(f"Found {len(finished_fixtures)} finished fixtures with stats")
+        return finished_fixtures
+    
+    def iter_fixtures_with_stats(self, league_id: int, season_id: int, limit: Optional[int] = 50) -> Iterator[dict]:
+        """
+        Stream finished fixtures with statistics one at a time (see
+        get_fixtures_with_stats). limit=None walks every page of the season
+        """
+        logger.info(f"Fetching recent fixtures with stats for league {league_id}")
         
-        response = self._make_request(f"leagues/{league_id}/seasons/{season_id}/fixtures", params)
-        fixtures = response.get("data", [])
+        endpoint = f"leagues/{league_id}/seasons/{season_id}/fixtures"
+        if limit is None:
+            fixtures = self.paginate(endpoint, includes=FIXTURE_INCLUDES)
+        else:
+            params = {
+                'include': merge_includes(FIXTURE_INCLUDES),
+                'per_page': limit,
+            }
+            fixtures = self._iter_data(endpoint, params)
         
         # Filter for finished matches with stats
-        finished_fixtures = [f for f in fixtures if f.get("state", {}).get("state") == "finished"]
-        
-        logger.info(f"Found {len(finished_fixtures)} finished fixtures with stats")
-        return finished_fixtures
+        return (f for f in fixtures if f.get("state", {}).get("state") == "finished")
     
     def get_player_season_stats(self, league_id: int, season_id: int) -> List[dict]:
         """Get player statistics for the season"""
@@ -206,8 +346,14 @@ class SportmonksDataProcessor:
     @staticmethod
     def process_match_statistics(fixtures_data: List[dict]) -> List[dict]:
         """Process match statistics for xG data"""
-        match_stats = []
+        match_stats = list(SportmonksDataProcessor.iter_match_statistics(fixtures_data))
         
+        logger.info(f"Processed statistics for {len(match_stats)} team performances")
+        return match_stats
+    
+    @staticmethod
+    def iter_match_statistics(fixtures_data: Iterable[dict]) -> Iterator[dict]:
+        """Yield one stats record per (fixture, team); accepts any iterable of fixtures"""
         for fixture in fixtures_data:
             fixture_id = fixture.get("id")
             participants = fixture.get("participants", [])
@@ -257,10 +403,7 @@ class SportmonksDataProcessor:
                     elif "corners" in stat_type:
                         stats_dict["corners"] = int(value)
                 
-                match_stats.append(stats_dict)
-        
-        logger.info(f"Processed statistics for {len(match_stats)} team performances")
-        return match_stats
+                yield stats_dict
 
 def test_sportmonks_connection():
     """Test Sportmonks API connection"""
@@ -0,0 +1,131 @@
+"""
+Cache warm-up after an EP recompute: precompute the standard EP rankings and
+optimal squads in background workers so the first users after a refresh
+(and everyone near a deadline) hit the serving cache instead of the solver.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from app.core.logging import logger
+from app.core.responses import dumps
+from app.db.session import engine
+from app.models.user import User
+from app.services import serving_cache
+from app.services.ep_calculator import top_ep
+from app.services.optimizer import build_squad
+
+WARM_TOP_N = int(os.getenv("WARM_TOP_N", "50"))
+# /ep/top limits served as pre-encoded JSON straight after warm-up (the EP page asks for 20)
+WARM_JSON_LIMITS = [int(x) for x in os.getenv("WARM_JSON_LIMITS", "20,50").split(",") if x.strip()]
+WARM_WORKERS = int(os.getenv("WARM_WORKERS", "4"))
+WARM_BUDGETS = [float(x) for x in os.getenv("WARM_BUDGETS", "100.0").split(",") if x.strip()]
+WARM_HORIZONS = [int(x) for x in os.getenv("WARM_HORIZONS", "1,3,6").split(",") if x.strip()]
+POSITIONS = [0, 1, 2, 3, 4]  # 0 = all positions
+DEFAULT_HORIZON = 6
+DEFAULT_BUDGET = 100.0
+
+
+def _warm_ep_top(gw: int, pos: int):
+    with Session(engine) as session:
+        rows = top_ep(session, gw, pos or None, WARM_TOP_N)
+    return (WARM_TOP_N, rows)
+
+
+def _warm_squad(gw_start: int, horizon: int, budget: float, time_limit_s: Optional[float] = None):
+    with Session(engine) as session:
+        return build_squad(session, gw_start, horizon, budget, time_limit_s)
+
+
+def warm_serving_cache(start_gw: int, end_gw: int) -> int:
+    """
+    Compute top-N EP lists for every GW/position in start_gw..end_gw and the
+    optimal squads for the standard budget/horizon grid starting at start_gw.
+    Entries already in the cache are left alone. Returns the number loaded.
+    """
+    t0 = time.time()
+    gen = serving_cache.generation()
+    jobs: List[tuple] = [
+        (("ep_top", gw, pos), _warm_ep_top, (gw, pos))
+        for gw in range(start_gw, end_gw + 1)
+        for pos in POSITIONS
+    ]
+    jobs += [
+        (("optimize_squad", start_gw, horizon, budget), _warm_squad, (start_gw, horizon, budget))
+        for horizon in WARM_HORIZONS
+        if start_gw + horizon - 1 <= end_gw
+        for budget in WARM_BUDGETS
+    ]
+    jobs = [job for job in jobs if not serving_cache.contains(job[0])]
+
+    warmed = 0
+    with ThreadPoolExecutor(max_workers=WARM_WORKERS, thread_name_prefix="warmup") as pool:
+        futures = {pool.submit(fn, *args): key for key, fn, args in jobs}
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                value = fut.result()
+            except Exception as e:
+                logger.warning(f"warm-up {key} failed: {e}")
+                continue
+            serving_cache.put(key, value, gen)
+            if key[0] == "ep_top":
+                _, gw, pos = key
+                serving_cache.put_many({
+                    ("ep_top.json", gw, pos, limit): dumps(value[1][:limit])
+                    for limit in WARM_JSON_LIMITS if limit <= WARM_TOP_N
+                }, gen)
+            warmed += 1
+
+    logger.info(f"Serving cache warmed: {warmed}/{len(jobs)} entries in {time.time() - t0:.1f}s")
+    return warmed
+
+
+def optimize_for_users(gw_start: int, deadline: float) -> dict:
+    """
+    Solve every registered user's squad before `deadline` (a time.monotonic()
+    value), giving each remaining solve an equal slice of the time left.
+    Users carry no squad preferences, so every user's request is (gw_start,
+    DEFAULT_HORIZON, DEFAULT_BUDGET); identical requests are solved once, and
+    requests the serving cache already holds (e.g. optimal squads from
+    warm_serving_cache) are not solved again.
+    """
+    gen = serving_cache.generation()
+    with Session(engine) as session:
+        users = session.exec(select(User)).all()
+
+    requests: Dict[Tuple[int, int, float], List[int]] = {}
+    for u in users:
+        requests.setdefault((gw_start, DEFAULT_HORIZON, DEFAULT_BUDGET), []).append(u.id)
+
+    cached = sum(1 for key in requests if serving_cache.contains(("optimize_squad",) + key))
+    solved, skipped = 0, 0
+    pending = [(key, ids) for key, ids in requests.items() if not serving_cache.contains(("optimize_squad",) + key)]
+    for i, (key, user_ids) in enumerate(pending):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            skipped += len(pending) - i
+            logger.warning(f"optimize_for_users: out of time, {len(pending) - i} squad requests skipped")
+            break
+        time_slice = remaining / (len(pending) - i)
+        try:
+            squad = _warm_squad(*key, time_limit_s=time_slice)
+        except Exception as e:
+            logger.warning(f"optimize_for_users {key} for {len(user_ids)} users failed: {e}")
+            skipped += 1
+            continue
+        _put_squad(("optimize_squad",) + key, squad, gen)
+        solved += 1
+
+    return {"users": len(users), "cached": cached, "solved": solved, "skipped": skipped}
+
+
+def _put_squad(key: tuple, squad: dict, gen: int) -> None:
+    """Cache a squad unless that would replace a proven-optimal one with a time-limited incumbent."""
+    current = serving_cache.peek(key)
+    if current is not None and current.get("optimal") and not squad.get("optimal"):
+        return
+    serving_cache.put(key, squad, gen)
@@ -0,0 +1,17 @@
+# backend/scripts/aio.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_coro(coro):
+    """
+    Run a coroutine to completion from sync code. Works both from the CLI and
+    when a script's main() is called from inside a running event loop (the
+    APScheduler jobs), where asyncio.run() would refuse to start.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        return ex.submit(asyncio.run, coro).result()
@@ -1,85 +1,118 @@
-import json, urllib.request, os
+import os
 from sqlalchemy import create_engine, text
 
-def get_json(url: str):
-    with urllib.request.urlopen(url, timeout=30) as r:
-        return json.loads(r.read().decode('utf-8'))
-
-print('Downloading bootstrap-static…')
-bs = get_json('https://fantasy.premierleague.com/api/bootstrap-static/')
-
-teams_api = bs['teams']
-elements  = bs['elements']
-pos_map   = {1:'GK', 2:'DEF', 3:'MID', 4:'FWD'}
-
-engine = create_engine(os.environ['DATABASE_URL'], pool_pre_ping=True, future=True)
-
-with engine.begin() as conn:
-    # Safety: indexes / helper maps
-    conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ux_teams_short ON teams(short_name)'))
-    conn.execute(text('CREATE TABLE IF NOT EXISTS teams_id_map (team_id INT REFERENCES teams(id) ON DELETE CASCADE, fpl_team_id INT UNIQUE NOT NULL)'))
-    conn.execute(text('CREATE TABLE IF NOT EXISTS players_id_map (player_id INT REFERENCES players(id) ON DELETE CASCADE, fpl_id INT UNIQUE NOT NULL)'))
-
-    # --- Upsert teams; build {fpl_team_id -> teams.id}
-    team_map = {}
-    for t in teams_api:
-        params = {'name': t['name'], 'short': t['short_name']}
-        team_id = conn.execute(text("""
-            INSERT INTO teams (name, short_name)
-            VALUES (:name, :short)
-            ON CONFLICT (short_name) DO UPDATE
-              SET name = EXCLUDED.name
-            RETURNING id
-        """), params).scalar_one()
-        team_map[int(t['id'])] = int(team_id)
-        conn.execute(text("""
-            INSERT INTO teams_id_map (team_id, fpl_team_id)
-            VALUES (:team_id, :fpl)
-            ON CONFLICT (fpl_team_id) DO UPDATE
-              SET team_id = EXCLUDED.team_id
-        """), {'team_id': team_id, 'fpl': int(t['id'])})
-
-    # --- Upsert players; build display name; update id map
-    rows = []
-    for e in elements:
-        first  = (e.get('first_name') or '').strip()
-        second = (e.get('second_name') or '').strip()
-        web    = (e.get('web_name') or '').strip()
-        name   = (f'{first} {second}'.strip()) or web
-        rows.append({
-            'fpl_id': int(e['id']),
-            'name': name,
-            'position': pos_map.get(int(e['element_type']), None),
-            'team_id': team_map.get(int(e['team'])),
-            'price': float(e.get('now_cost', 0) or 0) / 10.0,
-            'own': float((e.get('selected_by_percent') or '0').replace('%','') or 0.0),
-            'status': (e.get('status') or '').strip()
-        })
-
-    ins = text("""
-      INSERT INTO players (fpl_id, name, position, team_id, price, ownership_percent, status)
-      VALUES (:fpl_id, :name, :position, :team_id, :price, :own, :status)
-      ON CONFLICT (fpl_id) DO UPDATE
-        SET name = EXCLUDED.name,
-            position = EXCLUDED.position,
-            team_id = EXCLUDED.team_id,
-            price = EXCLUDED.price,
-            ownership_percent = EXCLUDED.ownership_percent,
-            status = EXCLUDED.status
-      RETURNING id, fpl_id
-    """)
-
-    upserts = 0
-    for r in rows:
-        pid, fid = conn.execute(ins, r).one()
-        upserts += 1
-        conn.execute(text("""
-          INSERT INTO players_id_map (player_id, fpl_id)
-          VALUES (:player_id, :fpl_id)
-          ON CONFLICT (fpl_id) DO UPDATE
-            SET player_id = EXCLUDED.player_id
-        """), {'player_id': pid, 'fpl_id': fid})
-
-    teams_cnt   = conn.execute(text("SELECT COUNT(*) FROM teams")).scalar()
-    players_cnt = conn.execute(text("SELECT COUNT(*) FROM players")).scalar()
-    print(f'Loaded teams & players ✓  teams={teams_cnt}, players={players_cnt}, player_upserts={upserts}')
+from app.services.data.bootstrap_snapshot import get_bootstrap
+from scripts.bulk_upsert import BulkUpserter
+
+CONSUMER = 'scripts.bootstrap_upsert'
+pos_map = {1:'GK', 2:'DEF', 3:'MID', 4:'FWD'}
+
+PLAYER_COLS = ['fpl_id', 'name', 'position', 'team_id', 'price', 'ownership_percent', 'status']
+
+def player_sig(r) -> tuple:
+    # Normalise numerics so NUMERIC columns read back from the DB compare equal to API floats
+    return (
+        r['name'], r['position'], r['team_id'],
+        round(float(r['price'] or 0), 1),
+        round(float(r['ownership_percent'] or 0), 2),
+        r['status'] or '',
+    )
+
+def player_row(e, team_map) -> dict:
+    first  = (e.get('first_name') or '').strip()
+    second = (e.get('second_name') or '').strip()
+    web    = (e.get('web_name') or '').strip()
+    return {
+        'fpl_id': int(e['id']),
+        'name': (f'{first} {second}'.strip()) or web,
+        'position': pos_map.get(int(e['element_type']), None),
+        'team_id': team_map.get(int(e['team'])),
+        'price': float(e.get('now_cost', 0) or 0) / 10.0,
+        'ownership_percent': float((e.get('selected_by_percent') or '0').replace('%','') or 0.0),
+        'status': (e.get('status') or '').strip(),
+    }
+
+def main(force: bool = False):
+    snap = get_bootstrap()
+    if not force and not snap.is_new_for(CONSUMER):
+        print('bootstrap-static unchanged since last load, skipped')
+        return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'payload_unchanged': True}
+    bs = snap.data
+
+    teams_api = bs['teams']
+    elements  = bs['elements']
+
+    engine = create_engine(os.environ['DATABASE_URL'], pool_pre_ping=True, future=True)
+
+    with engine.begin() as conn:
+        # Safety: indexes / helper maps
+        conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ux_teams_short ON teams(short_name)'))
+        conn.execute(text('CREATE TABLE IF NOT EXISTS teams_id_map (team_id INT REFERENCES teams(id) ON DELETE CASCADE, fpl_team_id INT UNIQUE NOT NULL)'))
+        conn.execute(text('CREATE TABLE IF NOT EXISTS players_id_map (player_id INT REFERENCES players(id) ON DELETE CASCADE, fpl_id INT UNIQUE NOT NULL)'))
+
+        # --- Preload current state: one read per table
+        team_map, team_sig = {}, {}
+        for fpl, tid, name, short in conn.execute(text("""
+            SELECT m.fpl_team_id, t.id, t.name, t.short_name
+            FROM teams t JOIN teams_id_map m ON m.team_id = t.id
+        """)):
+            team_map[int(fpl)] = int(tid)
+            team_sig[int(fpl)] = (name, short)
+
+        existing = {}  # fpl_id -> (signature, has id-map row)
+        for r in conn.execute(text("""
+            SELECT p.fpl_id, p.name, p.position, p.team_id, p.price, p.ownership_percent, p.status,
+                   m.fpl_id IS NOT NULL AS mapped
+            FROM players p LEFT JOIN players_id_map m ON m.fpl_id = p.fpl_id
+        """)).mappings():
+            existing[int(r['fpl_id'])] = (player_sig(r), r['mapped'])
+
+        # --- Teams: write only new/renamed ones; build {fpl_team_id -> teams.id}
+        changed_teams = [t for t in teams_api if team_sig.get(int(t['id'])) != (t['name'], t['short_name'])]
+        if changed_teams:
+            with BulkUpserter(conn, 'teams', ['name', 'short_name'], conflict=['short_name'],
+                              touch=None, label='teams') as up:
+                up.add_many({'name': t['name'], 'short_name': t['short_name']} for t in changed_teams)
+            ids = dict(conn.execute(text('SELECT short_name, id FROM teams WHERE short_name = ANY(:s)'),
+                                    {'s': [t['short_name'] for t in changed_teams]}).all())
+            with BulkUpserter(conn, 'teams_id_map', ['team_id', 'fpl_team_id'], conflict=['fpl_team_id'],
+                              touch=None, label='teams_id_map') as up:
+                for t in changed_teams:
+                    team_map[int(t['id'])] = int(ids[t['short_name']])
+                    up.add({'team_id': team_map[int(t['id'])], 'fpl_team_id': int(t['id'])})
+
+        # --- Players: compare signatures, upsert only the difference in bulk
+        inserted = updated = unchanged = 0
+        to_map = []
+        with BulkUpserter(conn, 'players', PLAYER_COLS, conflict=['fpl_id'], touch=None, label='players') as up:
+            for e in elements:
+                row = player_row(e, team_map)
+                cur = existing.get(row['fpl_id'])
+                if cur is None:
+                    inserted += 1
+                elif cur[0] != player_sig(row):
+                    updated += 1
+                else:
+                    unchanged += 1
+                    if not cur[1]:
+                        to_map.append(row['fpl_id'])
+                    continue
+                up.add(row)
+                to_map.append(row['fpl_id'])
+
+        if to_map:
+            conn.execute(text("""
+              INSERT INTO players_id_map (player_id, fpl_id)
+              SELECT id, fpl_id FROM players WHERE fpl_id = ANY(:ids)
+              ON CONFLICT (fpl_id) DO UPDATE
+                SET player_id = EXCLUDED.player_id
+            """), {'ids': to_map})
+
+        print(f'Loaded teams & players ✓  teams_changed={len(changed_teams)}, '
+              f'players inserted={inserted}, updated={updated}, unchanged={unchanged}')
+
+    snap.ack(CONSUMER)
+    return {'inserted': inserted, 'updated': updated, 'unchanged': unchanged, 'teams_changed': len(changed_teams)}
+
+if __name__ == '__main__':
+    main()
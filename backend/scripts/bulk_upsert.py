@@ -0,0 +1,136 @@
+# backend/scripts/bulk_upsert.py
+import hashlib, time
+from typing import Iterable, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+
+class BulkUpserter:
+    """
+    Accumulates rows (dicts keyed by column name) and writes them in chunks with
+    one statement per chunk instead of one round trip per row.
+
+    method="values": multi-row INSERT ... VALUES ... ON CONFLICT (conflict) DO UPDATE.
+    method="copy":   COPY into a temp staging table, then one INSERT ... SELECT
+                     ON CONFLICT, or a MERGE when `merge_on` is given (for tables
+                     whose uniqueness is null-safe and has no usable constraint).
+
+    `target` is an Engine (each flush runs in its own short transaction) or an
+    open Connection (flushes join the caller's transaction). Every flush prints
+    its row count and rows/sec.
+    """
+
+    def __init__(self, target, table: str, columns: Sequence[str],
+                 conflict: Optional[Sequence[str]] = None,
+                 update: Optional[Sequence[str]] = None,
+                 merge_on: Optional[Sequence[str]] = None,
+                 touch: Optional[str] = "updated_at",
+                 chunk_size: int = 500, method: str = "values", label: Optional[str] = None):
+        if not (conflict or merge_on):
+            raise ValueError("BulkUpserter needs conflict columns or merge_on columns")
+        if method == "values" and not conflict:
+            raise ValueError("method='values' needs conflict columns")
+        self.target = target
+        self.table = table
+        self.columns = list(columns)
+        self.key = list(conflict or merge_on)
+        self.conflict = list(conflict) if conflict else None
+        self.merge_on = list(merge_on) if merge_on else None
+        self.update = list(update) if update is not None else [c for c in self.columns if c not in self.key]
+        self.touch = touch
+        self.chunk_size = chunk_size
+        self.method = method
+        self.label = label or table
+        self.stage = f"tmp_{table}_{hashlib.md5(','.join(self.columns).encode()).hexdigest()[:8]}"
+        self._rows: dict = {}
+        self.total = 0
+        self.seconds = 0.0
+
+    # --- accumulate ---------------------------------------------------------
+    def add(self, row: dict) -> None:
+        # a statement cannot upsert the same key twice: last row for a key wins
+        self._rows[tuple(row.get(k) for k in self.key)] = row
+        if len(self._rows) >= self.chunk_size:
+            self.flush()
+
+    def add_many(self, rows: Iterable[dict]) -> None:
+        for r in rows:
+            self.add(r)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    # --- write --------------------------------------------------------------
+    def _set_clause(self, src: str) -> str:
+        sets = [f"{c} = {src}.{c}" for c in self.update]
+        if self.touch:
+            sets.append(f"{self.touch} = NOW()")
+        return ",\n    ".join(sets)
+
+    def _values(self, conn: Connection, rows: List[dict]) -> None:
+        values, params = [], {}
+        for i, r in enumerate(rows):
+            values.append("(" + ", ".join(f":{c}_{i}" for c in self.columns) + ")")
+            params.update({f"{c}_{i}": r.get(c) for c in self.columns})
+        action = f"DO UPDATE SET\n    {self._set_clause('EXCLUDED')}" if (self.update or self.touch) else "DO NOTHING"
+        conn.execute(text(f"""
+          INSERT INTO {self.table} ({", ".join(self.columns)})
+          VALUES {", ".join(values)}
+          ON CONFLICT ({", ".join(self.conflict)}) {action}
+        """), params)
+
+    def _copy(self, conn: Connection, rows: List[dict]) -> None:
+        cols = ", ".join(self.columns)
+        conn.execute(text(f"""
+          CREATE TEMP TABLE IF NOT EXISTS {self.stage} AS
+          SELECT {cols} FROM {self.table} WITH NO DATA
+        """))
+        raw = conn.connection.dbapi_connection  # psycopg3 connection, same transaction
+        with raw.cursor() as cur:
+            with cur.copy(f"COPY {self.stage} ({cols}) FROM STDIN") as cp:
+                for r in rows:
+                    cp.write_row(tuple(r.get(c) for c in self.columns))
+
+        if self.merge_on:
+            match = " AND ".join(
+                f"t.{c} IS NOT DISTINCT FROM s.{c}" for c in self.merge_on
+            )
+            conn.execute(text(f"""
+              MERGE INTO {self.table} t
+              USING {self.stage} s ON {match}
+              WHEN MATCHED THEN UPDATE SET {self._set_clause('s')}
+              WHEN NOT MATCHED THEN INSERT ({cols}) VALUES ({", ".join("s." + c for c in self.columns)})
+            """))
+        else:
+            action = f"DO UPDATE SET\n    {self._set_clause('EXCLUDED')}" if (self.update or self.touch) else "DO NOTHING"
+            conn.execute(text(f"""
+              INSERT INTO {self.table} ({cols})
+              SELECT {cols} FROM {self.stage}
+              ON CONFLICT ({", ".join(self.conflict)}) {action}
+            """))
+        conn.execute(text(f"TRUNCATE {self.stage}"))
+
+    def flush(self) -> int:
+        rows = list(self._rows.values())
+        self._rows.clear()
+        if not rows:
+            return 0
+
+        t0 = time.time()
+        write = self._copy if self.method == "copy" else self._values
+        if isinstance(self.target, Engine):
+            with self.target.begin() as conn:
+                write(conn, rows)
+        else:
+            write(self.target, rows)
+        took = time.time() - t0
+
+        self.total += len(rows)
+        self.seconds += took
+        print(f"  [bulk {self.label}] flushed {len(rows)} rows in {took:.2f}s ({len(rows) / max(took, 1e-6):.0f} rows/s)")
+        return len(rows)
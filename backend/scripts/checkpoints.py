@@ -0,0 +1,61 @@
+# backend/scripts/checkpoints.py
+import hashlib
+from typing import Dict, Optional, Tuple, Union
+
+from sqlalchemy import text
+
+# Per-source ingest checkpoints: what was fetched last and the hash of its content,
+# so reruns can resume and skip payloads that have not changed.
+
+
+def ensure_table(conn):
+    conn.execute(text("""
+      CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+        source       TEXT NOT NULL,
+        key          TEXT NOT NULL,
+        content_hash TEXT,
+        fetched_at   TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (source, key)
+      )
+    """))
+
+
+def content_hash(data: Union[str, bytes]) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_all(conn, source: str) -> Dict[str, Tuple[Optional[str], object]]:
+    rows = conn.execute(text("""
+      SELECT key, content_hash, fetched_at FROM ingest_checkpoints WHERE source = :s
+    """), {"s": source}).all()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def get_hash(conn, source: str, key: str) -> Optional[str]:
+    return conn.execute(text("""
+      SELECT content_hash FROM ingest_checkpoints WHERE source = :s AND key = :k
+    """), {"s": source, "k": key}).scalar()
+
+
+def save(conn, source: str, key: str, digest: Optional[str]):
+    conn.execute(text("""
+      INSERT INTO ingest_checkpoints (source, key, content_hash, fetched_at)
+      VALUES (:s, :k, :h, NOW())
+      ON CONFLICT (source, key) DO UPDATE
+        SET content_hash = EXCLUDED.content_hash,
+            fetched_at   = NOW()
+    """), {"s": source, "k": key, "h": digest})
+
+
+def save_many(conn, source: str, digests: Dict[str, Optional[str]]):
+    if not digests:
+        return
+    conn.execute(text("""
+      INSERT INTO ingest_checkpoints (source, key, content_hash, fetched_at)
+      VALUES (:s, :k, :h, NOW())
+      ON CONFLICT (source, key) DO UPDATE
+        SET content_hash = EXCLUDED.content_hash,
+            fetched_at   = NOW()
+    """), [{"s": source, "k": k, "h": h} for k, h in digests.items()])
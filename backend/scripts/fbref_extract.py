@@ -0,0 +1,149 @@
+# backend/scripts/fbref_extract.py
+import hashlib, json, multiprocessing, os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import lxml.etree
+import lxml.html
+
+from app.services.http_cache import http_cache
+
+# Table extraction for FBref pages with lxml (C parser) instead of BeautifulSoup's
+# html.parser. Only the requested tables are turned into rows of
+# {data-stat: text} (plus "<data-stat>_href" for linked cells), results are
+# cached on disk by page content hash, and pages are parsed in a process pool.
+
+PARSE_WORKERS = int(os.environ.get("FBREF_PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+PARSE_CACHE_DIR = os.environ.get("FBREF_PARSE_CACHE_DIR", os.path.join(http_cache.cache_dir, "fbref_tables"))
+PARSER_VERSION = "2"  # bump when the shape of extract_tables() output changes
+
+Tables = Dict[str, List[dict]]
+
+
+def _wanted(table_id: str, ids: Sequence[str]) -> bool:
+    # "stats_standard_*" matches by prefix, anything else exactly
+    return any(table_id.startswith(i[:-1]) if i.endswith("*") else table_id == i for i in ids)
+
+
+def _tables(doc):
+    """Tables in document order, including those FBref hides inside HTML comments."""
+    for el in doc.iter():
+        if el.tag == "table":
+            yield el
+        elif el.tag is lxml.etree.Comment and "<table" in (el.text or ""):
+            # only comments holding markup are re-parsed; scripts, ads etc. stay comments
+            yield from lxml.html.fragment_fromstring(el.text, create_parent="div").iter("table")
+
+
+def extract_tables(html, ids: Sequence[str]) -> Tables:
+    """
+    Return {table_id: [row, ...]} for the tables in `ids`. Header rows repeated
+    inside tbody are dropped. FBref ships most secondary tables inside HTML
+    comments; those comments (and only those) are parsed as markup too.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    if not html.strip():
+        return {}
+    doc = lxml.html.fromstring(html)
+    out: Tables = {}
+    for tbl in _tables(doc):
+        tid = tbl.get("id") or ""
+        if tid in out or not _wanted(tid, ids):
+            continue
+        rows = []
+        for tr in tbl.iterfind("tbody/tr"):
+            if "thead" in (tr.get("class") or ""):
+                continue
+            row = {}
+            for cell in tr:
+                stat = cell.get("data-stat")
+                if not stat:
+                    continue
+                row[stat] = cell.text_content().strip()
+                a = cell.find(".//a")
+                if a is not None and a.get("href"):
+                    row[f"{stat}_href"] = a.get("href")
+            if row:
+                rows.append(row)
+        out[tid] = rows
+    return out
+
+
+def _cache_path(digest: str, ids: Sequence[str]) -> str:
+    key = hashlib.sha256(f"{PARSER_VERSION}|{digest}|{','.join(ids)}".encode()).hexdigest()
+    return os.path.join(PARSE_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def load_cached(digest: str, ids: Sequence[str]) -> Optional[Tables]:
+    try:
+        with open(_cache_path(digest, ids), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store_cached(digest: str, ids: Sequence[str], tables: Tables) -> None:
+    path = _cache_path(digest, ids)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(tables, f)
+    os.replace(tmp, path)
+
+
+class TableExtractor:
+    """
+    Submit fetched pages, get Futures of extract_tables() results. Pages whose
+    content hash was parsed before resolve immediately from the cache; the rest
+    are parsed in a spawn-based process pool (inline when workers <= 1) so the
+    caller keeps fetching while earlier pages are parsed.
+    """
+
+    def __init__(self, ids: Sequence[str], workers: int = PARSE_WORKERS):
+        self.ids = list(ids)
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.hits = 0
+        self.parsed = 0
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._pool is not None:
+            self._pool.shutdown(wait=exc_type is None, cancel_futures=exc_type is not None)
+            self._pool = None
+
+    def submit(self, content: bytes, digest: Optional[str] = None) -> Future:
+        digest = digest or hashlib.sha256(content).hexdigest()
+        cached = load_cached(digest, self.ids)
+        if cached is not None:
+            self.hits += 1
+            fut: Future = Future()
+            fut.set_result(cached)
+            return fut
+
+        self.parsed += 1
+        if self._pool is None:
+            fut = Future()
+            try:
+                fut.set_result(extract_tables(content, self.ids))
+            except Exception as e:
+                fut.set_exception(e)
+        else:
+            fut = self._pool.submit(extract_tables, content, self.ids)
+
+        def _store(f: Future):
+            if not f.cancelled() and f.exception() is None:
+                try:
+                    store_cached(digest, self.ids, f.result())
+                except OSError:
+                    pass  # the cache is an optimisation only
+        fut.add_done_callback(_store)
+        return fut
+
+    def extract(self, content: bytes, digest: Optional[str] = None) -> Tables:
+        return self.submit(content, digest).result()
@@ -15,6 +15,8 @@ from db.database import get_db, test_connection, get_table_counts, DatabaseManag
 from services.fpl_provider import FPLProvider, FPLDataProcessor
 from services.sportmonks_provider import SportmonksProvider, SportmonksDataProcessor
 from services.odds_provider import OddsProvider, OddsDataProcessor
+from services.json_stream import batched
+from services import odds_store
 
 # Setup logging
 logging.basicConfig(
@@ -27,6 +29,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Rows per bulk_upsert call when streaming processed provider data into the DB
+WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", "500"))
+
+# iter_match_statistics keys stored as-is in MatchStatistics; the rest are renamed
+# (possession) or only used for lookups (team_name, sportmonks_team_id, fixture_id)
+MATCH_STAT_COLUMNS = ("is_home", "xg", "shots_total", "shots_on_target", "corners")
+
+def match_statistics_row(stat: dict, team_id: int) -> dict:
+    row = {k: stat[k] for k in MATCH_STAT_COLUMNS if k in stat}
+    if "possession" in stat:
+        row["possession_percentage"] = stat["possession"]
+    # fixture_id references FPL fixtures.id; the Sportmonks id has its own column
+    row.update(team_id=team_id, fixture_sportmonks_id=stat["fixture_id"])
+    return row
+
 class DataIngestionOrchestrator:
     """
     Orchestrates data ingestion from all providers
@@ -227,39 +244,11 @@ class DataIngestionOrchestrator:
                 
                 logger.info(f"✅ Updated teams with Sportmonks data for {season_name}")
                 
-                # Get fixtures for this season (last 50 matches to avoid rate limits)
-                fixtures_data = self.sportmonks_provider.get_fixtures(pl_id, season_id)
-                recent_fixtures = fixtures_data[-50:] if len(fixtures_data) > 50 else fixtures_data
-                
-                from app.models import MatchStatistics
-                
-                for fixture in recent_fixtures:
-                    try:
-                        # Get detailed statistics for this fixture
-                        detailed_fixture = self.sportmonks_provider.get_fixture_statistics(fixture['id'])
-                        
-                        # Process match statistics
-                        match_stats = SportmonksDataProcessor.process_match_statistics(detailed_fixture)
-                        
-                        for stat_data in match_stats:
-                            # Map Sportmonks team ID to our team ID
-                            team = db.query(Team).filter(
-                                Team.sportmonks_id == stat_data['team_sportmonks_id']
-                            ).first()
-                            
-                            if team:
-                                stat_data['team_id'] = team.id
-                                stat_data['fixture_sportmonks_id'] = fixture['id']
-                                
-                                self.db_manager.upsert_record(
-                                    db, MatchStatistics, stat_data, ['fixture_sportmonks_id', 'team_id']
-                                )
-                    
-                    except Exception as e:
-                        logger.warning(f"Failed to process fixture {fixture['id']}: {e}")
-                        continue
+                # Fixtures come with participants/statistics embedded, a few pages
+                # per season (cached), instead of one statistics call per fixture
+                written = self.ingest_fixture_statistics(pl_id, season_id, limit=None)
                 
-                logger.info(f"✅ Processed {len(recent_fixtures)} fixtures for {season_name}")
+                logger.info(f"✅ Processed {written} team performances for {season_name}")
         
         except Exception as e:
             logger.error(f"Sportmonks data ingestion failed: {e}")
@@ -274,20 +263,20 @@ class DataIngestionOrchestrator:
         try:
             # Get current odds
             current_odds = self.odds_provider.get_soccer_odds()
-            processed_odds = OddsDataProcessor.process_match_odds(current_odds)
             
             db = next(get_db())
+            odds_store.ensure_tables(db.get_bind())
             
-            from app.models import MatchOdds
-            
-            for odds_data in processed_odds:
-                # We'll need to map event IDs to our fixtures later
-                # For now, just store the odds with the external event ID
-                self.db_manager.upsert_record(
-                    db, MatchOdds, odds_data, ['event_id', 'bookmaker']
-                )
+            # Processed records flow straight into batched writes; only lines
+            # whose prices moved are stored (see services/odds_store.py)
+            # We'll need to map event IDs to our fixtures later
+            # For now, just store the odds with the external event ID
+            totals = {"new": 0, "changed": 0, "unchanged": 0}
+            for batch in batched(OddsDataProcessor.iter_match_odds(current_odds), WRITE_BATCH):
+                for k, v in odds_store.record_snapshot(db, batch).items():
+                    totals[k] += v
             
-            logger.info(f"✅ Inserted/updated odds for {len(current_odds)} matches")
+            logger.info(f"✅ Odds for {len(current_odds)} matches: {totals}")
             
         except Exception as e:
             logger.error(f"Odds data ingestion failed: {e}")
@@ -295,6 +284,47 @@ class DataIngestionOrchestrator:
         finally:
             db.close()
     
+    def ingest_historical_odds(self, commence_time_from: str, commence_time_to: str = None) -> int:
+        """
+        Stream historical odds from the API response into the odds history in
+        batches; memory stays flat regardless of how many events the range covers.
+        Old lines are stored at their own snapshot times and never replace the
+        current line in match_odds_latest
+        """
+        db = next(get_db())
+        written = 0
+        try:
+            odds_store.ensure_tables(db.get_bind())
+            events = self.odds_provider.iter_historical_odds(commence_time_from, commence_time_to)
+            for batch in batched(OddsDataProcessor.iter_match_odds(events), WRITE_BATCH):
+                written += odds_store.record_history(db, batch)["inserted"]
+            logger.info(f"✅ Stored {written} changed historical odds lines")
+            return written
+        finally:
+            db.close()
+    
+    def ingest_fixture_statistics(self, league_id: int, season_id: int, limit: int = 50) -> int:
+        """Stream finished fixtures with stats into MatchStatistics in batches"""
+        from app.models import MatchStatistics, Team
+        
+        db = next(get_db())
+        written = 0
+        try:
+            team_ids = {t.sportmonks_id: t.id for t in db.query(Team).filter(Team.sportmonks_id.isnot(None))}
+            fixtures = self.sportmonks_provider.iter_fixtures_with_stats(league_id, season_id, limit)
+            rows = (
+                match_statistics_row(stat, team_ids[stat['sportmonks_team_id']])
+                for stat in SportmonksDataProcessor.iter_match_statistics(fixtures)
+                if stat['sportmonks_team_id'] in team_ids
+            )
+            for batch in batched(rows, WRITE_BATCH):
+                self.db_manager.bulk_upsert(db, MatchStatistics, batch, ['fixture_sportmonks_id', 'team_id'])
+                written += len(batch)
+            logger.info(f"✅ Inserted/updated {written} match statistics rows")
+            return written
+        finally:
+            db.close()
+    
     def _print_final_status(self):
         """Print final status of data ingestion"""
         logger.info("\n📊 Final Database Status:")
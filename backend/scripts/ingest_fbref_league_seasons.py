@@ -2,13 +2,14 @@ import os
 import re
 import time
 import unicodedata
-from io import StringIO
 
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup, Comment
 from sqlalchemy import create_engine, text
 
+from app.services.http_cache import http_cache
+from scripts.bulk_upsert import BulkUpserter
+from scripts.fbref_extract import TableExtractor
+
 DB_URL = os.environ["DATABASE_URL"]
 
 # Input via env (comma-separated)
@@ -54,89 +55,56 @@ def normalize_text(s: str) -> str:
     s = "".join(ch for ch in s if not unicodedata.combining(ch))
     return s
 
-def fetch_fbref_standard_table(league_code: str, season_slug: str) -> pd.DataFrame | None:
+# FBref data-stat -> our column name (standard player stats table)
+KEEP = {
+    "player": "player_name",
+    "team": "team_name",
+    "position": "pos",
+    "minutes": "minutes",
+    "goals": "goals",
+    "assists": "assists",
+    "shots": "shots",
+    "shots_on_target": "shots_on_target",
+    "xg": "xg",
+    "xg_assist": "xa",
+    "npxg": "npxg",
+    "npxg_xg_assist": "npxg_xa",
+}
+
+def fetch_fbref_standard_page(league_code: str, season_slug: str):
     league_name = LEAGUE_CODE_TO_NAME.get(league_code, league_code)
     # Example: https://fbref.com/en/comps/9/2023-2024/stats/players/2023-2024-Premier-League-Stats
     url = f"https://fbref.com/en/comps/{league_code}/{season_slug}/stats/players/{season_slug}-{league_name}-Stats"
 
-    # 1) Fetch HTML with headers
-    r = requests.get(url, headers=HEADERS, timeout=25)
+    r = http_cache.get(url, headers=HEADERS, timeout=25)
     if r.status_code == 403:
         # try one retry with a short sleep
         time.sleep(1.0)
-        r = requests.get(url, headers=HEADERS, timeout=25)
+        r = http_cache.get(url, headers=HEADERS, timeout=25)
     r.raise_for_status()
+    return r
 
-    html = r.text
-    soup = BeautifulSoup(html, "lxml")
-
-    # 2) FBref often comments out the table. Search comments for a table with id='stats_standard'
-    def extract_table_from_soup(s: BeautifulSoup) -> str | None:
-        # try direct
-        tbl = s.find("table", id="stats_standard")
-        if tbl:
-            return str(tbl)
-
-        # try commented sections
-        for c in s.find_all(string=lambda text: isinstance(text, Comment)):
-            try:
-                inner = BeautifulSoup(c, "lxml")
-                itbl = inner.find("table", id="stats_standard")
-                if itbl:
-                    return str(itbl)
-            except Exception:
-                continue
-        return None
-
-    table_html = extract_table_from_soup(soup)
-    if not table_html:
+def standard_table_df(tables: dict, league_code: str, season_slug: str) -> pd.DataFrame | None:
+    league_name = LEAGUE_CODE_TO_NAME.get(league_code, league_code)
+    # FBref often comments out the table; fbref_extract already looks inside comments
+    rows = tables.get("stats_standard")
+    if not rows:
         print(f"[{season_slug}:{league_name}] No usable table found; skipping")
         return None
 
-    # 3) Parse with pandas
-    try:
-        df_list = pd.read_html(StringIO(table_html))
-        if not df_list:
-            return None
-        df = df_list[0]
-    except ValueError:
+    # Keep minimal set (repeated header rows are already dropped by the extractor)
+    df = pd.DataFrame([{dst: r.get(src) for src, dst in KEEP.items() if src in r} for r in rows])
+    if df.empty or "player_name" not in df.columns:
         return None
+    if "team_name" not in df.columns:
+        df["team_name"] = ""
+    df["player_name"] = df["player_name"].fillna("").apply(normalize_text)
+    df["team_name"] = df["team_name"].fillna("").apply(normalize_text)
 
-    # 4) Standardize column names we care about
-    df.columns = [str(c).strip() for c in df.columns]
-    # Common columns on FBref standard table:
-    # 'Rk', 'Player', 'Nation', 'Pos', 'Squad', 'Age', 'Born', 'MP', 'Starts',
-    # 'Min', 'Gls', 'Ast', 'G+A', 'G-PK', 'PK', 'PKatt', 'CrdY', 'CrdR', 'xG', 'npxG', 'xAG',
-    # 'xG+xAG', 'npxG+xAG', 'PrgC', 'PrgP', 'PrgR', 'Gls', etc.
-
-    # Deduplicate header rows (FBref repeats headers inside the table)
-    if "Rk" in df.columns:
-        df = df[df["Rk"].astype(str).str.isnumeric()]
-
-    # Keep minimal set
-    keep = {
-        "Player": "player_name",
-        "Squad": "team_name",
-        "Pos": "pos",
-        "Min": "minutes",
-        "Gls": "goals",
-        "Ast": "assists",
-        "Sh": "shots",
-        "SoT": "shots_on_target",
-        "xG": "xg",
-        "xAG": "xa",
-        "npxG": "npxg",
-        "npxG+xAG": "npxg_xa",
-    }
-    present = {src: keep[src] for src in keep.keys() if src in df.columns}
-    df = df[list(present.keys())].rename(columns=present)
-    df["player_name"] = df["player_name"].apply(normalize_text)
-    df["team_name"] = df["team_name"].apply(normalize_text)
-
-    # cast numerics
+    # cast numerics ("1,234" minutes)
     for col in ["minutes", "goals", "assists", "shots", "shots_on_target", "xg", "xa", "npxg", "npxg_xa"]:
         if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+            df[col] = pd.to_numeric(df[col].astype(str).str.replace(",", "", regex=False), errors="coerce").fillna(0)
 
     # add season label and comp name for storage
     df["season"] = season_slug_to_label(season_slug)
@@ -241,89 +209,87 @@ def main():
         ensure_external_player_seasons_shape(conn)
         team_map = build_team_map(conn)
 
-    for season in SEASONS:
-        for lg in LEAGUES:
-            df = fetch_fbref_standard_table(lg, season)
-            if df is None or df.empty:
-                continue
-
-            with engine.begin() as conn:
-                up = 0
-                for _, row in df.iterrows():
-                    team_name = row.get("team_name", "")
-                    player_name = row.get("player_name", "")
-                    if not player_name:
-                        continue
-
-                    # resolve team_id using heuristics
-                    team_id = None
-                    tnorm = normalize_text(team_name)
-                    if tnorm in team_map:
-                        team_id = team_map[tnorm]
-                    else:
-                        # fallback: try a few common replacements
-                        t2 = (tnorm
-                              .replace("Man United", "MUN")
-                              .replace("Man City", "MCI")
-                              .replace("Brighton", "BHA")
-                              .replace("Wolves", "WOL"))
-                        # This only helps if teams.short_name are used; otherwise remain None
-
-                    # find player_id
-                    pid = find_player_id(conn, player_name, team_id)
-
-                    # only store if we can map to a player_id (we’re filling FPL player history)
-                    if pid is None:
-                        continue
-
-                    params = {
-                        "player_id": pid,
-                        "prov_id": prov_id,
-                        "season": row["season"],
-                        "team": team_name,
-                        "comp": row.get("comp", ""),
-                        "minutes": float(row.get("minutes", 0) or 0),
-                        "goals": float(row.get("goals", 0) or 0),
-                        "assists": float(row.get("assists", 0) or 0),
-                        "shots": float(row.get("shots", 0) or 0),
-                        "key_passes": float(row.get("shots_on_target", 0) or 0),  # FBref 'SoT' -> we can map to 'key_passes' only if present; if not, keep 0
-                        "xg": float(row.get("xg", 0) or 0),
-                        "xa": float(row.get("xa", 0) or 0),
-                        "npxg": float(row.get("npxg", 0) or 0),
-                        "npxg_xa": float(row.get("npxg_xa", 0) or 0),
-                    }
-
-                    # Prefer UPDATE then INSERT (idempotent)
-                    upd = conn.execute(text("""
-                        UPDATE external_player_seasons
-                        SET team=:team, comp=:comp, minutes=:minutes, goals=:goals, assists=:assists,
-                            shots=:shots, key_passes=:key_passes, xg=:xg, xa=:xa, npxg=:npxg, npxg_xa=:npxg_xa,
-                            updated_at=NOW()
-                        WHERE player_id=:player_id AND provider_id=:prov_id
-                          AND season=:season AND COALESCE(team,'')=COALESCE(:team,'')
-                          AND COALESCE(comp,'')=COALESCE(:comp,'')
-                    """), params)
-
-                    if upd.rowcount == 0:
-                        conn.execute(text("""
-                            INSERT INTO external_player_seasons
-                              (player_id, provider_id, season, team, comp,
-                               minutes, goals, assists, shots, key_passes,
-                               xg, xa, npxg, npxg_xa, created_at, updated_at)
-                            VALUES
-                              (:player_id, :prov_id, :season, :team, :comp,
-                               :minutes, :goals, :assists, :shots, :key_passes,
-                               :xg, :xa, :npxg, :npxg_xa, NOW(), NOW())
-                        """), params)
-                        up += 1
-
-                total_upserts += up
-                print(f"[{season}:{LEAGUE_CODE_TO_NAME.get(lg, lg)}] upserted≈{up}")
-
-            # small politeness delay
-            time.sleep(0.4)
+    # Download every page first (politely, one at a time) and let the extractor's
+    # process pool parse them in the background
+    with TableExtractor(["stats_standard"]) as ex:
+        pages = []
+        for season in SEASONS:
+            for lg in LEAGUES:
+                try:
+                    r = fetch_fbref_standard_page(lg, season)
+                except Exception as e:
+                    print(f"[{season}:{LEAGUE_CODE_TO_NAME.get(lg, lg)}] fetch failed: {e}")
+                    continue
+                pages.append((season, lg, ex.submit(r.content, r.sha256)))
+                # small politeness delay
+                time.sleep(0.4)
+        parsed = [(season, lg, standard_table_df(fut.result(), lg, season)) for season, lg, fut in pages]
+
+    for season, lg, df in parsed:
+        if df is None or df.empty:
+            continue
+
+        with engine.begin() as conn:
+            # (team, comp) match null-safely and have no usable constraint: COPY + MERGE
+            up = BulkUpserter(
+                conn, "external_player_seasons",
+                columns=["player_id", "provider_id", "season", "team", "comp",
+                         "minutes", "goals", "assists", "shots", "key_passes",
+                         "xg", "xa", "npxg", "npxg_xa"],
+                merge_on=["player_id", "provider_id", "season", "team", "comp"],
+                method="copy", chunk_size=2000,
+                label=f"fbref {season}:{LEAGUE_CODE_TO_NAME.get(lg, lg)}",
+            )
+            for _, row in df.iterrows():
+                team_name = row.get("team_name", "")
+                player_name = row.get("player_name", "")
+                if not player_name:
+                    continue
+
+                # resolve team_id using heuristics
+                team_id = None
+                tnorm = normalize_text(team_name)
+                if tnorm in team_map:
+                    team_id = team_map[tnorm]
+                else:
+                    # fallback: try a few common replacements
+                    t2 = (tnorm
+                          .replace("Man United", "MUN")
+                          .replace("Man City", "MCI")
+                          .replace("Brighton", "BHA")
+                          .replace("Wolves", "WOL"))
+                    # This only helps if teams.short_name are used; otherwise remain None
+
+                # find player_id
+                pid = find_player_id(conn, player_name, team_id)
+
+                # only store if we can map to a player_id (we’re filling FPL player history)
+                if pid is None:
+                    continue
+
+                up.add({
+                    "player_id": pid,
+                    "provider_id": prov_id,
+                    "season": row["season"],
+                    "team": team_name,
+                    "comp": row.get("comp", ""),
+                    "minutes": float(row.get("minutes", 0) or 0),
+                    "goals": float(row.get("goals", 0) or 0),
+                    "assists": float(row.get("assists", 0) or 0),
+                    "shots": float(row.get("shots", 0) or 0),
+                    "key_passes": float(row.get("shots_on_target", 0) or 0),  # FBref 'SoT' -> we can map to 'key_passes' only if present; if not, keep 0
+                    "xg": float(row.get("xg", 0) or 0),
+                    "xa": float(row.get("xa", 0) or 0),
+                    "npxg": float(row.get("npxg", 0) or 0),
+                    "npxg_xa": float(row.get("npxg_xa", 0) or 0),
+                })
+
+            up.flush()
+            total_upserts += up.total
+            print(f"[{season}:{LEAGUE_CODE_TO_NAME.get(lg, lg)}] upserted≈{up.total}")
 
     print(f"FBref seasons ingest ✓ total rows upserted≈{total_upserts}")
+    return total_upserts
 
 if __name__ == "__main__":
     main()
@@ -1,86 +1,64 @@
 # /app/scripts/ingest_fbref_seasons.py
-import os, time, re
-import requests
-from bs4 import BeautifulSoup
+import os, time
 from sqlalchemy import create_engine, text
 
+from app.services.http_cache import http_cache
+from scripts.bulk_upsert import BulkUpserter
+from scripts.fbref_extract import TableExtractor
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; fpl-ai-ingest/1.0; +https://github.com/dudeness37/fplassistant)"
 }
 SLEEP = float(os.environ.get("SLEEP", "0.8"))
 MAX_PLAYERS = int(os.environ.get("MAX_PLAYERS", "800"))
+BATCH_ROWS = int(os.environ.get("BATCH_ROWS", "500"))
+
+TABLES = ["stats_standard_*", "stats_expected_*"]
 
-def fetch_player_seasons(fbref_id: str):
+def fetch_player_page(fbref_id: str):
     # Player page: https://fbref.com/en/players/{id}/
     url = f"https://fbref.com/en/players/{fbref_id}/"
-    r = requests.get(url, headers=HEADERS, timeout=30)
+    r = http_cache.get(url, headers=HEADERS, timeout=30)
     if r.status_code != 200:
-        return []
+        return None
+    return r
 
-    soup = BeautifulSoup(r.text, "html.parser")
-    # Prefer the "Standard" and "Expected" tables at the player summary (Career)
-    tables = soup.find_all("table")
+def parse_num(x):
+    x = (x or "").replace(",", "")
+    try:
+        return int(x)
+    except ValueError:
+        try:
+            return float(x)
+        except ValueError:
+            return None
+
+def seasons_from_tables(tables: dict):
+    """Aggregate the career Standard and Expected tables (see fbref_extract) per (season, comp, team)."""
     seasons = {}  # season -> aggregate dict
 
-    def parse_num(x):
-        try:
-            return int(x.replace(",", ""))
-        except:
-            try:
-                return float(x.replace(",",""))
-            except:
-                return None
+    def rows_of(prefix):
+        for tid, rows in tables.items():
+            if tid.startswith(prefix):
+                for tr in rows:
+                    season, league, team_name = tr.get("season"), tr.get("comp_level"), tr.get("team")
+                    if season and league and team_name:
+                        yield (season, league, team_name), tr
 
     # Standard stats by season (league rows)
-    for tbl in tables:
-        if not tbl.get("id","").startswith("stats_standard_"):
-            continue
-        for tr in tbl.select("tbody tr"):
-            if tr.get("class") and "thead" in tr.get("class"): 
-                continue
-            season = tr.find("th", {"data-stat":"season"})
-            comp = tr.find("td", {"data-stat":"comp_level"})
-            team = tr.find("td", {"data-stat":"team"})
-            if not (season and comp and team):
-                continue
-            season_txt = season.text.strip()
-            league = comp.text.strip()
-            team_name = team.text.strip()
-            minutes = tr.find("td", {"data-stat":"minutes"})
-            matches = tr.find("td", {"data-stat":"games"})
-            starts  = tr.find("td", {"data-stat":"games_starts"})
-            goals   = tr.find("td", {"data-stat":"goals"})
-            assists = tr.find("td", {"data-stat":"assists"})
-            row = seasons.setdefault((season_txt, league, team_name), {})
-            row["minutes"] = (row.get("minutes") or 0) + (parse_num(minutes.text) if minutes else 0)
-            row["matches"] = (row.get("matches") or 0) + (parse_num(matches.text) if matches else 0)
-            row["starts"]  = (row.get("starts")  or 0) + (parse_num(starts.text)  if starts  else 0)
-            row["goals"]   = (row.get("goals")   or 0) + (parse_num(goals.text)   if goals   else 0)
-            row["assists"] = (row.get("assists") or 0) + (parse_num(assists.text) if assists else 0)
+    for key, tr in rows_of("stats_standard_"):
+        row = seasons.setdefault(key, {})
+        for col, stat in (("minutes", "minutes"), ("matches", "games"), ("starts", "games_starts"),
+                          ("goals", "goals"), ("assists", "assists")):
+            row[col] = (row.get(col) or 0) + (parse_num(tr.get(stat)) or 0)
 
     # Expected (xG/xA) by season (if available)
-    for tbl in tables:
-        if not tbl.get("id","").startswith("stats_expected_"):
-            continue
-        for tr in tbl.select("tbody tr"):
-            if tr.get("class") and "thead" in tr.get("class"): 
-                continue
-            season = tr.find("th", {"data-stat":"season"})
-            comp = tr.find("td", {"data-stat":"comp_level"})
-            team = tr.find("td", {"data-stat":"team"})
-            if not (season and comp and team):
-                continue
-            season_txt = season.text.strip()
-            league = comp.text.strip()
-            team_name = team.text.strip()
-            xg  = tr.find("td", {"data-stat":"xg"})
-            xa  = tr.find("td", {"data-stat":"xa"})
-            npxg= tr.find("td", {"data-stat":"npxg"})
-            key = (season_txt, league, team_name)
-            row = seasons.setdefault(key, {})
-            if xg:  row["xg"]  = float(xg.text)  if xg.text.strip()  else row.get("xg")
-            if xa:  row["xa"]  = float(xa.text)  if xa.text.strip()  else row.get("xa")
-            if npxg:row["npxg"]= float(npxg.text)if npxg.text.strip() else row.get("npxg")
+    for key, tr in rows_of("stats_expected_"):
+        row = seasons.setdefault(key, {})
+        for col in ("xg", "xa", "npxg"):
+            v = (tr.get(col) or "").strip()
+            if v:
+                row[col] = float(v)
 
     # flatten
     out = []
@@ -107,43 +85,54 @@ def main():
         """), {"prov": prov_id, "lim": MAX_PLAYERS}).mappings().all()
 
         print(f"Ingest FBref seasons for {len(rows)} players (max={MAX_PLAYERS})")
-        upserts = 0
-        for i, r in enumerate(rows, 1):
-            time.sleep(SLEEP)
-            try:
-                data = fetch_player_seasons(r["external_id"])
-            except Exception as e:
-                print(f"[{i}/{len(rows)}] FBref fetch failed: {e}")
-                continue
-            for d in data:
-                conn.execute(text("""
-                  INSERT INTO external_player_seasons
-                    (player_id, provider_id, season, league, team_name, minutes, matches, starts, goals, assists, xg, xa, npxg)
-                  VALUES
-                    (:pid, :prov, :season, :league, :team, :minutes, :matches, :starts, :goals, :assists, :xg, :xa, :npxg)
-                  ON CONFLICT (player_id, provider_id, season, league, team_name)
-                  DO UPDATE SET
-                    minutes = EXCLUDED.minutes,
-                    matches = EXCLUDED.matches,
-                    starts  = EXCLUDED.starts,
-                    goals   = EXCLUDED.goals,
-                    assists = EXCLUDED.assists,
-                    xg      = EXCLUDED.xg,
-                    xa      = EXCLUDED.xa,
-                    npxg    = EXCLUDED.npxg,
-                    updated_at = NOW()
-                """), {
-                    "pid": r["player_id"], "prov": prov_id,
-                    "season": d["season"], "league": d["league"], "team": d["team_name"],
-                    "minutes": d["minutes"], "matches": d["matches"], "starts": d["starts"],
-                    "goals": d["goals"], "assists": d["assists"],
-                    "xg": d["xg"], "xa": d["xa"], "npxg": d["npxg"]
-                })
-                upserts += 1
-
-            if i % 25 == 0:
-                print(f"  …{i}/{len(rows)} players ingested")
-        print(f"FBref season rows upserted: {upserts}")
+        up = BulkUpserter(
+            conn, "external_player_seasons",
+            columns=["player_id", "provider_id", "season", "league", "team_name",
+                     "minutes", "matches", "starts", "goals", "assists", "xg", "xa", "npxg"],
+            conflict=["player_id", "provider_id", "season", "league", "team_name"],
+            chunk_size=BATCH_ROWS, label="fbref seasons",
+        )
+
+        def add(r, data):
+            up.add_many({
+                "player_id": r["player_id"], "provider_id": prov_id,
+                "season": d["season"], "league": d["league"], "team_name": d["team_name"],
+                "minutes": d["minutes"], "matches": d["matches"], "starts": d["starts"],
+                "goals": d["goals"], "assists": d["assists"],
+                "xg": d["xg"], "xa": d["xa"], "npxg": d["npxg"]
+            } for d in data)
+
+        def drain(block=False):
+            # hand parsed pages to the upserter in fetch order while later pages are still parsing
+            while pending and (block or pending[0][1].done()):
+                r, fut = pending.pop(0)
+                try:
+                    data = seasons_from_tables(fut.result())
+                except Exception as e:
+                    print(f"FBref parse failed for {r['external_id']}: {e}")
+                    continue
+                add(r, data)
+
+        pending = []
+        with TableExtractor(TABLES) as ex:
+            for i, r in enumerate(rows, 1):
+                time.sleep(SLEEP)
+                try:
+                    resp = fetch_player_page(r["external_id"])
+                except Exception as e:
+                    print(f"[{i}/{len(rows)}] FBref fetch failed: {e}")
+                    continue
+                if resp is not None:
+                    pending.append((r, ex.submit(resp.content, resp.sha256)))
+                drain()
+
+                if i % 25 == 0:
+                    print(f"  …{i}/{len(rows)} players ingested")
+            drain(block=True)
+            print(f"FBref pages parsed={ex.parsed}, served from parse cache={ex.hits}")
+        up.flush()
+        print(f"FBref season rows upserted: {up.total}")
+        return up.total
 
 if __name__ == "__main__":
     main()
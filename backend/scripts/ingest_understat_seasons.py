@@ -1,17 +1,26 @@
 # backend/scripts/ingest_understat_seasons.py
-import os, re, json, time
-import requests
+import os, re, json, time, asyncio
+import httpx
 from sqlalchemy import create_engine, text
 
+from app.services.http_cache import http_cache
+from app.services.rate_limit import TokenBucket, acall_with_limit, get_limiter
+from scripts.aio import run_coro
+from scripts.bulk_upsert import BulkUpserter
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; fpl-ai/1.0; +https://github.com/dudeness37/fplassistant)",
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     "Accept-Language": "en-US,en;q=0.9",
 }
 
-SLEEP_BETWEEN = float(os.getenv("UNDERSTAT_SLEEP", "0.2"))
+CONCURRENCY = int(os.getenv("UNDERSTAT_CONCURRENCY", "8"))
+RATE        = float(os.getenv("UNDERSTAT_RATE", "5"))       # requests per second
+BURST       = float(os.getenv("UNDERSTAT_BURST", "5"))
+BATCH_ROWS  = int(os.getenv("UNDERSTAT_BATCH_ROWS", "500"))  # rows per multi-row upsert
 OFFSET = int(os.getenv("OFFSET", "0"))
 LIMIT  = os.getenv("LIMIT")  # may be None
+CONSUMER = "scripts.ingest_understat_seasons"
 
 def safe_float(x, default=0.0):
     try:
@@ -33,21 +42,11 @@ def get_provider_id(conn, code: str) -> int:
         LIMIT 1
     """), {"c": code}).scalar_one()
 
-def fetch_understat_seasons(understat_id: str):
+def parse_understat_seasons(html: str):
     """
-    Returns a list (possibly empty) of season dicts.
-    Never returns None.
+    Extract the seasonsData list from an Understat player page.
+    Returns a list (possibly empty) of season dicts, never None.
     """
-    url = f"https://understat.com/player/{understat_id}"
-    try:
-        r = requests.get(url, headers=HEADERS, timeout=20)
-        if r.status_code == 404:
-            return []  # player page not found -> no data
-        r.raise_for_status()
-        html = r.text
-    except Exception:
-        return []  # network/HTTP error -> skip
-
     # Try to extract seasonsData = JSON.parse('....')
     # Handle escaped content & minor variations
     m = re.search(r"seasonsData\s*=\s*JSON\.parse\('([^']+)'\)", html)
@@ -75,6 +74,124 @@ def fetch_understat_seasons(understat_id: str):
     except Exception:
         return []
 
+async def fetch_player_page(client: httpx.AsyncClient, bucket: TokenBucket, understat_id: str):
+    """
+    Returns the cached player page response (check `.changed` before parsing),
+    or None on 404 / network / HTTP error.
+    """
+    try:
+        r = await acall_with_limit(bucket, lambda: http_cache.aget(
+            f"https://understat.com/player/{understat_id}", client=client, consumer=CONSUMER))
+        if r.status_code == 404:
+            return None  # player page not found -> no data
+        r.raise_for_status()
+        return r
+    except Exception:
+        return None  # network/HTTP error -> skip
+
+def season_rows(player_id: int, prov_id: int, seasons: list) -> list:
+    out = []
+    for s in seasons:
+        minutes = safe_float(s.get("time"))
+        out.append({
+            "player_id": player_id, "provider_id": prov_id,
+            "season": str(s.get("season") or ""),
+            # Normalize for unique index
+            "team": (s.get("team_title") or s.get("team") or "").strip(),
+            "comp": (s.get("league") or "").strip(),
+            "minutes": minutes,
+            "goals": safe_float(s.get("goals")),
+            "assists": safe_float(s.get("assists")),
+            "xg": safe_float(s.get("xG")),
+            "xa": safe_float(s.get("xA")),
+            "shots": safe_float(s.get("shots")),
+            "key_passes": safe_float(s.get("key_passes")),
+            "nineties": (minutes / 90.0) if minutes else 0.0,
+        })
+    return out
+
+def season_upserter(engine) -> BulkUpserter:
+    return BulkUpserter(
+        engine, "external_player_seasons",
+        columns=["player_id", "provider_id", "season", "team", "comp",
+                 "minutes", "goals", "assists", "xg", "xa", "shots", "key_passes", "nineties"],
+        conflict=["player_id", "provider_id", "season", "team", "comp"],
+        chunk_size=BATCH_ROWS, label="understat seasons",
+    )
+
+async def ingest(engine, prov_id: int, rows) -> int:
+    """
+    Fetch player pages concurrently (bounded by CONCURRENCY and the RATE token bucket),
+    parse them in worker threads and hand season rows to a single batching writer.
+    """
+    total = len(rows)
+    bucket = get_limiter("understat", RATE, BURST)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=CONCURRENCY * 4)
+    todo: asyncio.Queue = asyncio.Queue()
+    for r in rows:
+        todo.put_nowait(r)
+    done = 0
+    unchanged = 0
+    upserts = 0
+    fetched = []  # (key, sha256) of pages to acknowledge once their rows are flushed
+
+    async def writer():
+        nonlocal upserts
+        up = season_upserter(engine)
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            # add_many flushes a chunk once BATCH_ROWS accumulate; keep DB I/O off the loop
+            await asyncio.to_thread(up.add_many, item)
+        await asyncio.to_thread(up.flush)
+        upserts = up.total
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal done, unchanged
+        while True:
+            try:
+                r = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            resp = await fetch_player_page(client, bucket, str(r["understat_id"]))
+            done += 1
+            if resp is not None and not resp.changed:
+                unchanged += 1  # page identical to the one already ingested
+                continue
+            # No data for this player (new/unknown on Understat is normal)
+            seasons = await asyncio.to_thread(parse_understat_seasons, resp.text) if resp else []
+            if seasons:
+                await queue.put(season_rows(r["player_id"], prov_id, seasons))
+            if resp is not None:
+                fetched.append((resp.key, resp.sha256))
+            if done % 25 == 0:
+                print(f"  …{done}/{total} players processed")
+
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    async with httpx.AsyncClient(headers=HEADERS, timeout=20, limits=limits, follow_redirects=True) as client:
+        # One TaskGroup: a failing writer cancels the producers (nobody is left
+        # blocked on the full queue); a failing worker cancels its siblings, but
+        # the writer still flushes the rows already queued before the error propagates
+        async with asyncio.TaskGroup() as tg:
+            writer_task = tg.create_task(writer())
+
+            async def produce():
+                try:
+                    async with asyncio.TaskGroup() as workers:
+                        for _ in range(CONCURRENCY):
+                            workers.create_task(worker(client))
+                finally:
+                    if not writer_task.done():
+                        await queue.put(None)
+
+            tg.create_task(produce())
+    for key, sha256 in fetched:
+        http_cache.ack_key(key, sha256, CONSUMER)
+    if unchanged:
+        print(f"  {unchanged} player pages unchanged since last ingest, skipped")
+    return upserts
+
 def main():
     engine = create_engine(os.environ["DATABASE_URL"], pool_pre_ping=True)
 
@@ -97,73 +214,12 @@ def main():
             rows = conn.execute(q, {"prov": prov_id, "o": OFFSET}).mappings().all()
 
     total = len(rows)
-    print(f"Ingesting Understat seasons for {total} players… (OFFSET={OFFSET}, LIMIT={LIMIT or 'ALL'})")
-    upserts = 0
-
-    with engine.begin() as conn:
-        for i, r in enumerate(rows, 1):
-            pid  = r["player_id"]
-            usid = str(r["understat_id"])
-
-            seasons = fetch_understat_seasons(usid)
-            if not seasons:
-                # No data for this player (new/unknown on Understat is normal)
-                if i % 25 == 0:
-                    print(f"  …{i}/{total} players processed (no seasons for some)")
-                time.sleep(SLEEP_BETWEEN)
-                continue
-
-            for s in seasons:
-                season   = str(s.get("season") or "")
-                team     = (s.get("team_title") or s.get("team") or "").strip()
-                comp     = (s.get("league") or "").strip()
-
-                games    = safe_int(s.get("games"))
-                starts   = safe_int(s.get("starts"))
-                minutes  = safe_float(s.get("time"))
-                goals    = safe_float(s.get("goals"))
-                assists  = safe_float(s.get("assists"))
-                shots    = safe_float(s.get("shots"))
-                key_ps   = safe_float(s.get("key_passes"))
-                xg       = safe_float(s.get("xG"))
-                xa       = safe_float(s.get("xA"))
-                nineties = (minutes / 90.0) if minutes else 0.0
-
-                # Normalize for unique index
-                team = team or ""
-                comp = comp or ""
-
-                conn.execute(text("""
-                  INSERT INTO external_player_seasons
-                    (player_id, provider_id, season, team, comp,
-                     minutes, goals, assists, xg, xa, shots, key_passes, nineties, updated_at)
-                  VALUES
-                    (:player_id, :prov, :season, :team, :comp,
-                     :minutes, :goals, :assists, :xg, :xa, :shots, :kp, :n90, NOW())
-                  ON CONFLICT (player_id, provider_id, season, team, comp)
-                  DO UPDATE SET
-                    minutes    = EXCLUDED.minutes,
-                    goals      = EXCLUDED.goals,
-                    assists    = EXCLUDED.assists,
-                    xg         = EXCLUDED.xg,
-                    xa         = EXCLUDED.xa,
-                    shots      = EXCLUDED.shots,
-                    key_passes = EXCLUDED.key_passes,
-                    nineties   = EXCLUDED.nineties,
-                    updated_at = NOW()
-                """), {
-                    "player_id": pid, "prov": prov_id, "season": season,
-                    "team": team, "comp": comp,
-                    "minutes": minutes, "goals": goals, "assists": assists,
-                    "xg": xg, "xa": xa, "shots": shots, "kp": key_ps, "n90": nineties
-                })
-                upserts += 1
-
-            if i % 25 == 0:
-                print(f"  …{i}/{total} players processed")
-            time.sleep(SLEEP_BETWEEN)
-
-    print(f"Understat seasons ingest ✓ rows upserted≈{upserts}")
+    print(f"Ingesting Understat seasons for {total} players… (OFFSET={OFFSET}, LIMIT={LIMIT or 'ALL'}, "
+          f"concurrency={CONCURRENCY}, rate={RATE}/s)")
+    t0 = time.time()
+    upserts = run_coro(ingest(engine, prov_id, rows))
+    print(f"Understat seasons ingest ✓ rows upserted≈{upserts} in {time.time() - t0:.0f}s")
+    return upserts
 
 if __name__ == "__main__":
     main()
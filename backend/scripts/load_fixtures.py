@@ -1,40 +1,133 @@
-import json, urllib.request, os
+import os
 from sqlalchemy import create_engine, text
 
-def get_json(url: str):
-    with urllib.request.urlopen(url, timeout=30) as r:
-        return json.loads(r.read().decode('utf-8'))
-
-print('Downloading fixtures…')
-fx = get_json('https://fantasy.premierleague.com/api/fixtures/')
-
-engine = create_engine(os.environ['DATABASE_URL'], pool_pre_ping=True, future=True)
-
-with engine.begin() as conn:
-    conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ux_fixtures_gw_ha ON fixtures(gw, home_team_id, away_team_id)'))
-
-    # FPL team id -> internal teams.id
-    team_map = {int(fpl): int(tid) for fpl,tid in conn.execute(text('SELECT fpl_team_id, team_id FROM teams_id_map'))}
-
-    ins = text("""
-      INSERT INTO fixtures (gw, home_team_id, away_team_id)
-      VALUES (:gw, :home_id, :away_id)
-      ON CONFLICT (gw, home_team_id, away_team_id) DO NOTHING
-    """)
-
-    inserted = 0
-    for f in fx:
-        gw = f.get('event')
-        th = f.get('team_h')
-        ta = f.get('team_a')
-        if gw is None or th is None or ta is None:
-            continue
-        home_id = team_map.get(int(th))
-        away_id = team_map.get(int(ta))
-        if not home_id or not away_id:
-            continue
-        r = conn.execute(ins, {'gw': int(gw), 'home_id': int(home_id), 'away_id': int(away_id)})
-        inserted += r.rowcount or 0
-
-    total = conn.execute(text('SELECT COUNT(*) FROM fixtures')).scalar()
-    print(f'Fixtures upsert ✓ inserted_now={inserted}, total={total}')
+from app.services.http_cache import http_cache
+
+FIXTURES_URL = 'https://fantasy.premierleague.com/api/fixtures/'
+CONSUMER = 'scripts.load_fixtures'
+
+# The whole fixture list is loaded into a temp staging table and applied with a
+# handful of set-based statements in ONE transaction, so readers (the EP engine)
+# see either the old or the new schedule, never a mix. A fixture is identified
+# by its (home, away) pairing, which is unique within a season; a reschedule is
+# an UPDATE of its gw, a fixture with no GW (postponed, not yet rescheduled) is
+# removed until FPL assigns it one.
+
+STAGE_DDL = """
+  CREATE TEMP TABLE fixtures_stage (
+    gw INT,
+    home_team_id INT NOT NULL,
+    away_team_id INT NOT NULL,
+    PRIMARY KEY (home_team_id, away_team_id)
+  ) ON COMMIT DROP
+"""
+
+# Leftovers of earlier reschedules: keep one row per pairing (the one already at
+# the staged gw, else the oldest) so the UPDATE below cannot collide
+DEDUPE = """
+  DELETE FROM fixtures f
+  USING (
+    SELECT f.id, ROW_NUMBER() OVER (
+             PARTITION BY f.home_team_id, f.away_team_id
+             ORDER BY (f.gw IS NOT DISTINCT FROM s.gw) DESC, f.id) AS rn
+    FROM fixtures f
+    JOIN fixtures_stage s USING (home_team_id, away_team_id)
+  ) d
+  WHERE d.id = f.id AND d.rn > 1
+  RETURNING f.gw AS old_gw, NULL::int AS new_gw, f.home_team_id, f.away_team_id
+"""
+
+UNSCHEDULE = """
+  DELETE FROM fixtures f
+  USING fixtures_stage s
+  WHERE s.home_team_id = f.home_team_id AND s.away_team_id = f.away_team_id
+    AND s.gw IS NULL
+  RETURNING f.gw AS old_gw, NULL::int AS new_gw, f.home_team_id, f.away_team_id
+"""
+
+# self-join on `old` to return the gw before the update
+MOVE = """
+  UPDATE fixtures f
+  SET gw = s.gw
+  FROM fixtures_stage s, fixtures old
+  WHERE s.home_team_id = f.home_team_id AND s.away_team_id = f.away_team_id
+    AND old.id = f.id
+    AND s.gw IS NOT NULL AND f.gw IS DISTINCT FROM s.gw
+  RETURNING old.gw AS old_gw, f.gw AS new_gw, f.home_team_id, f.away_team_id
+"""
+
+INSERT_NEW = """
+  INSERT INTO fixtures (gw, home_team_id, away_team_id)
+  SELECT s.gw, s.home_team_id, s.away_team_id
+  FROM fixtures_stage s
+  WHERE s.gw IS NOT NULL
+    AND NOT EXISTS (
+      SELECT 1 FROM fixtures f
+      WHERE f.home_team_id = s.home_team_id AND f.away_team_id = s.away_team_id)
+  ON CONFLICT (gw, home_team_id, away_team_id) DO NOTHING
+  RETURNING NULL::int AS old_gw, gw AS new_gw, home_team_id, away_team_id
+"""
+
+def team_gws(rows) -> set:
+    """(team_id, gw) pairs touched by returned (old_gw, new_gw, home, away) rows."""
+    out = set()
+    for old_gw, new_gw, home, away in rows:
+        for gw in (old_gw, new_gw):
+            if gw is not None:
+                out.add((int(home), int(gw)))
+                out.add((int(away), int(gw)))
+    return out
+
+def main(force: bool = False):
+    print('Downloading fixtures…')
+    resp = http_cache.get(FIXTURES_URL, timeout=30, consumer=CONSUMER)
+    resp.raise_for_status()
+    if not resp.changed and not force:
+        print('fixtures unchanged since last load, skipped')
+        return {'inserted': 0, 'updated': 0, 'deleted': 0, 'changed': [], 'payload_unchanged': True}
+    fx = resp.json()
+
+    engine = create_engine(os.environ['DATABASE_URL'], pool_pre_ping=True, future=True)
+
+    with engine.begin() as conn:
+        conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ux_fixtures_gw_ha ON fixtures(gw, home_team_id, away_team_id)'))
+
+        # FPL team id -> internal teams.id
+        team_map = {int(fpl): int(tid) for fpl,tid in conn.execute(text('SELECT fpl_team_id, team_id FROM teams_id_map'))}
+
+        staged = {}
+        for f in fx:
+            th = f.get('team_h')
+            ta = f.get('team_a')
+            if th is None or ta is None:
+                continue
+            home_id = team_map.get(int(th))
+            away_id = team_map.get(int(ta))
+            if not home_id or not away_id:
+                continue
+            gw = f.get('event')
+            staged[(home_id, away_id)] = {'gw': int(gw) if gw is not None else None,
+                                          'home_team_id': home_id, 'away_team_id': away_id}
+        if not staged:
+            print('no mappable fixtures in payload, nothing applied')
+            return {'inserted': 0, 'updated': 0, 'deleted': 0, 'changed': []}
+
+        conn.execute(text(STAGE_DDL))
+        conn.execute(text('INSERT INTO fixtures_stage (gw, home_team_id, away_team_id) '
+                          'VALUES (:gw, :home_team_id, :away_team_id)'), list(staged.values()))
+
+        deleted = conn.execute(text(DEDUPE)).all() + conn.execute(text(UNSCHEDULE)).all()
+        moved = conn.execute(text(MOVE)).all()
+        inserted = conn.execute(text(INSERT_NEW)).all()
+        changed = team_gws(deleted) | team_gws(moved) | team_gws(inserted)
+
+        total = conn.execute(text('SELECT COUNT(*) FROM fixtures')).scalar()
+        print(f'Fixtures ✓ inserted={len(inserted)}, moved={len(moved)}, removed={len(deleted)}, '
+              f'changed team-GWs={len(changed)}, total={total}')
+
+    http_cache.ack(resp, CONSUMER)
+    return {'inserted': len(inserted), 'updated': len(moved), 'deleted': len(deleted),
+            'changed': sorted(changed)}
+
+if __name__ == '__main__':
+    main()
@@ -1,76 +1,167 @@
-import json, urllib.request, os, time
+import os, json, time, asyncio, datetime as dt
+from typing import Optional
+import httpx
 from sqlalchemy import create_engine, text
 
-SEASON = os.environ.get('SEASON', '2024/25')
-LIMIT  = int(os.environ.get('LIMIT', '0'))  # 0 = all
-
-def get_json(url: str):
-    with urllib.request.urlopen(url, timeout=30) as r:
-        return json.loads(r.read().decode('utf-8'))
-
-engine = create_engine(os.environ['DATABASE_URL'], pool_pre_ping=True, future=True)
-
-with engine.begin() as conn:
-    conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ux_player_gw_stats_player_gw_season ON player_gw_stats(player_id, gw, season)'))
-
-players = []
-with engine.connect() as conn:
-    q = text('SELECT p.id, pim.fpl_id FROM players p JOIN players_id_map pim ON pim.player_id = p.id ORDER BY p.id')
-    for row in conn.execute(q):
-        players.append((int(row.id), int(row.fpl_id)))
-
-if LIMIT and LIMIT > 0:
-    players = players[:LIMIT]
-
-print(f'Fetching element summaries for {len(players)} players… (season={SEASON})')
-
-ins = text("""
-  INSERT INTO player_gw_stats
-    (player_id, gw, season, minutes, points, xG, xA, shots, key_passes, bonus)
-  VALUES
-    (:player_id, :gw, :season, :minutes, :points, :xg, :xa, :shots, :kp, :bonus)
-  ON CONFLICT (player_id, gw, season) DO UPDATE
-    SET minutes = EXCLUDED.minutes,
-        points  = EXCLUDED.points,
-        xG      = EXCLUDED.xG,
-        xA      = EXCLUDED.xA,
-        shots   = EXCLUDED.shots,
-        key_passes = EXCLUDED.key_passes,
-        bonus   = EXCLUDED.bonus
-""")
-
-inserted = 0
-with engine.begin() as conn:
-    for i, (pid, fid) in enumerate(players, 1):
-        try:
-            data = get_json(f'https://fantasy.premierleague.com/api/element-summary/{fid}/')
-        except Exception as e:
-            print(f'  ! skip fpl_id={fid}: {e}')
+from app.services.rate_limit import TokenBucket, acall_with_limit, get_limiter
+from scripts import checkpoints
+from scripts.aio import run_coro
+from scripts.bulk_upsert import BulkUpserter
+
+CHECKPOINT_SOURCE = 'fpl_element_summary'
+CONCURRENCY = int(os.environ.get('FPL_HISTORY_CONCURRENCY', '8'))
+RATE        = float(os.environ.get('FPL_HISTORY_RATE', '4'))    # requests per second
+BURST       = float(os.environ.get('FPL_HISTORY_BURST', '4'))
+BATCH_ROWS  = int(os.environ.get('FPL_HISTORY_BATCH_ROWS', '500'))
+# Players checkpointed more recently than this are not refetched (resume after a crash); 0 = always revalidate
+MAX_AGE_S   = float(os.environ.get('FPL_HISTORY_MAX_AGE_S', '21600'))
+
+HEADERS = {'User-Agent': 'FPL-Assistant/1.0', 'Accept': 'application/json'}
+
+def history_rows(pid: int, season: str, data: dict) -> list:
+    out = []
+    # Current season GW logs
+    for h in data.get('history', []):
+        gw = int(h.get('round') or 0)
+        if not gw:
             continue
+        out.append({
+            'player_id': pid,
+            'gw': gw,
+            'season': season,
+            'minutes': int(h.get('minutes') or 0),
+            'points':  int(h.get('total_points') or 0),
+            'xg': float(h.get('expected_goals') or 0.0),
+            'xa': float(h.get('expected_assists') or 0.0),
+            # FPL element history doesn’t include shots/key_passes — store 0 (OK for now)
+            'shots': int(h.get('shots') or 0),
+            'key_passes': int(h.get('key_passes') or 0),
+            'bonus': int(h.get('bonus') or 0),
+        })
+    return out
+
+async def fetch_summary(client: httpx.AsyncClient, bucket: TokenBucket, fid: int) -> Optional[bytes]:
+    try:
+        r = await acall_with_limit(bucket, lambda: client.get(f'https://fantasy.premierleague.com/api/element-summary/{fid}/'))
+        r.raise_for_status()
+        return r.content
+    except Exception as e:
+        print(f'  ! skip fpl_id={fid}: {e}')
+        return None
+
+def write_batch(engine, season: str, rows: list, digests: dict) -> int:
+    """Upsert one batch of GW rows and the checkpoints of the players it covers, atomically."""
+    with engine.begin() as conn:
+        with BulkUpserter(conn, 'player_gw_stats',
+                          ['player_id', 'gw', 'season', 'minutes', 'points', 'xg', 'xa', 'shots', 'key_passes', 'bonus'],
+                          conflict=['player_id', 'gw', 'season'], touch=None,
+                          chunk_size=BATCH_ROWS, label='player_gw_stats') as up:
+            up.add_many(rows)
+        checkpoints.save_many(conn, CHECKPOINT_SOURCE, {f'{season}:{fid}': h for fid, h in digests.items()})
+    return len(rows)
 
-        # Current season GW logs
-        for h in data.get('history', []):
-            gw = int(h.get('round') or 0)
-            if not gw:
+async def load(engine, season: str, players: list, known: dict) -> dict:
+    stats = {'fetched': 0, 'unchanged': 0, 'failed': 0, 'upserted': 0}
+    bucket = get_limiter('fpl', RATE, BURST)
+    todo: asyncio.Queue = asyncio.Queue()
+    for p in players:
+        todo.put_nowait(p)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=CONCURRENCY * 4)
+    done = 0
+
+    async def writer():
+        rows, digests = [], {}
+        while True:
+            item = await queue.get()
+            if item is not None:
+                fid, digest, player_rows = item
+                rows.extend(player_rows)
+                digests[fid] = digest
+            if digests and (item is None or len(rows) >= BATCH_ROWS):
+                stats['upserted'] += await asyncio.to_thread(write_batch, engine, season, rows, digests)
+                rows, digests = [], {}
+            if item is None:
+                break
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal done
+        while True:
+            try:
+                pid, fid = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            body = await fetch_summary(client, bucket, fid)
+            done += 1
+            if done % 25 == 0:
+                print(f'  …{done}/{len(players)} players done')
+            if body is None:
+                stats['failed'] += 1
+                continue
+            stats['fetched'] += 1
+            digest = checkpoints.content_hash(body)
+            if known.get(fid) == digest:
+                stats['unchanged'] += 1
+                await queue.put((fid, digest, []))  # only bumps the checkpoint's fetched_at
                 continue
-            payload = {
-                'player_id': pid,
-                'gw': gw,
-                'season': SEASON,
-                'minutes': int(h.get('minutes') or 0),
-                'points':  int(h.get('total_points') or 0),
-                'xg': float(h.get('expected_goals') or 0.0),
-                'xa': float(h.get('expected_assists') or 0.0),
-                # FPL element history doesn’t include shots/key_passes — store 0 (OK for now)
-                'shots': int(h.get('shots') or 0),
-                'kp': int(h.get('key_passes') or 0),
-                'bonus': int(h.get('bonus') or 0),
-            }
-            r = conn.execute(ins, payload)
-            inserted += r.rowcount or 0
-
-        if i % 25 == 0:
-            print(f'  …{i}/{len(players)} players done')
-        time.sleep(0.3)  # be kind to FPL
-
-print(f'Player GW history upsert ✓ inserted_rows≈{inserted}')
+            await queue.put((fid, digest, history_rows(pid, season, json.loads(body))))
+
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    async with httpx.AsyncClient(headers=HEADERS, timeout=30, limits=limits) as client:
+        # A failing writer cancels the producers (nobody is left blocked on the
+        # full queue); a failing worker cancels its siblings, but the writer still
+        # flushes what completed so a rerun resumes from here
+        async with asyncio.TaskGroup() as tg:
+            writer_task = tg.create_task(writer())
+
+            async def produce():
+                try:
+                    async with asyncio.TaskGroup() as workers:
+                        for _ in range(CONCURRENCY):
+                            workers.create_task(worker(client))
+                finally:
+                    if not writer_task.done():
+                        await queue.put(None)
+
+            tg.create_task(produce())
+    return stats
+
+def main(season: Optional[str] = None, limit: Optional[int] = None) -> dict:
+    season = season or os.environ.get('SEASON', '2024/25')
+    limit = limit if limit is not None else int(os.environ.get('LIMIT', '0'))  # 0 = all
+
+    engine = create_engine(os.environ['DATABASE_URL'], pool_pre_ping=True, future=True)
+
+    with engine.begin() as conn:
+        conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ux_player_gw_stats_player_gw_season ON player_gw_stats(player_id, gw, season)'))
+        checkpoints.ensure_table(conn)
+        q = text('SELECT p.id, pim.fpl_id FROM players p JOIN players_id_map pim ON pim.player_id = p.id ORDER BY p.id')
+        players = [(int(row.id), int(row.fpl_id)) for row in conn.execute(q)]
+        saved = checkpoints.load_all(conn, CHECKPOINT_SOURCE)
+
+    if limit and limit > 0:
+        players = players[:limit]
+
+    # Split checkpoints into "fresh enough to skip" and "known hash to compare against"
+    now = dt.datetime.now(dt.timezone.utc)
+    known, fresh = {}, set()
+    prefix = f'{season}:'
+    for key, (digest, fetched_at) in saved.items():
+        if not key.startswith(prefix):
+            continue
+        fid = int(key[len(prefix):])
+        known[fid] = digest
+        if MAX_AGE_S > 0 and fetched_at is not None and (now - fetched_at).total_seconds() < MAX_AGE_S:
+            fresh.add(fid)
+    pending = [p for p in players if p[1] not in fresh]
+
+    print(f'Fetching element summaries for {len(pending)} players… (season={season}, '
+          f'resumed past {len(players) - len(pending)}, concurrency={CONCURRENCY}, rate={RATE}/s)')
+    t0 = time.time()
+    stats = run_coro(load(engine, season, pending, known))
+    stats['resumed'] = len(players) - len(pending)
+    print(f"Player GW history upsert ✓ rows={stats['upserted']}, unchanged_players={stats['unchanged']}, "
+          f"failed={stats['failed']} in {time.time() - t0:.0f}s")
+    return stats
+
+if __name__ == '__main__':
+    main()
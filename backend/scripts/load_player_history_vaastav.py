@@ -1,14 +1,16 @@
 # /app/scripts/load_player_history_vaastav.py
-import os, csv, io, sys, time
-from typing import Optional
-import requests
+import os, csv, io, asyncio, time
+from typing import Iterator, Optional
+import httpx
 from sqlalchemy import create_engine, text
 
-# Env
-DATABASE_URL = os.environ["DATABASE_URL"]  # already points to Neon (postgresql+psycopg://...)
-SEASON = os.environ.get("SEASON", "2023/24")   # season label stored in DB
-FROM_GW = int(os.environ.get("FROM_GW", "1"))
-TO_GW   = int(os.environ.get("TO_GW", "38"))
+from scripts import checkpoints
+from scripts.aio import run_coro
+
+CHECKPOINT_SOURCE = "vaastav_gw_csv"
+CONCURRENCY = int(os.environ.get("VAASTAV_CONCURRENCY", "6"))
+
+COPY_COLS = ["player_id", "season", "gw", "minutes", "points", "xg", "xa", "shots", "key_passes", "bonus"]
 
 # Map '2023/24' -> '2023-24' folder name in vaastav repo
 def season_folder(season_text: str) -> str:
@@ -19,114 +21,148 @@ def gw_csv_url(season_text: str, gw: int) -> str:
     base = "https://raw.githubusercontent.com/vaastav/Fantasy-Premier-League/master/data"
     return f"{base}/{season_folder(season_text)}/gws/gw{gw}.csv"
 
-def get_csv(url: str) -> Optional[str]:
-    try:
-        r = requests.get(url, timeout=30)
-        if r.status_code == 200 and r.text.strip():
-            return r.text
-        return None
-    except Exception as e:
-        print(f"  WARN: fetch failed {url}: {e}")
-        return None
-
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-
-# Prepare statements
-UPSERT_SQL = text("""
-INSERT INTO player_gw_stats
-  (player_id, season, gw, minutes, points, xG, xA, shots, key_passes, bonus)
-VALUES
-  (:player_id, :season, :gw, :minutes, :points, :xg, :xa, :shots, :key_passes, :bonus)
-ON CONFLICT ON CONSTRAINT ux_player_gw_stats_player_gw_season
-DO UPDATE SET
-  minutes      = EXCLUDED.minutes,
-  points       = EXCLUDED.points,
-  xG           = EXCLUDED.xG,
-  xA           = EXCLUDED.xA,
-  shots        = EXCLUDED.shots,
-  key_passes   = EXCLUDED.key_passes,
-  bonus        = EXCLUDED.bonus;
-""")
-
-# Build a dict fpl_id -> player_id (internal)
-with engine.connect() as conn:
-    rows = conn.execute(text("SELECT fpl_id, player_id FROM players_id_map")).fetchall()
-fpl_to_internal = {int(r[0]): int(r[1]) for r in rows if r[0] is not None and r[1] is not None}
-print(f"Loaded players_id_map: {len(fpl_to_internal)} mappings")
-
-inserted = 0
-skipped_no_map = 0
-skipped_rows = 0
-
-for gw in range(FROM_GW, TO_GW + 1):
-    url = gw_csv_url(SEASON, gw)
-    print(f"Fetching GW{gw} CSV… {url}")
-    csv_text = get_csv(url)
-    if not csv_text:
-        print(f"  GW{gw}: no CSV found (maybe season/gw missing in repo).")
-        continue
-
-    buf = io.StringIO(csv_text)
-    reader = csv.DictReader(buf)
-    batch = []
-    for row in reader:
-        # vaastav columns vary by season but commonly include:
-        # element (FPL player id), minutes, total_points, xG, xA, shots, key_passes, bonus
+async def get_csv(client: httpx.AsyncClient, sem: asyncio.Semaphore, url: str) -> Optional[str]:
+    async with sem:
         try:
-            fpl_id = int(row.get("element") or 0)
-        except:
-            fpl_id = 0
+            r = await client.get(url)
+            if r.status_code == 200 and r.text.strip():
+                return r.text
+            return None
+        except Exception as e:
+            print(f"  WARN: fetch failed {url}: {e}")
+            return None
+
+def to_int(x, default=0):
+    try:
+        return int(float(x))
+    except (TypeError, ValueError):
+        return default
+
+def to_float(x, default=None):
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return default
+
+def iter_gw_rows(csv_text: str, season: str, gw: int, fpl_to_internal: dict, stats: dict) -> Iterator[tuple]:
+    """
+    Stream the CSV into COPY-ready tuples without materialising a batch.
+    vaastav columns vary by season but commonly include:
+    element (FPL player id), minutes, total_points, xG, xA, shots, key_passes, bonus
+    """
+    for row in csv.DictReader(io.StringIO(csv_text)):
+        fpl_id = to_int(row.get("element"))
         if not fpl_id:
-            skipped_rows += 1
+            stats["skipped_rows"] += 1
             continue
 
         player_id = fpl_to_internal.get(fpl_id)
         if not player_id:
-            skipped_no_map += 1
+            stats["skipped_no_map"] += 1
             continue
 
-        def to_int(x, default=0):
-            try:
-                return int(float(x))
-            except:
-                return default
-
-        def to_float(x, default=None):
-            try:
-                return float(x)
-            except:
-                return default
-
-        minutes = to_int(row.get("minutes"))
-        points  = to_float(row.get("total_points"), 0.0)
-        xg      = to_float(row.get("xG"))
-        xa      = to_float(row.get("xA"))
-        shots   = to_int(row.get("shots"))
-        kps     = to_int(row.get("key_passes"))
-        bonus   = to_int(row.get("bonus"))
-
-        batch.append({
-            "player_id": player_id,
-            "season": SEASON,
-            "gw": gw,
-            "minutes": minutes,
-            "points": points,
-            "xg": xg,
-            "xa": xa,
-            "shots": shots,
-            "key_passes": kps,
-            "bonus": bonus
-        })
-
-    if not batch:
-        print(f"  GW{gw}: nothing to insert")
-        continue
+        yield (
+            player_id, season, gw,
+            to_int(row.get("minutes")),
+            to_float(row.get("total_points"), 0.0),
+            to_float(row.get("xG")),
+            to_float(row.get("xA")),
+            to_int(row.get("shots")),
+            to_int(row.get("key_passes")),
+            to_int(row.get("bonus")),
+        )
+
+def load_gw(engine, season: str, gw: int, csv_text: str, fpl_to_internal: dict, stats: dict) -> Optional[int]:
+    """
+    COPY one gameweek into a staging table and merge it in one statement, in one
+    transaction together with its checkpoint. Returns None when the CSV hash is unchanged.
+    """
+    key = f"{season}:gw{gw}"
+    digest = checkpoints.content_hash(csv_text)
 
     with engine.begin() as conn:
-        for rec in batch:
-            conn.execute(UPSERT_SQL, rec)
-            inserted += 1
-
-    print(f"  GW{gw}: upserted {len(batch)} rows")
-
-print(f"Done. Inserted/updated rows: {inserted}, skipped_no_map={skipped_no_map}, skipped_rows={skipped_rows}")
+        if checkpoints.get_hash(conn, CHECKPOINT_SOURCE, key) == digest:
+            return None
+
+        conn.execute(text("""
+          CREATE TEMP TABLE IF NOT EXISTS stage_player_gw_stats (
+            player_id INT, season TEXT, gw INT, minutes INT, points NUMERIC,
+            xg NUMERIC, xa NUMERIC, shots INT, key_passes INT, bonus INT
+          ) ON COMMIT DROP
+        """))
+        raw = conn.connection.dbapi_connection  # psycopg3, same transaction
+        with raw.cursor() as cur:
+            with cur.copy(f"COPY stage_player_gw_stats ({', '.join(COPY_COLS)}) FROM STDIN") as cp:
+                for rec in iter_gw_rows(csv_text, season, gw, fpl_to_internal, stats):
+                    cp.write_row(rec)
+
+        # Double gameweeks list a player twice: sum them into one row per player
+        n = conn.execute(text("""
+          INSERT INTO player_gw_stats
+            (player_id, season, gw, minutes, points, xG, xA, shots, key_passes, bonus)
+          SELECT player_id, season, gw,
+                 SUM(minutes), SUM(points), SUM(xg), SUM(xa), SUM(shots), SUM(key_passes), SUM(bonus)
+          FROM stage_player_gw_stats
+          GROUP BY player_id, season, gw
+          ON CONFLICT ON CONSTRAINT ux_player_gw_stats_player_gw_season
+          DO UPDATE SET
+            minutes      = EXCLUDED.minutes,
+            points       = EXCLUDED.points,
+            xG           = EXCLUDED.xG,
+            xA           = EXCLUDED.xA,
+            shots        = EXCLUDED.shots,
+            key_passes   = EXCLUDED.key_passes,
+            bonus        = EXCLUDED.bonus
+        """)).rowcount or 0
+
+        checkpoints.save(conn, CHECKPOINT_SOURCE, key, digest)
+    return n
+
+async def load_season(engine, season: str, from_gw: int, to_gw: int, fpl_to_internal: dict) -> dict:
+    stats = {"upserted": 0, "unchanged_gws": 0, "missing_gws": 0, "skipped_no_map": 0, "skipped_rows": 0}
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def fetch(gw: int):
+        return gw, await get_csv(client, sem, gw_csv_url(season, gw))
+
+    async with httpx.AsyncClient(timeout=30, follow_redirects=True) as client:
+        print(f"Fetching GW{from_gw}..GW{to_gw} CSVs for {season} (concurrency={CONCURRENCY})…")
+        for next_done in asyncio.as_completed([fetch(gw) for gw in range(from_gw, to_gw + 1)]):
+            gw, csv_text = await next_done
+            if not csv_text:
+                print(f"  GW{gw}: no CSV found (maybe season/gw missing in repo).")
+                stats["missing_gws"] += 1
+                continue
+            # DB work is blocking; run it off the loop while other downloads continue
+            n = await asyncio.to_thread(load_gw, engine, season, gw, csv_text, fpl_to_internal, stats)
+            if n is None:
+                print(f"  GW{gw}: unchanged since last load, skipped")
+                stats["unchanged_gws"] += 1
+            else:
+                print(f"  GW{gw}: upserted {n} rows")
+                stats["upserted"] += n
+    return stats
+
+def main(season: Optional[str] = None, from_gw: Optional[int] = None, to_gw: Optional[int] = None) -> dict:
+    # Env defaults are read per call so the scheduler can re-run this with a different season
+    season = season or os.environ.get("SEASON", "2023/24")   # season label stored in DB
+    from_gw = from_gw or int(os.environ.get("FROM_GW", "1"))
+    to_gw = to_gw or int(os.environ.get("TO_GW", "38"))
+
+    engine = create_engine(os.environ["DATABASE_URL"], pool_pre_ping=True)
+    with engine.begin() as conn:
+        checkpoints.ensure_table(conn)
+        # Build a dict fpl_id -> player_id (internal)
+        rows = conn.execute(text("SELECT fpl_id, player_id FROM players_id_map")).fetchall()
+    fpl_to_internal = {int(r[0]): int(r[1]) for r in rows if r[0] is not None and r[1] is not None}
+    print(f"Loaded players_id_map: {len(fpl_to_internal)} mappings")
+
+    t0 = time.time()
+    stats = run_coro(load_season(engine, season, from_gw, to_gw, fpl_to_internal))
+    print(f"Done in {time.time() - t0:.0f}s. Inserted/updated rows: {stats['upserted']}, "
+          f"unchanged_gws={stats['unchanged_gws']}, skipped_no_map={stats['skipped_no_map']}, "
+          f"skipped_rows={stats['skipped_rows']}")
+    return stats
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 # /app/scripts/map_fbref_ids.py
 import os, time, re
-import requests
-from bs4 import BeautifulSoup
 from sqlalchemy import create_engine, text
 
+from app.services.http_cache import http_cache
+from scripts.fbref_extract import TableExtractor
+from scripts.player_matcher import PlayerIndex
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; fpl-ai-mapper/1.0; +https://github.com/dudeness37/fplassistant)"
 }
@@ -20,46 +22,35 @@ BATCH = int(os.environ.get("BATCH", "300"))
 OFFSET = int(os.environ.get("OFFSET", "0"))
 SLEEP = float(os.environ.get("SLEEP", "0.8"))
 
-def norm(s: str) -> str:
-    return re.sub(r'\s+', ' ', (s or "").strip().lower())
+TABLES = ["stats_standard", "stats_standard_dom_lg"]
 
-def fetch_comp_players(comp_code: str, season: str):
+def fetch_comp_page(comp_code: str, season: str):
     # Example: https://fbref.com/en/comps/9/2024-2025/stats/players/2024-2025-Premier-League-Stats
     url = f"https://fbref.com/en/comps/{comp_code}/{season}/stats/players/{season}-Stats"
-    r = requests.get(url, headers=HEADERS, timeout=30)
+    r = http_cache.get(url, headers=HEADERS, timeout=30)
     if r.status_code != 200:
-        return []
-    soup = BeautifulSoup(r.text, "html.parser")
-    table = soup.find("table", id="stats_standard")
-    if not table:
-        # some comps may name it differently, try 'stats_standard_dom_lg'
-        table = soup.find("table", id="stats_standard_dom_lg")
-        if not table:
-            return []
+        return None
+    return r
 
+def comp_players(tables: dict):
+    # some comps may name it differently, try 'stats_standard_dom_lg'
+    rows = tables.get("stats_standard") or tables.get("stats_standard_dom_lg") or []
     index = []
-    for tr in table.select("tbody tr"):
-        a = tr.find("a")
-        if not a: 
-            continue
-        href = a.get("href","")
+    for tr in rows:
         # /en/players/{fbref_id}/player-name
-        m = re.match(r"^/en/players/([a-zA-Z0-9]+)/", href)
+        m = re.match(r"^/en/players/([a-zA-Z0-9]+)/", tr.get("player_href", ""))
         if not m:
             continue
-        fb_id = m.group(1)
-        name = a.text.strip()
-        team_td = tr.find("td", {"data-stat":"team"})
-        team = team_td.text.strip() if team_td else None
         # Some tables show duplicates per team; de-dupe later
-        index.append({"fbref_id": fb_id, "name": name, "team": team})
+        index.append({"fbref_id": m.group(1), "name": tr.get("player", ""), "team": tr.get("team") or None,
+                      "position": tr.get("position") or ""})
     return index
 
 def load_unmapped_players(conn):
     # load FPL players without FBREF mapping
     prov_id = conn.execute(text("SELECT id FROM external_providers WHERE code='FBREF'")).scalar_one()
     rows = conn.execute(text("""
-        SELECT p.id AS player_id, p.name, t.short_name AS team
+        SELECT p.id AS player_id, p.name, p.position, t.short_name AS team
         FROM players p
         LEFT JOIN teams t ON t.id = p.team_id
         LEFT JOIN player_external_ids pei
@@ -77,36 +68,38 @@ def main():
         print(f"FBref mapping: {len(targets)} unmapped players (batch={BATCH}, offset={OFFSET})")
 
         # Build a global FBref index across comps/seasons (dedup by fbref_id, keep name/team seen last)
+        # Pages are parsed in the extractor's process pool while the next one downloads
         fb_index = {}
-        for comp in FBREF_COMPS:
-            for season in SEASONS:
-                time.sleep(SLEEP)
+        futures = []
+        with TableExtractor(TABLES) as ex:
+            for comp in FBREF_COMPS:
+                for season in SEASONS:
+                    time.sleep(SLEEP)
+                    try:
+                        resp = fetch_comp_page(comp.strip(), season.strip())
+                    except Exception:
+                        continue
+                    if resp is not None:
+                        futures.append(ex.submit(resp.content, resp.sha256))
+            for fut in futures:  # in fetch order, so "last seen" matches the old behaviour
                 try:
-                    arr = fetch_comp_players(comp.strip(), season.strip())
+                    arr = comp_players(fut.result())
                 except Exception:
                     continue
                 for r in arr:
                     fb_index[r["fbref_id"]] = r
 
-        # Simple name/team matching
-        by_name = {}
-        for r in fb_index.values():
-            key = (norm(r["name"]), norm(r["team"]))
-            by_name.setdefault(key, []).append(r)
+        # Shared matcher: exact name (same team preferred), then token similarity blocked by team/position
+        idx = PlayerIndex(fb_index.values(), name="name", team="team", position="position")
 
         upserts = 0
         for i, p in enumerate(targets, 1):
-            key1 = (norm(p["name"]), norm(p["team"]))
-            cands = by_name.get(key1, [])
-            # fallback: match by name only
-            if not cands:
-                key2 = (norm(p["name"]), "")
-                cands = by_name.get(key2, [])
-            if not cands:
+            m = idx.match(p["name"], team=p["team"], position=p["position"])
+            if not m:
                 print(f"[{i}/{len(targets)}] no FBref match: {p['name']} ({p['team'] or '-'})")
                 continue
 
-            cand = cands[0]
+            cand = m.entry
             # upsert
             conn.execute(text("""
               INSERT INTO player_external_ids(player_id, provider_id, external_id, matched_name, matched_team, confidence)
@@ -119,7 +112,7 @@ def main():
                     updated_at   = NOW()
             """), {
                 "pid": p["player_id"], "prov": prov_id, "ext": cand["fbref_id"],
-                "mname": cand["name"], "mteam": cand["team"], "conf": 0.6  # mapping confidence heuristic
+                "mname": cand["name"], "mteam": cand["team"], "conf": m.confidence
             })
             upserts += 1
             if i % 25 == 0:
@@ -3,7 +3,6 @@ import os
 import re
 import json
 import time
-import unicodedata
 from typing import Dict, List, Tuple, Optional
 
 import requests
@@ -11,6 +10,9 @@ from bs4 import BeautifulSoup
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import IntegrityError, ProgrammingError
 
+from app.services.http_cache import http_cache
+from scripts.player_matcher import PlayerIndex
+
 # ----------------------------
 # Config via environment
 # ----------------------------
@@ -29,58 +31,6 @@ PROVIDER_NAME     = "understat"
 # ----------------------------
 # Helpers
 # ----------------------------
-def normalize(s: str) -> str:
-    if not s:
-        return ""
-    s = s.strip()
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    s = re.sub(r"[^a-zA-Z0-9\s\-']", " ", s)
-    s = re.sub(r"\s+", " ", s)
-    return s.lower().strip()
-
-def token_set(s: str) -> set:
-    return set(normalize(s).replace("-", " ").split())
-
-def name_similarity(a: str, b: str) -> float:
-    ta, tb = token_set(a), token_set(b)
-    if not ta or not tb:
-        return 0.0
-    inter = len(ta & tb)
-    union = len(ta | tb)
-    return inter / union if union else 0.0
-
-EPL_TEAM_NAMES = {
-    "ARS": {"arsenal"},
-    "MCI": {"manchester city", "man city"},
-    "MUN": {"manchester united", "man united", "man utd"},
-    "NEW": {"newcastle united", "newcastle"},
-    "CHE": {"chelsea"},
-    "LIV": {"liverpool"},
-    "TOT": {"tottenham", "tottenham hotspur", "spurs"},
-    "AVL": {"aston villa"},
-    "BHA": {"brighton", "brighton hove albion", "brighton & hove albion"},
-    "WHU": {"west ham united", "west ham"},
-    "BRE": {"brentford"},
-    "CRY": {"crystal palace"},
-    "FUL": {"fulham"},
-    "EVE": {"everton"},
-    "NFO": {"nottingham forest", "nottm forest", "nottingham"},
-    "WOL": {"wolverhampton wanderers", "wolves"},
-    "LEI": {"leicester city", "leicester"},
-    "IPS": {"ipswich town", "ipswich"},
-    "SOU": {"southampton"},
-    "BOU": {"afc bournemouth", "bournemouth"},
-    # add others if promoted/changed in your DB
-}
-
-def team_name_matches(fpl_short: Optional[str], understat_team: Optional[str]) -> bool:
-    if not fpl_short or not understat_team:
-        return False
-    want = EPL_TEAM_NAMES.get(fpl_short, set())
-    tnorm = normalize(understat_team)
-    return any(tnorm == x or x in tnorm for x in want)
-
 def fetch_understat_league_players(league: str, season: str) -> List[Dict]:
     """
     Returns list of dicts with understat players for given league/season.
@@ -89,7 +39,7 @@ def fetch_understat_league_players(league: str, season: str) -> List[Dict]:
     url = f"https://understat.com/league/{league}/{season}"
     for i in range(RETRY_ATTEMPTS):
         try:
-            r = requests.get(url, timeout=20)
+            r = http_cache.get(url, timeout=20)
             if r.status_code == 404:
                 print(f"Skip {league} {season}: 404 Not Found")
                 return []
@@ -124,19 +74,15 @@ def fetch_understat_league_players(league: str, season: str) -> List[Dict]:
             time.sleep(back)
     return []
 
-def build_understat_index(leagues: List[str], seasons: List[str]) -> Dict[str, Dict]:
+def build_understat_index(leagues: List[str], seasons: List[str]) -> PlayerIndex:
     """
-    Build dict: key = normalized player_name, value = dict of best candidate per name:
-      {
-        '<norm-name>': {
-           'understat_id': str,
-           'player_name': str,
-           'team_title': str
-        }
-      }
-    If multiple entries for a name across seasons/teams, we keep the last seen (good enough for mapping).
+    Index every Understat player seen in the given leagues/seasons for matching
+    (see scripts/player_matcher). Entries are dicts:
+      {'understat_id': str, 'player_name': str, 'team_title': str, 'position': str}
+    If an exact name appears several times, the last one seen wins unless an
+    earlier one plays for the FPL player's team.
     """
-    idx: Dict[str, Dict] = {}
+    entries: List[Dict] = []
     for lg in leagues:
         for yr in seasons:
             players = fetch_understat_league_players(lg, yr)
@@ -148,13 +94,13 @@ def build_understat_index(leagues: List[str], seasons: List[str]) -> Dict[str, D
                 tname = (p.get("team_title") or "").strip()
                 if not pid or not pname:
                     continue
-                key = normalize(pname)
-                idx[key] = {
+                entries.append({
                     "understat_id": pid,
                     "player_name": pname,
-                    "team_title": tname
-                }
-    return idx
+                    "team_title": tname,
+                    "position": (p.get("position") or "").strip(),
+                })
+    return PlayerIndex(entries, name="player_name", team="team_title", position="position")
 
 def table_has_column(conn, table: str, column: str) -> bool:
     q = text("""
@@ -231,7 +177,7 @@ def main():
 
         # Load unmapped players for this provider (paged)
         players = conn.execute(text("""
-            SELECT p.id, p.name, t.short_name AS team_short
+            SELECT p.id, p.name, p.position, t.short_name AS team_short
             FROM players p
             LEFT JOIN teams t ON t.id = p.team_id
             LEFT JOIN player_external_ids pei
@@ -245,6 +191,7 @@ def main():
 
     # Build Understat index once
     us_idx = build_understat_index(leagues, seasons)
+    t0 = time.perf_counter()
 
     mapped = 0
     updated = 0
@@ -256,33 +203,13 @@ def main():
             pname = row["name"] or ""
             pteam = row["team_short"]
 
-            # find a candidate
-            key = normalize(pname)
-            cand = us_idx.get(key)
-
-            chosen_id = None
-            m_team    = None
-            conf      = 0.0
-
-            # Strategy:
-            # 1) exact normalized name hit: boost confidence, check team
-            # 2) if not, scan nearby names by token similarity (>0.7)
-            if cand:
-                chosen_id = cand["understat_id"]
-                m_team    = cand.get("team_title") or ""
-                conf      = 1.0 if team_name_matches(pteam, m_team) else 0.8
-            else:
-                # fallback: nearest by Jaccard token similarity
-                best = (0.0, None)
-                for k, v in us_idx.items():
-                    sim = name_similarity(pname, v["player_name"])
-                    if sim > best[0]:
-                        best = (sim, v)
-                if best[0] >= 0.7 and best[1] is not None:
-                    v = best[1]
-                    chosen_id = v["understat_id"]
-                    m_team    = v.get("team_title") or ""
-                    conf      = 0.6 if not team_name_matches(pteam, m_team) else 0.75
+            # Strategy (scripts/player_matcher):
+            # 1) exact normalized name hit, preferring the same team
+            # 2) if not, best token similarity (>=0.7) blocked by team/position
+            m = us_idx.match(pname, team=pteam, position=row["position"])
+            chosen_id = m.entry["understat_id"] if m else None
+            m_team    = (m.entry.get("team_title") or "") if m else None
+            conf      = m.confidence if m else 0.0
 
             if not chosen_id:
                 print(f"[{i}/{len(players)}] no match: {pname} ({pteam or '-'})")
@@ -345,8 +272,10 @@ def main():
                 print(f"[{i}/{len(players)}] duplicate understat_id {chosen_id} for provider; keeping existing row. ({pname})")
                 skipped += 1
 
-    print(f"Done. mapped={mapped}, updated={updated}, skipped={skipped}")
+    print(f"Done. mapped={mapped}, updated={updated}, skipped={skipped} "
+          f"(index={len(us_idx)}, match+write {time.perf_counter() - t0:.2f}s)")
     print("Tip: run next batch with OFFSET incremented, e.g., OFFSET={}".format(OFFSET + BATCH))
+    return {"inserted": mapped, "updated": updated, "skipped": skipped}
 
 if __name__ == "__main__":
     main()
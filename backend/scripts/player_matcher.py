@@ -0,0 +1,194 @@
+# backend/scripts/player_matcher.py
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+# Shared player entity resolution for the Understat / FBref mappers.
+#
+# Source players are normalised once into token sets and an inverted index
+# (token -> entry ids). A query only scores entries that share a token with it,
+# with numpy, and candidates are blocked by team (and position when known)
+# before falling back to the whole index.
+
+# ----------------------------
+# Normalisation
+# ----------------------------
+def normalize(s: str) -> str:
+    if not s:
+        return ""
+    s = s.strip()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = re.sub(r"[^a-zA-Z0-9\s\-']", " ", s)
+    s = re.sub(r"\s+", " ", s)
+    return s.lower().strip()
+
+def token_set(s: str) -> set:
+    return set(normalize(s).replace("-", " ").split())
+
+def name_similarity(a: str, b: str) -> float:
+    ta, tb = token_set(a), token_set(b)
+    if not ta or not tb:
+        return 0.0
+    inter = len(ta & tb)
+    union = len(ta | tb)
+    return inter / union if union else 0.0
+
+# FPL short name -> normalised club names used by Understat / FBref
+EPL_TEAM_NAMES = {
+    "ARS": {"arsenal"},
+    "MCI": {"manchester city", "man city"},
+    "MUN": {"manchester united", "man united", "man utd", "manchester utd"},
+    "NEW": {"newcastle united", "newcastle", "newcastle utd"},
+    "CHE": {"chelsea"},
+    "LIV": {"liverpool"},
+    "TOT": {"tottenham", "tottenham hotspur", "spurs"},
+    "AVL": {"aston villa"},
+    "BHA": {"brighton", "brighton hove albion", "brighton & hove albion"},
+    "WHU": {"west ham united", "west ham"},
+    "BRE": {"brentford"},
+    "CRY": {"crystal palace"},
+    "FUL": {"fulham"},
+    "EVE": {"everton"},
+    "NFO": {"nottingham forest", "nottm forest", "nottingham", "nott'ham forest"},
+    "WOL": {"wolverhampton wanderers", "wolves"},
+    "LEI": {"leicester city", "leicester"},
+    "IPS": {"ipswich town", "ipswich"},
+    "SOU": {"southampton"},
+    "BOU": {"afc bournemouth", "bournemouth"},
+    # add others if promoted/changed in your DB
+}
+
+def team_name_matches(fpl_short: Optional[str], other_team: Optional[str]) -> bool:
+    if not fpl_short or not other_team:
+        return False
+    want = EPL_TEAM_NAMES.get(fpl_short, set())
+    tnorm = normalize(other_team)
+    return any(tnorm == x or x in tnorm for x in want)
+
+@lru_cache(maxsize=1024)
+def team_code(team: Optional[str]) -> Optional[str]:
+    """FPL short name for a source club name, or None for non-EPL / unknown clubs."""
+    for code in EPL_TEAM_NAMES:
+        if team_name_matches(code, team):
+            return code
+    return None
+
+# Understat: "D M S", FBref: "FW,MF", FPL: "DEF"
+_POSITIONS = {
+    "GK": "GK", "G": "GK",
+    "D": "DEF", "DF": "DEF", "DEF": "DEF",
+    "M": "MID", "MF": "MID", "MID": "MID",
+    "F": "FWD", "FW": "FWD", "FWD": "FWD",
+}
+
+def positions(s: Optional[str]) -> Set[str]:
+    return {_POSITIONS[t] for t in re.split(r"[^A-Z]+", (s or "").upper()) if t in _POSITIONS}
+
+# ----------------------------
+# Index
+# ----------------------------
+@dataclass
+class Match:
+    entry: dict
+    score: float       # token Jaccard; 1.0 for an exact normalised-name hit
+    exact: bool
+    team_match: bool
+
+    @property
+    def confidence(self) -> float:
+        if self.exact:
+            return 1.0 if self.team_match else 0.8
+        return 0.75 if self.team_match else 0.6
+
+
+class PlayerIndex:
+    """
+    Index of source players (dicts) for matching FPL players by name.
+    `name`, `team` and `position` are the keys of those dicts to read.
+    """
+
+    def __init__(self, entries: Iterable[dict], name: str = "name", team: str = "team",
+                 position: Optional[str] = None):
+        self.entries: List[dict] = list(entries)
+        n = len(self.entries)
+        self._by_name: Dict[str, List[int]] = {}
+        postings: Dict[str, List[int]] = {}
+        self._sizes = np.zeros(n, dtype=np.int32)
+        team_ids: Dict[str, List[int]] = {}
+        pos_ids: Dict[str, List[int]] = {}
+
+        for i, e in enumerate(self.entries):
+            pname = e.get(name) or ""
+            self._by_name.setdefault(normalize(pname), []).append(i)
+            toks = token_set(pname)
+            self._sizes[i] = len(toks)
+            for t in toks:
+                postings.setdefault(t, []).append(i)
+            code = team_code(e.get(team))
+            if code:
+                team_ids.setdefault(code, []).append(i)
+            if position:
+                for p in positions(e.get(position)):
+                    pos_ids.setdefault(p, []).append(i)
+
+        self._postings = {t: np.asarray(ids, dtype=np.int64) for t, ids in postings.items()}
+        self._team_mask = {c: self._mask(ids) for c, ids in team_ids.items()}
+        self._pos_mask = {p: self._mask(ids) for p, ids in pos_ids.items()}
+
+    def _mask(self, ids: List[int]) -> np.ndarray:
+        m = np.zeros(len(self.entries), dtype=bool)
+        m[ids] = True
+        return m
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def match(self, name: str, team: Optional[str] = None, position: Optional[str] = None,
+              min_score: float = 0.7) -> Optional[Match]:
+        """
+        Best source entry for an FPL player (team = FPL short name, position =
+        GK/DEF/MID/FWD). Exact normalised-name hits win, preferring the same
+        team; otherwise the highest token Jaccard >= min_score, searched in the
+        team+position block, then the team block, then the whole index.
+        """
+        team_ok = self._team_mask.get(team) if team else None
+
+        hits = self._by_name.get(normalize(name))
+        if hits:
+            i = next((h for h in reversed(hits) if team_ok is not None and team_ok[h]), hits[-1])
+            return Match(self.entries[i], 1.0, True, bool(team_ok is not None and team_ok[i]))
+
+        q = token_set(name)
+        lists = [self._postings[t] for t in q if t in self._postings]
+        if not lists:
+            return None
+        cand, inter = np.unique(np.concatenate(lists), return_counts=True)
+        score = inter / (len(q) + self._sizes[cand] - inter)
+
+        blocks = []
+        if team_ok is not None:
+            pos_ok = None
+            for p in positions(position):
+                m = self._pos_mask.get(p)
+                if m is not None:
+                    pos_ok = m if pos_ok is None else (pos_ok | m)
+            if pos_ok is not None:
+                blocks.append(team_ok & pos_ok)
+            blocks.append(team_ok)
+        blocks.append(None)
+
+        for block in blocks:
+            ok = score >= min_score
+            if block is not None:
+                ok &= block[cand]
+            if ok.any():
+                k = int(np.argmax(np.where(ok, score, -1.0)))
+                i = int(cand[k])
+                return Match(self.entries[i], float(score[k]), False,
+                             bool(team_ok is not None and team_ok[i]))
+        return None
@@ -1,6 +1,6 @@
 export default async function EPTop() {
     const base = process.env.NEXT_PUBLIC_API_BASE || "http://localhost:8000";
-    const res = await fetch(`${base}/api/ep/top?gw=1&limit=20`, { cache: "no-store" });
+    const res = await fetch(`${base}/api/ep/top?gw=1&limit=20`, { next: { revalidate: 60 } });
     const data = await res.json();
   
     return (
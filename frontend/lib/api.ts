@@ -1,7 +1,7 @@
 export const API_BASE = process.env.NEXT_PUBLIC_API_BASE || "http://localhost:8000";
 
 export async function getHealth(): Promise<{ status: string }> {
-  const res = await fetch(`${API_BASE}/api/health`, { cache: "no-store" });
+  const res = await fetch(`${API_BASE}/api/health`, { next: { revalidate: 15 } });
   if (!res.ok) throw new Error("API health failed");
   return res.json();
 }